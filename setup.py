@@ -10,7 +10,9 @@ requirements = [
     'requests~=2.31.0',
     'click~=8.1.7',
     'fiona~=1.10.0',
+    # shapely 2.1 adds the vectorized orient_polygons, 2.0 goes through the per polygon fallback of the encoder
     'shapely~=2.0.1',
+    'numpy>=1.21',
     'protobuf~=5.26.1',
     'ujson',
     'pillow'
@@ -58,6 +60,7 @@ setup(
             'mbtilesdecompress = vtiles.mbtiles.mbtilesdecompress:main',
             'mbtilescompress = vtiles.mbtiles.mbtilescompress:main',
             'mbtilesfixmeta = vtiles.mbtiles.mbtilesfixmeta:main',
+            'mbtilesoptimise = vtiles.mbtiles.mbtilesoptimise:main',
            
             'pbfinfo = vtiles.mbtiles.pbfinfo:main',
             'pbf2geojson = vtiles.mbtiles.pbf2geojson:main',      
@@ -81,6 +84,10 @@ setup(
 
     # scripts=["bin/utils.py"], # utils.py is just a demo,
     install_requires=requirements,    
+    extras_require={
+        'zstd': ['zstandard'],
+        'brotli': ['brotli'],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'Environment :: Console',
@@ -0,0 +1,40 @@
+import gzip
+import sqlite3
+
+import pytest
+
+from vtiles.utils.mapbox_vector_tile import encode
+
+
+def vector_tile(name='water', x=100, y=200, extent=4096, properties=None):
+    """Return an uncompressed tile with one point feature in a `name` layer."""
+    return encode([{
+        'name': name,
+        'features': [{'geometry': f'POINT ({x} {y})', 'properties': properties or {'kind': name}}],
+    }], default_options={'extents': extent})
+
+
+def write_mbtiles(path, tiles, metadata=None, unique_index=True):
+    """Write a flat MBTiles with the (zoom_level, tile_column, tile_row, tile_data) `tiles`, as other tools would."""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+    conn.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+    if unique_index:
+        conn.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+    conn.executemany("INSERT INTO metadata (name, value) VALUES (?, ?)",
+                     (metadata or {'name': 'test', 'format': 'pbf'}).items())
+    conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", tiles)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def pyramid(max_zoom=2, compress=gzip.compress, name='water'):
+    """Return the tiles of every zoom level up to max_zoom, each compressed with `compress`."""
+    return [(z, x, y, compress(vector_tile(name, x % 4096, y % 4096)))
+            for z in range(max_zoom + 1) for x in range(1 << z) for y in range(1 << z)]
+
+
+@pytest.fixture
+def gzip_mbtiles(tmp_path):
+    return write_mbtiles(tmp_path / 'gzip.mbtiles', pyramid())
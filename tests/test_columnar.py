@@ -0,0 +1,50 @@
+import pytest
+import shapely
+
+from vtiles.utils.mapbox_vector_tile import decode
+from vtiles.utils.mapbox_vector_tile.wire import MessageWriter
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def single_feature_tile(geom_type, geometry):
+    feature = MessageWriter()
+    feature.write_varint(3, geom_type)
+    if geometry is not None:
+        feature.write_packed(4, geometry)
+    layer = MessageWriter()
+    layer.write_bytes(1, 'layer')
+    layer.write_bytes(2, feature.getvalue())
+    layer.write_varint(5, 4096)
+    layer.write_varint(15, 2)
+    tile = MessageWriter()
+    tile.write_bytes(3, layer.getvalue())
+    return tile.getvalue()
+
+
+FLAT_RING = [9, zigzag(0), zigzag(0), (2 << 3) | 2, zigzag(10), 0, zigzag(10), 0, 15]
+
+
+@pytest.mark.parametrize('geom_type, geometry, expected', [
+    (3, FLAT_RING, 'MultiPolygon'),
+    (3, None, 'MultiPolygon'),
+    (2, [9, 2, 2], 'LineString'),
+    (1, None, 'MultiPoint'),
+])
+def test_shapely_decoding_gives_empty_geometries(geom_type, geometry, expected):
+    tile = single_feature_tile(geom_type, geometry)
+    (feature,) = decode(tile, geometry='shapely')['layer']['features']
+    assert feature['geometry'].geom_type == expected
+    assert feature['geometry'].is_empty
+    if geometry is not None and geom_type == 3:
+        assert decode(tile)['layer']['features'][0]['geometry'] == {'type': 'MultiPolygon', 'coordinates': []}
+
+
+def test_shapely_decoding_matches_the_dictionary_decoding():
+    square = [9, zigzag(0), zigzag(0), (3 << 3) | 2, zigzag(10), 0, 0, zigzag(10), zigzag(-10), 0, 15]
+    tile = single_feature_tile(3, square)
+    (feature,) = decode(tile, geometry='shapely')['layer']['features']
+    expected = shapely.geometry.shape(decode(tile)['layer']['features'][0]['geometry'])
+    assert shapely.equals(feature['geometry'], expected)
@@ -0,0 +1,104 @@
+import gzip
+
+import pytest
+
+from conftest import pyramid, write_mbtiles
+from vtiles.mbtiles.mbtilescompress import compress_mbtiles, transform_mbtiles
+from vtiles.mbtiles.mbtilesdecompress import decompress_mbtiles
+from vtiles.mbtiles.store import MBTilesReader
+from vtiles.utils.compression import decompress, detect_compression
+
+
+def duplicate_keys_mbtiles(tmp_path):
+    tiles = pyramid()
+    return write_mbtiles(tmp_path / 'dup.mbtiles', tiles + tiles[:3], unique_index=False), tiles
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'zstd'])
+def test_compress_input_with_duplicate_keys(tmp_path, codec):
+    if codec == 'zstd':
+        pytest.importorskip('zstandard')
+    input_mbtiles, tiles = duplicate_keys_mbtiles(tmp_path)
+    output_mbtiles = tmp_path / 'out.mbtiles'
+    compress_mbtiles(input_mbtiles, output_mbtiles, codec=codec, workers=1)
+
+    with MBTilesReader(output_mbtiles) as reader:
+        assert reader.count() == len(tiles)
+        assert reader.has_unique_index()
+        assert reader.compression() == codec
+        assert all(detect_compression(tile_data) == codec for *_, tile_data in reader.tiles())
+
+
+def test_decompress_input_with_duplicate_keys(tmp_path):
+    input_mbtiles, tiles = duplicate_keys_mbtiles(tmp_path)
+    output_mbtiles = tmp_path / 'out.mbtiles'
+    decompress_mbtiles(input_mbtiles, output_mbtiles, workers=1)
+
+    with MBTilesReader(output_mbtiles) as reader:
+        assert list(reader.tiles()) == [(z, x, y, gzip.decompress(tile_data)) for z, x, y, tile_data in tiles]
+
+
+def test_zstd_dictionary_round_trip(tmp_path, gzip_mbtiles):
+    pytest.importorskip('zstandard')
+    output_mbtiles = tmp_path / 'zstd.mbtiles'
+    compress_mbtiles(gzip_mbtiles, output_mbtiles, codec='zstd', workers=1, train_dictionary=True,
+                     dictionary_size=1024, samples=50)
+
+    with MBTilesReader(gzip_mbtiles) as expected, MBTilesReader(output_mbtiles) as reader:
+        dictionary = reader.zstd_dictionary()
+        assert dictionary
+        assert [(z, x, y, decompress(tile_data, 'zstd', dictionary)) for z, x, y, tile_data in reader.tiles()] == \
+            [(z, x, y, gzip.decompress(tile_data)) for z, x, y, tile_data in expected.tiles()]
+
+
+def test_compress_to_deduplicated_schema(tmp_path, gzip_mbtiles):
+    output_mbtiles = tmp_path / 'dedup.mbtiles'
+    compress_mbtiles(gzip_mbtiles, output_mbtiles, codec='gzip', level=6, workers=1, schema='dedup')
+
+    with MBTilesReader(output_mbtiles) as reader:
+        assert reader.deduplicated
+        assert reader.count() == 21
+
+
+def _fail(tile_data):
+    raise RuntimeError('failed')
+
+
+def test_failed_transform_leaves_no_output(tmp_path, gzip_mbtiles):
+    output_mbtiles = tmp_path / 'out.mbtiles'
+    with pytest.raises(RuntimeError):
+        transform_mbtiles(gzip_mbtiles, output_mbtiles, _fail, 'Failing', workers=1)
+    assert not output_mbtiles.exists()
+
+
+calls = []
+
+
+def _count(tile_data):
+    calls.append(tile_data)
+    return tile_data[::-1]
+
+
+def test_transform_runs_once_per_distinct_tile(tmp_path):
+    tiles = [(2, x, y, b'ocean' if (x + y) % 2 else b'land') for x in range(4) for y in range(4)]
+    input_mbtiles = write_mbtiles(tmp_path / 'in.mbtiles', tiles + [(3, 0, 0, None)])
+    output_mbtiles = tmp_path / 'out.mbtiles'
+    calls.clear()
+    transform_mbtiles(input_mbtiles, output_mbtiles, _count, 'Counting', workers=1, chunk_size=1)
+
+    assert sorted(calls) == [b'land', b'ocean']
+    with MBTilesReader(output_mbtiles) as reader:
+        assert list(reader.tiles()) == [(z, x, y, tile_data[::-1]) for z, x, y, tile_data in tiles] + [(3, 0, 0, None)]
+
+
+@pytest.mark.parametrize('transform', ['compress', 'decompress'])
+def test_undecodable_tile_leaves_no_output(tmp_path, transform):
+    input_mbtiles = write_mbtiles(tmp_path / 'in.mbtiles', pyramid()[:-1] + [(2, 3, 3, b'\x1f\x8bnot gzip')])
+    output_mbtiles = tmp_path / 'out.mbtiles'
+    # gzip.BadGzipFile
+    with pytest.raises(OSError):
+        if transform == 'compress':
+            compress_mbtiles(input_mbtiles, output_mbtiles, codec='gzip', level=6, workers=1)
+        else:
+            decompress_mbtiles(input_mbtiles, output_mbtiles, workers=1)
+    assert not output_mbtiles.exists()
@@ -0,0 +1,47 @@
+import shapely
+
+from vtiles.utils.mapbox_vector_tile import decode, encode
+
+LAYERS = [{'name': 'parcels', 'features': [
+    {'geometry': 'POLYGON ((0 0, 0 10, 10 10, 10 0, 0 0))', 'properties': {'id': 1}},
+    {'geometry': 'MULTIPOLYGON (((20 20, 30 20, 30 30, 20 20)), ((40 40, 40 50, 50 50, 40 40)))', 'properties': {}},
+]}]
+
+
+def test_orientation_without_orient_polygons(monkeypatch):
+    # shapely 2.0, the pinned version, has no orient_polygons: the encoder orients each polygon instead
+    expected = encode(LAYERS)
+    monkeypatch.delattr(shapely, 'orient_polygons', raising=False)
+    assert encode(LAYERS) == expected
+    assert [feature['geometry']['type'] for feature in decode(encode(LAYERS))['parcels']['features']] == \
+        ['Polygon', 'MultiPolygon']
+
+
+def test_decode_large_ring_with_float_transformer():
+    # rings of 32 points or more take the NumPy area path
+    polygon = shapely.Point(2000, 2000).buffer(1000, quad_segs=10)
+    assert len(polygon.exterior.coords) >= 40
+    tile = encode([{'name': 'lakes', 'features': [{'geometry': polygon.wkt, 'properties': {}}]}])
+    options = {'transformer': lambda x, y: (x / 4096.0, y / 4096.0)}
+    (feature,) = decode(tile, default_options=options)['lakes']['features']
+    assert feature['geometry']['type'] == 'Polygon'
+    assert len(feature['geometry']['coordinates']) == 1
+    assert len(feature['geometry']['coordinates'][0]) >= 32
+
+
+def test_encode_fills_the_validation_stats():
+    bowtie = {'geometry': 'POLYGON ((0 0, 10 10, 10 0, 0 10, 0 0))', 'properties': {}}
+    layers = [{'name': 'parcels', 'features': (LAYERS[0]['features'] + [bowtie]) * 3}]
+    for options, expected in (({}, {'validated': 9, 'invalid': 3}),
+                              ({'validate': 'sample', 'validate_sample_rate': 2}, {'validated': 5, 'invalid': 2}),
+                              ({'validate': 'none'}, {'validated': 0, 'invalid': 0})):
+        stats = {}
+        encode(layers, default_options=options, stats=stats)
+        assert stats == expected
+
+
+def test_trusted_skips_the_validation():
+    stats = {}
+    tile = encode(LAYERS, per_layer_options={'parcels': {'trusted': True, 'validate': 'full'}}, stats=stats)
+    assert tile == encode(LAYERS, default_options={'validate': 'none'})
+    assert stats == {'validated': 0, 'invalid': 0}
@@ -0,0 +1,19 @@
+import json
+
+import pytest
+
+from conftest import pyramid, write_mbtiles
+from vtiles.mbtiles.mbtiles2geojson import mbtiles_to_geojson
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_zstd_zoom_level_to_geojson(tmp_path, workers):
+    zstandard = pytest.importorskip('zstandard')
+    input_mbtiles = write_mbtiles(tmp_path / 'in.mbtiles', pyramid(compress=zstandard.compress),
+                                  {'name': 'test', 'format': 'pbf', 'compression': 'zstd'})
+    output_geojson = tmp_path / 'out.geojson'
+    mbtiles_to_geojson(input_mbtiles, str(output_geojson), 'ZSTD', 2, False, None, workers=workers)
+
+    features = json.loads(output_geojson.read_text())['water']['features']
+    assert len(features) == 16
+    assert {feature['properties']['zoom_level'] for feature in features} == {2}
@@ -0,0 +1,27 @@
+import gzip
+import os
+
+from conftest import vector_tile, write_mbtiles
+from vtiles.mbtiles.mbtiles2pmtiles import mbtiles_to_pmtiles
+from vtiles.mbtiles.mbtilesfixmeta import fix_vectormetadata
+from vtiles.mbtiles.mbtilesoptimise import optimise_mbtiles, optimise_pmtiles
+
+
+def test_optimise_read_only_pmtiles(tmp_path, gzip_mbtiles):
+    fix_vectormetadata(gzip_mbtiles, 'GZIP', '')
+    input_pmtiles = tmp_path / 'in.pmtiles'
+    mbtiles_to_pmtiles(gzip_mbtiles, str(input_pmtiles))
+    input_pmtiles.chmod(0o444)
+    content = input_pmtiles.read_bytes()
+
+    output_pmtiles = tmp_path / 'out.pmtiles'
+    optimise_pmtiles(str(input_pmtiles), str(output_pmtiles), workers=1)
+    assert os.path.getsize(output_pmtiles) > 0
+    assert input_pmtiles.read_bytes() == content
+
+
+def test_optimise_compresses_identical_tiles_once(tmp_path):
+    tile_data = gzip.compress(vector_tile('ponds', 1, 2))
+    input_mbtiles = write_mbtiles(tmp_path / 'in.mbtiles', [(2, x, 0, tile_data) for x in range(4)])
+    report = optimise_mbtiles(input_mbtiles, str(tmp_path / 'out.mbtiles'), workers=1)
+    assert (report.cache_hits, report.cache_lookups) == (3, 4)
@@ -0,0 +1,34 @@
+import os
+import sqlite3
+
+from vtiles.mbtiles.profile import TilesetProfile, profile_path
+from vtiles.mbtiles.store import MBTilesReader
+
+
+def test_load_caches_the_profile_without_touching_the_file(gzip_mbtiles):
+    with open(gzip_mbtiles, 'rb') as f:
+        content = f.read()
+    stat = os.stat(gzip_mbtiles)
+
+    profile = TilesetProfile.load(gzip_mbtiles)
+    assert profile.is_vector and profile.compression_type == 'GZIP'
+    assert profile.count_by_zoom() == [(0, 1), (1, 4), (2, 16)]
+    assert os.path.exists(profile_path(gzip_mbtiles))
+
+    with open(gzip_mbtiles, 'rb') as f:
+        assert f.read() == content
+    assert os.stat(gzip_mbtiles).st_mtime_ns == stat.st_mtime_ns
+    with MBTilesReader(gzip_mbtiles) as reader:
+        assert TilesetProfile.cached(reader).to_dict() == profile.to_dict()
+
+
+def test_cached_profile_is_stale_once_the_file_changed(gzip_mbtiles):
+    TilesetProfile.load(gzip_mbtiles)
+    conn = sqlite3.connect(gzip_mbtiles)
+    conn.execute("INSERT INTO tiles VALUES (3, 0, 0, x'00')")
+    conn.commit()
+    conn.close()
+
+    assert TilesetProfile.cached(gzip_mbtiles) is None
+    assert TilesetProfile.load(gzip_mbtiles).max_zoom == 3
+    assert TilesetProfile.cached(gzip_mbtiles).max_zoom == 3
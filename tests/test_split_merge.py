@@ -0,0 +1,70 @@
+import gzip
+
+import pytest
+
+from conftest import pyramid, vector_tile, write_mbtiles
+from vtiles.mbtiles.mbtilesmerge import merge_mbtiles
+from vtiles.mbtiles.mbtilessplit import process_mbtiles
+from vtiles.mbtiles.store import MBTilesReader
+from vtiles.utils.compression import compress, decompress, detect_compression
+from vtiles.utils.mapbox_vector_tile import decode
+
+
+def layer_names(tile_data, codec=None):
+    return sorted(decode(decompress(tile_data, codec)))
+
+
+def two_layer_mbtiles(path, codec):
+    """Write a pyramid of tiles with a water and a roads layer compressed with codec."""
+    tiles = [(z, x, y, compress(vector_tile('water', x, y) + vector_tile('roads', y, x), codec))
+             for z in range(3) for x in range(1 << z) for y in range(1 << z)]
+    return write_mbtiles(path, tiles, {'name': 'test', 'format': 'pbf', 'compression': codec})
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'zstd', 'brotli'])
+def test_split_keeps_the_input_codec(tmp_path, codec):
+    if codec != 'gzip':
+        pytest.importorskip({'zstd': 'zstandard', 'brotli': 'brotli'}[codec])
+    input_mbtiles = two_layer_mbtiles(tmp_path / 'in.mbtiles', codec)
+    kept, remained = tmp_path / 'water.mbtiles', tmp_path / 'roads.mbtiles'
+    assert process_mbtiles(input_mbtiles, str(kept), str(remained), ['water'])
+
+    for path, names in ((kept, ['water']), (remained, ['roads'])):
+        with MBTilesReader(path) as reader:
+            assert reader.count() == 21
+            assert reader.compression() == codec
+            for *_, tile_data in reader.tiles():
+                if codec != 'brotli':
+                    assert detect_compression(tile_data) == codec
+                assert layer_names(tile_data, codec) == names
+
+
+def test_split_of_an_undecodable_tile_leaves_no_output(tmp_path):
+    input_mbtiles = write_mbtiles(tmp_path / 'in.mbtiles', pyramid() + [(3, 0, 0, b'\x1f\x8bnot gzip')])
+    kept, remained = tmp_path / 'water.mbtiles', tmp_path / 'roads.mbtiles'
+    assert not process_mbtiles(input_mbtiles, str(kept), str(remained), ['water'])
+    assert not kept.exists() and not remained.exists()
+
+
+def test_merge_zstd_files_keeps_every_tile(tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    water = write_mbtiles(tmp_path / 'water.mbtiles', pyramid(compress=zstandard.compress),
+                          {'name': 'water', 'format': 'pbf', 'compression': 'zstd'})
+    roads = write_mbtiles(tmp_path / 'roads.mbtiles', pyramid(max_zoom=3, compress=gzip.compress, name='roads'),
+                          {'name': 'roads', 'format': 'pbf', 'compression': 'gzip'})
+    output_mbtiles = tmp_path / 'merged.mbtiles'
+    assert merge_mbtiles([water, roads], str(output_mbtiles))
+
+    with MBTilesReader(output_mbtiles) as reader:
+        assert reader.count() == 85
+        assert reader.compression() == 'zstd'
+        for z, *_, tile_data in reader.tiles():
+            assert detect_compression(tile_data) == 'zstd'
+            assert layer_names(tile_data) == (['roads', 'water'] if z <= 2 else ['roads'])
+
+
+def test_merge_of_an_undecodable_tile_leaves_no_output(tmp_path, gzip_mbtiles):
+    broken = write_mbtiles(tmp_path / 'broken.mbtiles', pyramid()[:-1] + [(2, 3, 3, b'\x1f\x8bnot gzip')])
+    output_mbtiles = tmp_path / 'merged.mbtiles'
+    assert not merge_mbtiles([gzip_mbtiles, broken], str(output_mbtiles))
+    assert not output_mbtiles.exists()
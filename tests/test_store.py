@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from conftest import write_mbtiles
+from vtiles.mbtiles.store import MBTilesReader, MBTilesWriter
+
+
+@pytest.mark.parametrize('schema', ['flat', 'dedup'])
+def test_writer_keeps_the_last_of_duplicate_keys(tmp_path, schema):
+    path = tmp_path / 'out.mbtiles'
+    with MBTilesWriter(path, schema, batch_size=2) as writer:
+        writer.write_tile(0, 0, 0, b'first')
+        writer.write_tile(1, 0, 0, b'other')
+        writer.write_tile(0, 0, 0, b'last')
+
+    with MBTilesReader(path) as reader:
+        assert list(reader.tiles()) == [(0, 0, 0, b'last'), (1, 0, 0, b'other')]
+        assert reader.has_unique_index()
+    if schema == 'dedup':
+        assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM images").fetchone()[0] == 2
+
+
+def test_writer_deletes_the_file_of_a_failed_job(tmp_path):
+    path = tmp_path / 'out.mbtiles'
+    with pytest.raises(RuntimeError):
+        with MBTilesWriter(path) as writer:
+            writer.write_tile(0, 0, 0, b'tile')
+            raise RuntimeError('failed')
+    assert not path.exists()
+
+
+def test_writer_refuses_an_existing_file(tmp_path):
+    path = tmp_path / 'out.mbtiles'
+    path.write_bytes(b'')
+    with pytest.raises(FileExistsError):
+        MBTilesWriter(path)
+
+
+def test_tile_batches_are_bounded(tmp_path):
+    tiles = [(2, x, y, bytes([x, y])) for x in range(4) for y in range(4)]
+    path = write_mbtiles(tmp_path / 'in.mbtiles', tiles)
+    with MBTilesReader(path) as reader:
+        batches = list(reader.tile_batches(5))
+        assert [len(batch) for batch in batches] == [5, 5, 5, 1]
+        assert [tile for batch in batches for tile in batch] == sorted(tiles)
+        assert reader.count(start=(2, 1, 0), stop=(2, 3, 0)) == 8
+
+
+def test_reader_without_unique_index_finds_duplicates(tmp_path):
+    path = write_mbtiles(tmp_path / 'in.mbtiles', [(0, 0, 0, b'a'), (0, 0, 0, b'b')], unique_index=False)
+    with MBTilesReader(path) as reader:
+        assert not reader.has_unique_index()
+        assert reader.duplicates() == [(0, 0, 0, 2)]
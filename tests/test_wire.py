@@ -0,0 +1,103 @@
+import pytest
+
+from conftest import vector_tile
+from vtiles.utils.mapbox_vector_tile import decode, encode, summarize
+from vtiles.utils.mapbox_vector_tile.wire import (FEATURE_GEOMETRY, FEATURE_TAGS, FEATURE_TYPE, LAYER_EXTENT,
+                                                  LAYER_FEATURES, LAYER_KEYS, LAYER_VALUES, LAYER_VERSION, TILE_LAYERS,
+                                                  MessageWriter, merge_tiles)
+
+
+def features(tile, name='water'):
+    return [(feature['geometry'], feature['properties']) for feature in decode(tile)[name]['features']]
+
+
+@pytest.mark.parametrize('order', [1, -1])
+def test_merge_rescales_the_layer_of_smaller_extent(order):
+    small = vector_tile(x=256, y=256, extent=512, properties={'kind': 'lake'})
+    large = vector_tile(x=100, y=200, extent=4096, properties={'kind': 'sea'})
+    merged = merge_tiles(*[small, large][::order])
+
+    assert decode(merged)['water']['extent'] == 4096
+    assert sorted(features(merged), key=str) == sorted([
+        ({'type': 'Point', 'coordinates': [2048, 2048]}, {'kind': 'lake'}),
+        ({'type': 'Point', 'coordinates': [100, 200]}, {'kind': 'sea'}),
+    ], key=str)
+
+
+def test_merge_rescales_lines_without_drift():
+    line = encode([{'name': 'roads', 'features': [
+        {'geometry': 'LINESTRING (1 1, 3 5, 7 2, 255 511)', 'properties': {}}]}], default_options={'extents': 512})
+    merged = merge_tiles(vector_tile('roads'), line)
+    coordinates = [feature['geometry']['coordinates'] for feature in decode(merged)['roads']['features']]
+    assert [[8, 8], [24, 40], [56, 16], [2040, 4088]] in coordinates
+
+
+def test_merge_same_extent_keeps_geometries_and_remaps_tags():
+    merged = merge_tiles(vector_tile(x=1, y=2, properties={'kind': 'a'}),
+                         vector_tile(x=3, y=4, properties={'kind': 'b', 'depth': 3}))
+    assert features(merged) == [
+        ({'type': 'Point', 'coordinates': [1, 2]}, {'kind': 'a'}),
+        ({'type': 'Point', 'coordinates': [3, 4]}, {'kind': 'b', 'depth': 3}),
+    ]
+
+
+def raw_layer(name, tags, packed=True):
+    """Return a serialized layer with one point feature at (5, 5) whose tags are written packed or not."""
+    feature = MessageWriter()
+    if packed:
+        feature.write_packed(FEATURE_TAGS, tags)
+    else:
+        for tag in tags:
+            feature.write_varint(FEATURE_TAGS, tag)
+    feature.write_varint(FEATURE_TYPE, 1)
+    feature.write_packed(FEATURE_GEOMETRY, [9, 10, 10])
+    layer = MessageWriter()
+    if name is not None:
+        layer.write_bytes(1, name)
+    layer.write_bytes(LAYER_FEATURES, feature.getvalue())
+    for key in ('kind', 'depth'):
+        layer.write_bytes(LAYER_KEYS, key)
+    string_value, int_value = MessageWriter(), MessageWriter()
+    string_value.write_bytes(1, 'river')
+    int_value.write_varint(4, 7)
+    for value in (string_value, int_value):
+        layer.write_bytes(LAYER_VALUES, value.getvalue())
+    layer.write_varint(LAYER_EXTENT, 4096)
+    layer.write_varint(LAYER_VERSION, 2)
+    tile = MessageWriter()
+    tile.write_bytes(TILE_LAYERS, layer.getvalue())
+    return tile.getvalue()
+
+
+def test_merge_remaps_non_packed_tags():
+    merged = merge_tiles(vector_tile(properties={'depth': 1}), raw_layer('water', [1, 1, 0, 0], packed=False))
+    assert [properties for _, properties in features(merged)] == [{'depth': 1}, {'depth': 7, 'kind': 'river'}]
+
+
+def test_merge_nameless_layers():
+    merged = merge_tiles(raw_layer(None, [0, 0]), raw_layer(None, [1, 1]))
+    (layer,) = decode(merged).values()
+    assert [feature['properties'] for feature in layer['features']] == [{'kind': 'river'}, {'depth': 7}]
+
+
+@pytest.mark.parametrize('packed', [True, False])
+def test_summarize_reads_packed_and_non_packed_tags(packed):
+    summary = summarize(raw_layer('water', [1, 1, 0, 0], packed=packed))
+    assert summary == {'water': {
+        'version': 2, 'extent': 4096, 'features': 1, 'geometry_types': {'Point': 1},
+        'keys': ['kind', 'depth'], 'fields': {'depth': 'int', 'kind': 'str'},
+    }}
+
+
+def test_summarize_matches_decode():
+    tile = encode([{'name': 'mixed', 'features': [
+        {'geometry': 'POINT (1 2)', 'properties': {'name': 'a', 'rank': 1}},
+        {'geometry': 'LINESTRING (0 0, 10 10)', 'properties': {'rank': 2, 'open': True, 'height': 1.5}},
+        {'geometry': 'POLYGON ((0 0, 10 0, 10 10, 0 0))', 'properties': {}},
+    ]}])
+    (layer,) = decode(tile).values()
+    summary = summarize(tile)['mixed']
+    assert summary['features'] == len(layer['features'])
+    assert summary['geometry_types'] == {'Point': 1, 'LineString': 1, 'Polygon': 1}
+    assert summary['fields'] == {key: type(value).__name__ for feature in layer['features']
+                                 for key, value in feature['properties'].items()}
@@ -0,0 +1 @@
+"""Micro-benchmarks of the vector tile codec: run `python -m vtiles.benchmarks.codec --help`."""
@@ -0,0 +1,82 @@
+import argparse
+import logging
+import os
+import sys
+
+from vtiles.benchmarks.codec.corpus import load_corpus, synthetic_corpora
+from vtiles.benchmarks.codec.runner import OPERATIONS, compare, load_baseline, run_benchmarks, save_baseline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def print_results(results):
+    print(f"{'Corpus':<16} {'Operation':<20} {'Tiles/s':>12} {'MB/s':>10} {'Peak KiB':>12}")
+    print("=" * 74)
+    for corpus_name, operations in results.items():
+        for operation, measures in operations.items():
+            print(f"{corpus_name:<16} {operation:<20} {measures['tiles_per_s']:>12.2f} "
+                  f"{measures['mb_per_s']:>10.2f} {measures['peak_kib']:>12.1f}")
+
+
+def print_changes(changes, regressions):
+    print(f"\n{'Corpus':<16} {'Operation':<20} {'Metric':<12} {'Baseline':>12} {'Current':>12} {'Change':>8}")
+    print("=" * 84)
+    for row in changes:
+        corpus_name, operation, metric, reference_value, value, change = row
+        flag = '  <-- regression' if row in regressions else ''
+        print(f"{corpus_name:<16} {operation:<20} {metric:<12} {reference_value:>12.2f} {value:>12.2f} "
+              f"{change:>+8.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vector tile codec on synthetic and real-world tiles.")
+    parser.add_argument('-c', '--corpus', action='append', default=[],
+                        help='MBTiles file or folder of {z}/{x}/{y}.pbf tiles to benchmark, can be repeated.')
+    parser.add_argument('-n', '--limit', type=int, default=200, help='Maximum number of tiles loaded per corpus.')
+    parser.add_argument('--no-synthetic', action='store_true', help='Skip the synthetic tiles.')
+    parser.add_argument('--scale', type=int, default=1, help='Size multiplier of the synthetic tiles.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic tiles.')
+    parser.add_argument('-op', '--operations', nargs='+', choices=list(OPERATIONS), default=list(OPERATIONS),
+                        help='Operations to benchmark, all by default.')
+    parser.add_argument('-t', '--min-time', type=float, default=1.0,
+                        help='Minimum time in seconds spent on each operation and corpus.')
+    parser.add_argument('-s', '--save', help='Save the results as a JSON baseline.')
+    parser.add_argument('-b', '--baseline', help='JSON baseline to compare the results with.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative change reported as a regression when comparing with a baseline.')
+
+    args = parser.parse_args()
+
+    corpora = {} if args.no_synthetic else synthetic_corpora(seed=args.seed, scale=args.scale)
+    for path in args.corpus:
+        if not os.path.exists(path):
+            logger.error(f'Corpus {path} does not exist! Please recheck and input a correct one.')
+            sys.exit(1)
+        tiles = load_corpus(path, limit=args.limit)
+        if not tiles:
+            logger.error(f'No tiles found in corpus {path}.')
+            sys.exit(1)
+        corpora[os.path.basename(os.path.normpath(path))] = tiles
+    if not corpora:
+        logger.error('Nothing to benchmark: add a corpus with -c or remove --no-synthetic.')
+        sys.exit(1)
+
+    results = run_benchmarks(corpora, args.operations, min_time=args.min_time,
+                             progress=lambda corpus, operation: logger.info(f'Benchmarking {operation} on {corpus}'))
+    print_results(results)
+
+    if args.save:
+        save_baseline(results, args.save)
+        logger.info(f'Baseline saved to {args.save}')
+
+    if args.baseline:
+        changes, regressions = compare(results, load_baseline(args.baseline), threshold=args.threshold)
+        print_changes(changes, regressions)
+        if regressions:
+            logger.error(f'{len(regressions)} regression(s) above {args.threshold:.0%} compared with {args.baseline}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import math
+import os
+import random
+import sqlite3
+
+from vtiles.utils.mapbox_vector_tile import encode
+from vtiles.utils.compression import decompress
+
+# Synthetic tiles are generated at zoom 14, in the middle of the tile grid
+SYNTHETIC_TILE = (14, 8192, 8192)
+
+
+def _walk(rng, n, step=12):
+    x, y = rng.uniform(200, 3900), rng.uniform(200, 3900)
+    points = []
+    for _ in range(n):
+        x = min(max(x + rng.uniform(-step, step), 0), 4096)
+        y = min(max(y + rng.uniform(-step, step), 0), 4096)
+        points.append((round(x, 2), round(y, 2)))
+    return points
+
+
+def _ring(cx, cy, radius, n, clockwise=False):
+    angles = [2 * math.pi * k / n for k in range(n)]
+    if clockwise:
+        angles.reverse()
+    points = [(round(cx + radius * math.cos(a), 2), round(cy + radius * math.sin(a), 2)) for a in angles]
+    return points + points[:1]
+
+
+def _wkt_points(points):
+    return ', '.join(f'{x} {y}' for x, y in points)
+
+
+def points_tile(rng, scale):
+    features = [
+        {'geometry': f'POINT ({rng.uniform(0, 4096):.2f} {rng.uniform(0, 4096):.2f})',
+         'properties': {'class': rng.choice(['shop', 'school', 'park', 'bus_stop']), 'rank': rng.randint(1, 20)},
+         'id': i}
+        for i in range(5000 * scale)
+    ]
+    return [{'name': 'poi', 'features': features}]
+
+
+def lines_tile(rng, scale):
+    features = [
+        {'geometry': f'LINESTRING ({_wkt_points(_walk(rng, rng.randint(20, 400)))})',
+         'properties': {'class': rng.choice(['primary', 'secondary', 'minor', 'service']), 'oneway': rng.randint(0, 1)},
+         'id': i}
+        for i in range(300 * scale)
+    ]
+    return [{'name': 'transportation', 'features': features}]
+
+
+def polygons_tile(rng, scale):
+    features = []
+    for i in range(500 * scale):
+        cx, cy, radius = rng.uniform(300, 3800), rng.uniform(300, 3800), rng.uniform(40, 250)
+        exterior = _ring(cx, cy, radius, rng.randint(8, 64))
+        holes = [_ring(cx + dx * radius / 2, cy, radius / 5, 12, clockwise=True) for dx in (-1, 1)]
+        rings = ', '.join(f'({_wkt_points(ring)})' for ring in [exterior] + holes)
+        features.append({'geometry': f'POLYGON ({rings})', 'properties': {'class': 'residential'}, 'id': i})
+    return [{'name': 'landuse', 'features': features}]
+
+
+def attributes_tile(rng, scale):
+    features = []
+    for i in range(2000 * scale):
+        properties = {f'name:{lang}': f'name {rng.randint(0, 5000)} {lang}' for lang in ('en', 'fr', 'de', 'vi', 'es')}
+        properties.update({f'attr_{k}': rng.choice([rng.randint(-1000, 1000), rng.random(), True, False, 'value'])
+                           for k in range(25)})
+        features.append({'geometry': f'POINT ({rng.uniform(0, 4096):.2f} {rng.uniform(0, 4096):.2f})',
+                         'properties': properties, 'id': i})
+    return [{'name': 'place', 'features': features}]
+
+
+def many_layers_tile(rng, scale):
+    layers = []
+    for k in range(50 * scale):
+        features = [
+            {'geometry': f'LINESTRING ({_wkt_points(_walk(rng, 10))})', 'properties': {'layer': k, 'index': i}, 'id': i}
+            for i in range(50)
+        ]
+        layers.append({'name': f'layer_{k}', 'features': features})
+    return layers
+
+
+SYNTHETIC_TILES = {
+    'points': points_tile,
+    'lines': lines_tile,
+    'polygons': polygons_tile,
+    'attributes': attributes_tile,
+    'many_layers': many_layers_tile,
+}
+
+
+def synthetic_corpora(seed=0, scale=1):
+    """Return a dictionary mapping each synthetic corpus name to a list with its single (z, x, y, tile_data) tile.
+    The tiles only depend on `seed` and `scale`."""
+    corpora = {}
+    for name, build in SYNTHETIC_TILES.items():
+        rng = random.Random(f'{seed}-{name}')
+        corpora[name] = [SYNTHETIC_TILE + (encode(build(rng, scale)),)]
+    return corpora
+
+
+def load_corpus(path, limit=None):
+    """Load the tiles of a real-world corpus as a list of uncompressed (z, x, y, tile_data) tuples.
+
+    `path` is either an MBTiles file, whose rows are converted to XYZ tile coordinates, or a folder of
+    {z}/{x}/{y}.pbf (or .mvt) tiles. Other files found in the folder are loaded with (0, 0, 0) tile coordinates.
+    """
+    tiles = []
+    if os.path.isfile(path):
+        conn = sqlite3.connect(path)
+        try:
+            query = 'SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles'
+            if limit:
+                query += f' LIMIT {int(limit)}'
+            for z, x, y, tile_data in conn.execute(query):
+                tiles.append((z, x, (1 << z) - 1 - y, decompress(tile_data)))
+        finally:
+            conn.close()
+        return tiles
+
+    for root, _, files in os.walk(path):
+        for file_name in sorted(files):
+            if not file_name.endswith(('.pbf', '.mvt')):
+                continue
+            relative = os.path.relpath(os.path.join(root, file_name), path)
+            parts = os.path.splitext(relative)[0].split(os.sep)
+            try:
+                z, x, y = (int(part) for part in parts[-3:])
+            except ValueError:
+                z, x, y = 0, 0, 0
+            with open(os.path.join(root, file_name), 'rb') as f:
+                tiles.append((z, x, y, decompress(f.read())))
+            if limit and len(tiles) >= limit:
+                return tiles
+    return tiles
@@ -0,0 +1,127 @@
+import gc
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+from vtiles.utils.geopreocessing import fix_wkt
+from vtiles.utils.mapbox_vector_tile import decode, encode, summarize
+from vtiles.utils.mapbox_vector_tile.optimise import optimise_tile
+from vtiles.utils.vt2geojson.tools import vt_bytes_to_geojson
+
+
+def _decoded_layers(tile_data):
+    return [{'name': name, 'features': layer['features']} for name, layer in decode(tile_data).items()]
+
+
+# Each operation is a (prepare, run) pair: `prepare` turns a (z, x, y, tile_data) tile into the input of `run` out of
+# the timed section
+OPERATIONS = {
+    'decode': (lambda tile: tile[3], decode),
+    'decode_columnar': (lambda tile: tile[3], lambda tile_data: decode(tile_data, output='columnar')),
+    'decode_shapely': (lambda tile: tile[3], lambda tile_data: decode(tile_data, geometry='shapely')),
+    'summarize': (lambda tile: tile[3], summarize),
+    'encode': (lambda tile: _decoded_layers(tile[3]), encode),
+    'optimise_tile': (lambda tile: tile[3], optimise_tile),
+    'fix_wkt': (lambda tile: decode(tile[3]), fix_wkt),
+    'vt_bytes_to_geojson': (lambda tile: tile, lambda tile: vt_bytes_to_geojson(tile[3], tile[1], tile[2], tile[0])),
+}
+
+
+def measure(operation, tiles, min_time=1.0, max_rounds=100):
+    """Measure the `operation` on the `tiles`.
+
+    The whole corpus is processed in rounds until `min_time` seconds are spent (at least one round, at most
+    `max_rounds`), the best round giving the throughput. The peak memory is measured by tracemalloc on an extra
+    round, out of the timed ones.
+
+    Returns:
+        A dictionary holding `tiles_per_s`, `mb_per_s` (of uncompressed tile data) and `peak_kib`.
+    """
+    prepare, run = OPERATIONS[operation]
+    inputs = [prepare(tile) for tile in tiles]
+    size_mb = sum(len(tile[3]) for tile in tiles) / 1e6
+
+    best = None
+    spent = 0.0
+    rounds = 0
+    gc.collect()
+    while rounds < max_rounds and (rounds == 0 or spent < min_time):
+        start = time.perf_counter()
+        for item in inputs:
+            run(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        spent += elapsed
+        rounds += 1
+
+    gc.collect()
+    tracemalloc.start()
+    for item in inputs:
+        run(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = max(best, 1e-9)
+    return {
+        'tiles_per_s': round(len(inputs) / best, 3),
+        'mb_per_s': round(size_mb / best, 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(corpora, operations, min_time=1.0, progress=None):
+    """Run every operation on every corpus and return the results as {corpus: {operation: measure}}."""
+    results = {}
+    for corpus_name, tiles in corpora.items():
+        results[corpus_name] = {}
+        for operation in operations:
+            if progress:
+                progress(corpus_name, operation)
+            results[corpus_name][operation] = measure(operation, tiles, min_time=min_time)
+    return results
+
+
+def save_baseline(results, path):
+    baseline = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2)
+
+
+def load_baseline(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, threshold=0.1):
+    """Compare `results` to `baseline`.
+
+    Returns:
+        The list of (corpus, operation, metric, baseline value, value, relative change) tuples for every measure
+        present in both, and the list of those that regressed by more than `threshold`: a throughput lower or a peak
+        memory higher than the baseline one.
+    """
+    changes = []
+    regressions = []
+    for corpus_name, operations in results.items():
+        for operation, measures in operations.items():
+            reference = baseline.get(corpus_name, {}).get(operation)
+            if not reference:
+                continue
+            for metric, value in measures.items():
+                reference_value = reference.get(metric)
+                if not reference_value:
+                    continue
+                change = (value - reference_value) / reference_value
+                row = (corpus_name, operation, metric, reference_value, value, change)
+                changes.append(row)
+                regressed = change > threshold if metric == 'peak_kib' else change < -threshold
+                if regressed:
+                    regressions.append(row)
+    return changes, regressions
@@ -1,54 +1,33 @@
-import sqlite3, argparse, sys, logging, os, json
+import argparse, sys, logging, os, json
 from tqdm import tqdm
 from vtiles.utils.geopreocessing import flip_y, check_vector
 from vtiles.mbtiles.mbtilesfixmeta import fix_rastermetadata, fix_vectormetadata,determine_tileformat
+from vtiles.mbtiles.store import MBTilesWriter
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def mbtiles_connect(mbtiles_file):
+def mbtiles_connect(mbtiles_file, schema='flat'):
+  # 'flat': a tiles table, 'dedup': map and images tables with a tiles view, identical tiles being stored once
   try:
-    conn = sqlite3.connect(mbtiles_file)
-    return conn
+    # A folder can hold the same tile in several formats: the last one read replaces the others
+    return MBTilesWriter(mbtiles_file, schema, replace=True)
   except Exception as e:
     logger.error("Could not connect to MBTiles file")
     logger.exception(e)
     sys.exit(1)
 
-def mbtiles_init(cur):
-  cur.execute("""
-    create table tiles (
-      zoom_level integer,
-      tile_column integer,
-      tile_row integer,
-      tile_data blob);
-      """)
-  cur.execute("""create unique index tile_index on tiles(zoom_level, tile_column, tile_row);""")
-
-def optimize_connection(cur):
-  cur.execute("""PRAGMA synchronous=0""")
-  # cur.execute("""PRAGMA locking_mode=EXCLUSIVE""")
-  cur.execute("""PRAGMA journal_mode=DELETE""")
-
-def import_metadata(input_mbtiles, metadata_json):
-  conn = sqlite3.connect(input_mbtiles)       
-  cur = conn.cursor()
-  cur.execute('CREATE TABLE metadata (name TEXT, value TEXT);')
-  cur.execute('CREATE UNIQUE INDEX name on metadata (name);')
-  for name, value in metadata_json.items():
-    cur.execute('insert into metadata (name, value) values (?, ?)',(name, value))
+def import_metadata(writer, metadata_json):
+  writer.update_metadata(metadata_json)
   
 
 def get_dirs(path):
   return [name for name in os.listdir(path)
     if os.path.isdir(os.path.join(path, name))]
 
-def folder2mbtiles(input_folder, mbtiles_file, flipy=0):
+def folder2mbtiles(input_folder, mbtiles_file, flipy=0, schema='flat'):
   # logger.debug("%s --> %s" % (input_folder, mbtiles_file))
-  con = mbtiles_connect(mbtiles_file)
-  cur = con.cursor()
-  optimize_connection(cur)
-  mbtiles_init(cur)  
+  writer = mbtiles_connect(mbtiles_file, schema)
 
   with tqdm(desc="Coverting tiles", unit=" tiles") as pbar:
     for zoom_dir in get_dirs(input_folder):   
@@ -70,25 +49,24 @@ def folder2mbtiles(input_folder, mbtiles_file, flipy=0):
               else:
                 y = int(file_name)
               logger.debug(' Read tile from Zoom (z): %i\tCol (x): %i\tRow (y): %i' % (z, x, y))
-              cur.execute("""insert into tiles (zoom_level,
-                  tile_column, tile_row, tile_data) values
-                  (?, ?, ?, ?);""",
-                  # (z, x, y, file_content))
-                  (z, x, y, sqlite3.Binary(file_content)))
+              writer.write_tile(z, x, y, file_content)
               pbar.update(1)
 
-  cur.close()
-  con.commit()
-  con.close()    
-  logger.info('Converting Folder to MBTiles done.')
+  if schema == 'dedup':
+    tiles, images = writer.count_images()
+    logger.info(f'{tiles} tiles stored as {images} distinct images.')
 
   # converting or fixing metadata
   metadata = os.path.join(input_folder, 'metadata.json')
   if os.path.exists(metadata):
     metadata_json = json.load(open(metadata, 'r'))
-    import_metadata(mbtiles_file, metadata_json)
+    import_metadata(writer, metadata_json)
+    writer.close()
+    logger.info('Converting Folder to MBTiles done.')
     logger.info('Converting metadata done.') 
   else:
+    writer.close()
+    logger.info('Converting Folder to MBTiles done.')
     is_vector, compression_type = check_vector(mbtiles_file) 
     tile_format = determine_tileformat(mbtiles_file)
     desc = 'MBtiles created by vtiles.mbtiles.folder2mbtiles and metadata updated by mbtilesfixmeta' 
@@ -104,6 +82,7 @@ def main():
   parser.add_argument('input', help='Input folder')
   parser.add_argument('-o','--output', default=None, help='Output mbtiles file name (optional)')
   parser.add_argument('-flipy', type=int, default=0,choices=[0, 1], help='TMS <--> XYZ tiling scheme (optional): 1 or 0, default is 0')
+  parser.add_argument('-dedup', action='store_true', help='Store identical tiles once, in map and images tables with a tiles view (optional)')
 
   args = parser.parse_args()
 
@@ -129,7 +108,7 @@ def main():
 
   # Inform the user of the conversion
   logging.info(f'Converting {input_folder_abspath} to {output_file_abspath}.') 
-  folder2mbtiles(input_folder_abspath, output_file_abspath, args.flipy)
+  folder2mbtiles(input_folder_abspath, output_file_abspath, args.flipy, 'dedup' if args.dedup else 'flat')
 
 if __name__ == "__main__":
   main()
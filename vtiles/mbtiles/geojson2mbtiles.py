@@ -1,39 +1,22 @@
 import os,sys,argparse, logging
-from vtiles.utils.mapbox_vector_tile import encode
+from vtiles.utils.mapbox_vector_tile import encode, TileGeometry
 from vtiles.utils.geojson2vt.geojson2vt import geojson2vt
 import sqlite3,json, gzip
 from vtiles.mbtiles.mbtilesfixmeta import fix_vectormetadata
+from vtiles.utils.mbtilesschema import insert_tiles, is_deduplicated
+from vtiles.mbtiles.store import MBTilesWriter
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def create_mbtiles(mbtiles_file):
+def create_mbtiles(mbtiles_file, schema='flat'):
+    """Create an empty MBTiles file, with a tiles table ('flat' schema) or with map and images tables and a tiles
+    view ('dedup' schema)."""
     try:
-        conn = sqlite3.connect(mbtiles_file)
-        cursor = conn.cursor()
-
-        # Create metadata table
-        cursor.execute('CREATE TABLE metadata (name TEXT, value TEXT);')
-        cursor.execute('CREATE UNIQUE INDEX name ON metadata (name);')
-
-        # Create tiles table
-        cursor.execute('CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);')
-        cursor.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);')
-
-        # Commit the transaction
-        conn.commit()
-
+        # The tiles are added one by one afterwards, so the tile index is created with the tables
+        MBTilesWriter(mbtiles_file, schema, replace=True).close()
     except sqlite3.Error as e:
         logger.error(f"Error occurred while creating MBTiles file: {e}")
-        if conn:
-            conn.rollback()
-
-    finally:
-        # Close the cursor and the connection
-        if cursor:
-            cursor.close()  # Ensure cursor is explicitly closed
-        if conn:
-            conn.close()    # Ensure connection is closed
 
 def add_tile_to_mbtiles(mbtiles_file, z, x, y, tile_data):
     """Add a tile to the MBTiles database."""
@@ -42,11 +25,8 @@ def add_tile_to_mbtiles(mbtiles_file, z, x, y, tile_data):
         conn = sqlite3.connect(mbtiles_file)
         cursor = conn.cursor()
 
-        # Insert or replace the tile into the tiles table
-        cursor.execute('''
-            INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) 
-            VALUES (?, ?, ?, ?);
-        ''', (z, x, y, tile_data))
+        # Insert or replace the tile into the tiles table, or the map and images tables
+        insert_tiles(cursor, [(z, x, y, tile_data)], 'dedup' if is_deduplicated(cursor) else 'flat')
 
         # Commit the changes
         conn.commit()
@@ -93,29 +73,13 @@ def transform_to_layer(data, layer_name):
     
     for feature_collection in transformed_data:
         for feature in feature_collection['features']:
-            # Convert 'geometry' based on type
-            if feature['type'] == 1:  # Point
-                coords = feature['geometry']
-                coords[1] = 4096 - coords[1]  # Apply y-axis inversion
-                feature['geometry'] = f"POINT({coords[0]} {coords[1]})"
-            elif feature['type'] == 2:  # LineString
-                coords = feature['geometry']
-                coords = [(x, 4096 - y) for x, y in coords]  # Apply y-axis inversion to each coordinate
-                coords_str = ', '.join([f"{x} {y}" for x, y in coords])
-                feature['geometry'] = f"LINESTRING({coords_str})"
-            elif feature['type'] == 3:  # Polygon
-                coords = feature['geometry'][0]
-                coords = [(x, 4096 - y) for x, y in coords]  # Apply y-axis inversion to each coordinate
-                coords_str = ', '.join([f"{x} {y}" for x, y in coords])
-                feature['geometry'] = f"POLYGON(({coords_str}))"
-            
+            # geojson2vt features are already in tile space (y axis down): encode them as they are,
+            # 'type' being the MVT geometry type (1: Point, 2: LineString, 3: Polygon)
+            feature['geometry'] = TileGeometry(feature.pop('type'), feature['geometry'])
+
             # Rename 'tags' to 'properties'
             feature['properties'] = feature.pop('tags')
 
-            # Remove 'type' as it's no longer needed
-            del feature['type']
-
-
     return transformed_data
 
 
@@ -126,6 +90,8 @@ def main():
     parser.add_argument('-z', '--zoom', type=int, default=0, help="Zoom level for the tile.")
     parser.add_argument('-x', '--x', type=int, default=0, help="Tile column.")
     parser.add_argument('-y', '--y', type=int, default=0, help="Tile row.")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Store identical tiles once, in map and images tables with a tiles view.")
     
     args = parser.parse_args()
     if not os.path.exists(args.input):
@@ -161,7 +127,7 @@ def main():
     z, x, y = args.zoom, args.x, args.y
 
     # Create MBTiles file
-    create_mbtiles(output_file_abspath)
+    create_mbtiles(output_file_abspath, 'dedup' if args.dedup else 'flat')
     tile_index = geojson2vt(geojson_data, {
 	'maxZoom': 5,  # max zoom to preserve detail on; can't be higher than 24
 	'tolerance': 3, # simplification tolerance (higher means simpler)
@@ -176,7 +142,7 @@ def main():
 
     tile_data = tile_index.get_tile(0,0,0)
     tile_data_fixed = transform_to_layer(tile_data,layer_name)
-    tile_data_fixed_encoded = encode(tile_data_fixed)
+    tile_data_fixed_encoded = encode(tile_data_fixed, default_options={'y_coord_down': True})
     tile_data_fixed_encoded_compressed = gzip.compress(tile_data_fixed_encoded)
 
     add_tile_to_mbtiles(output_file_abspath, z, x, y, tile_data_fixed_encoded_compressed)
@@ -5,6 +5,7 @@ import json
 import argparse
 from tqdm import tqdm
 from vtiles.utils.geopreocessing import flip_y, safe_makedir,determine_tileformat
+from vtiles.mbtiles.store import MBTilesReader, open_reader
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
@@ -12,18 +13,11 @@ logger = logging.getLogger(__name__)
 def extract_metadata(mbtiles):
     """Extract metadata from MBTiles file."""
     try:
-        conn = sqlite3.connect(mbtiles)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name, value FROM metadata")
-        metadata_rows = cursor.fetchall()
-        metadata = {name: value for name, value in metadata_rows}
-        return metadata
+        with open_reader(mbtiles) as reader:
+            return reader.metadata()
     except sqlite3.Error as e:
         logging.warning(f"Error reading metadata: {e}")
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
 def write_metadata_to_json(metadata, dirname):
     """Write metadata to JSON file."""
@@ -33,32 +27,26 @@ def write_metadata_to_json(metadata, dirname):
     logging.info("Writing metadata.json done!")
 
 def get_max_zoom(mbtiles):
-    try:
-        conn = sqlite3.connect(mbtiles)
-        cursor = conn.cursor()
-        cursor.execute('SELECT MAX(zoom_level) FROM tiles')
-        return cursor.fetchone()[0]
-    finally:
-        cursor.close()
-        conn.close()
+    with open_reader(mbtiles) as reader:
+        return reader.zoom_range()[1]
 
 def convert_mbtiles_to_folder(mbtiles, output_folder, flipy, min_zoom=0, max_zoom=None):
-    conn = sqlite3.connect(mbtiles)
-    cursor = conn.cursor()
+    reader = MBTilesReader(mbtiles)
     
-    tile_format = determine_tileformat(mbtiles)
+    tile_format = determine_tileformat(reader)
     
-    mbtiles_max_zoom = get_max_zoom(mbtiles)
+    mbtiles_max_zoom = get_max_zoom(reader)
     max_zoom = max_zoom if max_zoom is not None and max_zoom <= mbtiles_max_zoom else mbtiles_max_zoom
 
-    metadata = extract_metadata(mbtiles)
+    metadata = extract_metadata(reader)
     if metadata:
         write_metadata_to_json(metadata, output_folder)
     
-    cursor.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles WHERE zoom_level BETWEEN ? AND ? ORDER BY zoom_level', (min_zoom, max_zoom))
-    tiles = cursor.fetchall()
+    # The tiles are streamed from the cursor, the progress bar being sized by a count on the index
+    tiles = reader.tiles(min_zoom=min_zoom, max_zoom=max_zoom)
+    total_tiles = reader.count(min_zoom=min_zoom, max_zoom=max_zoom)
 
-    for zoom, col, row, tile_data in tqdm(tiles, unit=' tiles ', desc='Processing tiles'):
+    for zoom, col, row, tile_data in tqdm(tiles, total=total_tiles, unit=' tiles ', desc='Processing tiles'):
         # Flip the Y coordinate if flipy is True
         y = flip_y(zoom, row) if flipy else row
 
@@ -78,8 +66,7 @@ def convert_mbtiles_to_folder(mbtiles, output_folder, flipy, min_zoom=0, max_zoo
 
     logging.info('Converting MBTiles to folder done!')
     
-    cursor.close()
-    conn.close()
+    reader.close()
 
 def main():
     parser = argparse.ArgumentParser(description='Convert MBTiles file to tiles folder')
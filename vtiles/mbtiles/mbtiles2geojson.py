@@ -3,22 +3,21 @@ import argparse
 import sqlite3
 import argparse, sys, os
 from vtiles.utils.vt2geojson.tools import vt_bytes_to_geojson
-import gzip
-import zlib
+from vtiles.utils.compression import decompress
 import logging
+from functools import partial
 from tqdm import tqdm
+from vtiles.utils.mapbox_vector_tile import map_many
 from vtiles.utils.geopreocessing import check_vector
+from vtiles.mbtiles.store import MBTilesReader
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def tile_data_to_geojson(tile_data, x, y, z, layers):   
     try:
-        features = vt_bytes_to_geojson(tile_data, x, y, z)
-        if layers:
-            filtered_features = {layer: features[layer] for layer in layers if layer in features}
-        else:
-            filtered_features = features
+        # Unwanted layers are skipped before decoding
+        filtered_features = vt_bytes_to_geojson(tile_data, x, y, z, layers or None)
 
         # Add zoom level to each feature's properties
         for layer, feature_collection in filtered_features.items():
@@ -32,16 +31,22 @@ def tile_data_to_geojson(tile_data, x, y, z, layers):
         logging.error(f"Error converting tile data to GeoJSON at tile ({x}, {y}, {z}): {e}")
         return None
 
-def decompress_tile_data(tile_data):  
+def decompress_tile_data(tile_data, codec=None, dictionary=None):
+    # codec is the compression of the MBTiles file, only needed for brotli tiles, dictionary its zstd dictionary
+    return decompress(tile_data, codec, dictionary)
+
+def convert_tile(tile, zoom_level, flip_y, layers, codec=None, dictionary=None):
+    """Return the GeoJSON features of a (zoom_level, tile_column, tile_row, tile_data) tile, None for an empty tile."""
+    _, x, y, tile_data = tile
+    if not tile_data:
+        return None
+    if flip_y:
+        y = (1 << zoom_level) - 1 - y
     try:
-        if tile_data[:2] == b'\x1f\x8b':  # Check for gzip magic number
-            return gzip.decompress(tile_data)
-        elif tile_data[:2] in {b'\x78\x9c', b'\x78\x01', b'\x78\xda'}:
-            return zlib.decompress(tile_data)
-        return tile_data
+        tile_data = decompress_tile_data(tile_data, codec, dictionary)
     except Exception as e:
-        logging.error(f"Failed to decompress tile data: {e}")
-        return tile_data
+        raise ValueError(f"Failed to decompress tile ({x}, {y}, {zoom_level}): {e}") from e
+    return tile_data_to_geojson(tile_data, x, y, zoom_level, layers)
     
 def merge_geojsons(geojson_list):
     merged_geojson = {}
@@ -54,57 +59,33 @@ def merge_geojsons(geojson_list):
     
     return merged_geojson
 
-def mbtiles_to_geojson(input_mbtiles, output_geojson, compression_type, zoom_level, flip_y, layers, chunk_size=1000):
+def mbtiles_to_geojson(input_mbtiles, output_geojson, compression_type, zoom_level, flip_y, layers, workers=None):
     """
-    Convert MBTiles data to GeoJSON format in chunks.
+    Convert MBTiles data to GeoJSON format, streaming the tiles of the zoom level to a pool of worker processes.
 
     Args:
         input_mbtiles (str): Path to the input MBTiles file.
         output_geojson (str): Path to the output GeoJSON file.
-        compression_type (str): Compression type (GZIP or ZLIB).
+        compression_type (str): Compression type (GZIP, ZLIB, ZSTD or BROTLI), used when the metadata has none.
         zoom_level (int): The zoom level of tiles to extract.
         flip_y (bool): Whether to flip the y coordinate (TMS format).
         layers (list): List of layer names to include in the output.
-        chunk_size (int): Number of rows to process per chunk (default: 1000).
+        workers (int): Number of worker processes decoding the tiles, the number of CPUs when None.
     """
     all_features = []
 
     try:
-        conn = sqlite3.connect(input_mbtiles)
-        cursor = conn.cursor()
-
-        offset = 0
-        more_tiles = True
-
-        while more_tiles:
-            # Fetch a chunk of tile data
-            cursor.execute(f'''
-                SELECT tile_column, tile_row, tile_data 
-                FROM tiles 
-                WHERE zoom_level=? 
-                LIMIT ? OFFSET ?''', (zoom_level, chunk_size, offset))
-            rows = cursor.fetchall()
-
-            if not rows:
-                more_tiles = False  # No more tiles to fetch
-
-            for x, y, tile_data in tqdm(rows, desc=f"Converting tiles at zoom level {zoom_level} to GeoJSON"):
-                if tile_data:
-                    if flip_y:
-                        y = (1 << zoom_level) - 1 - y
-
-                    if compression_type == 'GZIP' or compression_type == 'ZLIB':
-                        tile_data = decompress_tile_data(tile_data)
-
-                    features = tile_data_to_geojson(tile_data, x, y, zoom_level, layers)
-                    if features:
-                        all_features.append(features)
-
-            offset += chunk_size  # Move to the next chunk
-
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
+        with MBTilesReader(input_mbtiles) as reader:
+            codec = reader.compression() or compression_type
+            dictionary = reader.zstd_dictionary()
+            # The tiles are fetched from SQLite as the workers convert them
+            tiles = reader.tiles(zoom_level, ordered=False)
+            func = partial(convert_tile, zoom_level=zoom_level, flip_y=flip_y, layers=layers, codec=codec,
+                           dictionary=dictionary)
+            for features in tqdm(map_many(func, tiles, workers=workers), total=reader.count(zoom_level),
+                                 desc=f"Converting tiles at zoom level {zoom_level} to GeoJSON"):
+                if features:
+                    all_features.append(features)
 
         # Merge and save the resulting GeoJSON
         merged_geojson = merge_geojsons(all_features)
@@ -128,6 +109,7 @@ def main():
     parser.add_argument('-z','--zoom', type=int, required=True, help='Minimum tile zoom level')
     parser.add_argument('-flipy', '--flipy', type=int, choices=[0, 1], default=0, help='TMS <--> XYZ tiling scheme (optional): 1 or 0, default is 0')
     parser.add_argument('-l', '--layers', type=str, nargs='*', help='List of layer names to convert')
+    parser.add_argument('-w', '--workers', type=int, help='Number of worker processes (default is the number of CPUs).')
 
     args = parser.parse_args()
     if not os.path.exists(args.input):
@@ -156,7 +138,7 @@ def main():
     is_vector, compression_type = check_vector(args.input)
     if is_vector:
         logging.info(f'Converting {input_file_abspath} to {output_file_abspath}.') 
-        mbtiles_to_geojson(input_file_abspath, output_file_abspath,compression_type, args.zoom, args.flipy, args.layers)
+        mbtiles_to_geojson(input_file_abspath, output_file_abspath,compression_type, args.zoom, args.flipy, args.layers, args.workers)
     else:
         logging.warning(f'mbtiles2gojson only supports vector MBTiles. {input_file_abspath} is not a vector MBTiles.')
         sys.exit(1)
@@ -3,23 +3,18 @@ import os,sys, logging
 import sqlite3
 import argparse
 from vtiles.utils.geopreocessing import check_vector
+from vtiles.mbtiles.store import MBTilesReader
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def extract_tile_to_pbf(mbtiles_file, z, x, y, output_pbf):
     try:
-        # Connect to the MBTiles database
-        conn = sqlite3.connect(mbtiles_file)
-        cursor = conn.cursor()        
-       
         # Query the tile data
-        cursor.execute('SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?', (z, x, y))
-        row = cursor.fetchone()
-        conn.close()
+        with MBTilesReader(mbtiles_file) as reader:
+            tile_data = reader.get_tile(z, x, y)
         
-        if row:
-            tile_data = row[0] 
+        if tile_data is not None:
             # Write the decompressed tile data to the output PBF file
             with open(output_pbf, 'wb') as f:
                 f.write(tile_data)
@@ -1,12 +1,13 @@
 import argparse, sys, os
-import gzip
+from vtiles.utils.compression import CompressionCache, decompress, detect_compression, normalize_codec
 from vtiles.utils.pmtiles.writer import write
-from vtiles.utils.pmtiles.tile import TileType, zxy_to_tileid, tileid_to_zxy, Compression
+from vtiles.utils.pmtiles.tile import TileType, zxy_to_tileid, tileid_to_zxy, Compression, compression_from_codec
 import sqlite3
 from tqdm import tqdm
 import logging
 
-from vtiles.utils.geopreocessing import check_vector, determine_tileformat
+from vtiles.mbtiles.store import MBTilesReader
+from vtiles.mbtiles.profile import TilesetProfile
 from vtiles.mbtiles.mbtilesfixmeta import fix_rastermetadata, fix_vectormetadata
 
 logging.basicConfig(level=logging.INFO)
@@ -54,8 +55,7 @@ def mbtiles_to_header_json(mbtiles_metadata):
 
 def mbtiles_to_pmtiles(input, output):
     try: 
-        conn = sqlite3.connect(input)
-        cursor = conn.cursor()
+        reader = MBTilesReader(input)
         with write(output) as writer:
             # collect a set of all tile IDs
             tileid_set = []
@@ -63,42 +63,47 @@ def mbtiles_to_pmtiles(input, output):
             #     "SELECT zoom_level,tile_column,tile_row FROM tiles WHERE zoom_level <= ?",
             #     (maxzoom or 99,),
             # ):
-            for row in cursor.execute(
-                "SELECT zoom_level,tile_column,tile_row FROM tiles"
-            ):
+            for row in reader.coordinates(ordered=False):
                 flipped = (1 << row[0]) - 1 - row[2]
                 tileid_set.append(zxy_to_tileid(row[0], row[1], flipped))
 
             tileid_set.sort()
 
-            mbtiles_metadata = {}
-            for row in cursor.execute("SELECT name,value FROM metadata"):
-                mbtiles_metadata[row[0]] = row[1]
+            mbtiles_metadata = reader.metadata()
             is_pbf = mbtiles_metadata["format"] == "pbf"
+            # brotli tiles can only be told from the metadata, the other codecs are detected from the tiles
+            metadata_codec = normalize_codec(mbtiles_metadata.get("compression"))
+            tile_codec = None
+            # Identical tiles are recompressed once
+            cache = CompressionCache()
 
             # query the db in ascending tile order
             for tileid in tqdm(tileid_set, desc="Converting tiles"):
                 z, x, y = tileid_to_zxy(tileid)
                 flipped = (1 << z) - 1 - y
-                res = cursor.execute(
-                    "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
-                    (z, x, flipped),
-                )
-                data = res.fetchone()[0]
-                # force gzip compression only for vector
-                if is_pbf and data[0:2] != b"\x1f\x8b":
-                    data = gzip.compress(data)
+                data = reader.get_tile(z, x, flipped)
+                if is_pbf:
+                    codec = "brotli" if metadata_codec == "brotli" else detect_compression(data)
+                    # vector tiles keep the gzip, zstd or brotli compression of the first tile, otherwise they are
+                    # gzipped: PMTiles has no zlib and a single compression for all the tiles
+                    if tile_codec is None:
+                        tile_codec = codec if codec in ("gzip", "zstd", "brotli") else "gzip"
+                    if codec != tile_codec:
+                        data = cache.compress(decompress(data, codec), tile_codec)
                 writer.write_tile(tileid, data)
 
             pmtiles_header, pmtiles_metadata = mbtiles_to_header_json(mbtiles_metadata)
+            if is_pbf:
+                pmtiles_header["tile_compression"] = compression_from_codec(tile_codec or "gzip")
             # if maxzoom:
             #     pmtiles_header["max_zoom"] = int(maxzoom)
             #     mbtiles_metadata["maxzoom"] = maxzoom
             writer.finalize(pmtiles_header, pmtiles_metadata)
         
+        if cache.lookups:
+            logging.info(cache.summary())
         logging.info(f"Converting MBTiles to PMTile done!")
-        cursor.close()
-        conn.close()
+        reader.close()
     except sqlite3.Error as e:
         logging.error(f"Failed to read MBTiles file {input}: {e}")
     except Exception as e:
@@ -133,13 +138,12 @@ def main():
             logger.error(f'Output PMTiles  {output_file_abspath} already exists! Please recheck and input a correct one. Ex: -o tiles.pmtiles')
             sys.exit(1)          
 
-    is_vector, compression_type = check_vector(input_file_abspath) 
-    tile_format = determine_tileformat(input_file_abspath)
+    profile = TilesetProfile.load(input_file_abspath)
     desc = 'Update metadata by vtiles.mbtiles.fixmeta' 
-    if is_vector:
-        fix_vectormetadata(input_file_abspath, compression_type,desc)   
+    if profile.is_vector:
+        fix_vectormetadata(input_file_abspath, profile.compression_type, desc, profile)
     else:
-        fix_rastermetadata(input_file_abspath, tile_format,desc)        
+        fix_rastermetadata(input_file_abspath, profile.tile_format, desc, profile)
 
     logging.info(f'Converting {input_file_abspath} to {output_file_abspath}.')
     mbtiles_to_pmtiles(input_file_abspath, output_file_abspath)
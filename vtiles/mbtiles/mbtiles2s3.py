@@ -5,7 +5,6 @@
 import json
 import logging
 import os
-import sqlite3
 from functools import partial
 from multiprocessing.pool import ThreadPool
 from urllib.parse import urlparse
@@ -13,6 +12,8 @@ from urllib.parse import urlparse
 import boto3
 import click
 
+from vtiles.mbtiles.store import MBTilesReader
+
 # import utils
 
 upload_progress_interval = 100
@@ -25,39 +26,30 @@ class MBTilesGenerator(object):
 
     def __init__(self, mbtiles):
         super(MBTilesGenerator, self).__init__()
-        self.db = sqlite3.connect(mbtiles)
-        self.cursor = self.db.cursor()
-        self.cursor.execute(
-            "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles order by zoom_level"
-        )
+        self.reader = MBTilesReader(mbtiles, check_same_thread=False)
+        self.tiles = self.reader.tiles()
 
     def len(self):
-        c = self.db.cursor()
-        c.execute("SELECT count(1) from tiles")
-        return c.fetchone()[0]
+        return self.reader.count()
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        row = self.cursor.fetchone()
-        if row == None:
-            raise StopIteration()
-        zoom, x, y, tile = row
+        zoom, x, y, tile = next(self.tiles)
         y = ((1 << zoom) - y) - 1
         return zoom, x, y, tile
 
 
 def get_tile_json(mbtiles, bucket, key_template):
-    db = sqlite3.connect(mbtiles)
-    cursor = db.cursor()
-    cursor.execute("SELECT name, value FROM metadata")
+    with MBTilesReader(mbtiles) as reader:
+        metadata = reader.metadata()
     tilejson = {
         "tilejson": "2.2.0",
         "scheme": "xyz",
         "tiles": ["https://s3.amazonaws.com/{}/{}".format(bucket, key_template)],
     }
-    for key, value in cursor.fetchall():
+    for key, value in metadata.items():
         if key == "json":
             data = json.loads(value)
             tilejson.update(data)
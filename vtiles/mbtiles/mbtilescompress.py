@@ -1,122 +1,336 @@
 import argparse, sys, os
 import sqlite3
-import gzip, zlib
 from tqdm import tqdm
 import logging
-import shutil
+import time
+import hashlib
+from collections import OrderedDict, deque
+from functools import partial
 from vtiles.utils.geopreocessing import check_vector
+from vtiles.utils.compression import (CODECS, DEFAULT_CACHE_SIZE, DEFAULT_DICTIONARY_SIZE, DEFAULT_LEVELS,
+                                      DICTIONARY_METADATA, cache_summary, check_codec, compress, decompress, detect_compression,
+                                      encode_dictionary, tile_cache, uses_dictionary)
+from vtiles.utils.compression import train_dictionary as train_zstd_dictionary
+from vtiles.utils.mapbox_vector_tile.batch import map_many
+from vtiles.mbtiles.store import MBTilesReader, MBTilesWriter, open_reader
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def compress_tile_data(tile_data):
-    try: 
-        if tile_data[:2] != b'\x1f\x8b':  # check if not GZIP    
-            if tile_data[:2] == b'\x78\x9c' or tile_data[:2] == b'\x78\x01' or tile_data[:2] == b'\x78\xda': # Check if ZLIB
-                tile_data = zlib.decompress(tile_data)           
-            tile_data = gzip.compress(tile_data)
-    except Exception as e:
-        logger.error(f"Failed to compress tile data: {e}")
+def compress_tile_data(tile_data, codec='gzip', level=None, input_codec=None, dictionary=None, input_dictionary=None):
+    """Compress tile_data with codec at level, with the zstd dictionary if any. A tile already compressed with codec
+    is kept as is unless a level or a dictionary is given, a tile compressed otherwise is decompressed first
+    (input_codec is only needed for brotli tiles and input_dictionary for tiles compressed with a zstd dictionary).
+    Identical tiles are compressed once, through the tile_cache of the process. A tile that can't be decompressed or
+    compressed raises, so that the output never mixes converted and unconverted tiles."""
+    if (input_codec != 'brotli' and level is None and dictionary is None and detect_compression(tile_data) == codec
+            and not uses_dictionary(tile_data)):
         return tile_data
-    return tile_data          
+    return tile_cache.compress(decompress(tile_data, input_codec, input_dictionary), codec, level, dictionary)
+
+def read_compression(mbtiles):
+    """Return the codec in the compression metadata of mbtiles, None if there is none or it is not a known codec."""
+    try:
+        with open_reader(mbtiles) as reader:
+            return reader.compression()
+    except sqlite3.Error:
+        return None
+
+def sample_tiles(input_mbtiles, samples, input_codec=None, input_dictionary=None, zoom_level=None):
+    """Return about samples decompressed tiles picked at random in input_mbtiles, or in its zoom_level, in a single
+    pass over the tiles."""
+    with open_reader(input_mbtiles) as reader:
+        return [decompress(tile_data, input_codec, input_dictionary)
+                for tile_data in reader.sample(samples, zoom_level)]
+
+class TransformedTiles:
+    """Outputs of the tiles already transformed, shared by all the workers as it is kept in the parent process.
 
-def compress_mbtiles(input_mbtiles, output_mbtiles, batch_size=10000):
-    shutil.copyfile(input_mbtiles, output_mbtiles)
-    
-    # Open the copied MBTiles file
-    conn = sqlite3.connect(output_mbtiles)
-    cursor = conn.cursor()
+    `send` hashes each input tile: a tile whose bytes and zoom function are those of a tile already transformed is
+    sent to the workers without its tile_data, and `receive`, called with the results in the same order, gives it
+    the output of that tile. The outputs are kept up to `max_bytes`, the least recently used ones being evicted
+    first; the output of a tile sent without its tile_data is held until it is received.
+    """
 
-    # Check if the tiles table is a view
-    cursor.execute("SELECT type FROM sqlite_master WHERE name='tiles'")
-    result = cursor.fetchone()
+    def __init__(self, zoom_funcs=None, max_bytes=DEFAULT_CACHE_SIZE):
+        self.zoom_funcs = zoom_funcs or {}
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.reused = 0
+        self._outputs = OrderedDict()
+        self._held = {}
+        self._keys = deque()
 
-    def process_tiles(tiles):
-        batch = []
+    def send(self, tiles):
+        """Yield the (zoom_level, tile_column, tile_row, tile_data) tiles, tile_data being None for the tiles whose
+        output is known."""
         for zoom_level, tile_column, tile_row, tile_data in tiles:
-            try:
-                compressed_tile = compress_tile_data(tile_data)
-                batch.append((compressed_tile, zoom_level, tile_column, tile_row))
-            except Exception as e:
-                logger.error(f"Error compressing tile {zoom_level}/{tile_column}/{tile_row}: {e}")
-            # Commit batch once it reaches the batch_size
-            if len(batch) >= batch_size:
-                cursor.executemany(
-                    "UPDATE tiles SET tile_data = ? WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
-                    batch
-                )
-                conn.commit()  # Commit batch
-                batch.clear()  # Clear batch
-
-        # Commit any remaining tiles in the batch
-        if batch:
-            cursor.executemany(
-                "UPDATE tiles SET tile_data = ? WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
-                batch
-            )
-            conn.commit()
-
-    if result and result[0] == 'view':
-        # Create a new table named tiles_new
-        cursor.execute("CREATE TABLE tiles_new (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
-        
-        # Select data from the view
-        cursor.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles order by zoom_level")
-        tiles = cursor.fetchall()
-        
-        batch = []
-        for zoom_level, tile_column, tile_row, tile_data in tqdm(tiles, desc="Compressing tiles", unit="tile"):
-            try:
-                compressed_tile = compress_tile_data(tile_data)
-                batch.append((zoom_level, tile_column, tile_row, compressed_tile))
-            except Exception as e:
-                logger.error(f"Error compressing tile {zoom_level}/{tile_column}/{tile_row}: {e}")
-            
-            # Insert in batches
-            if len(batch) >= batch_size:
-                cursor.executemany(
-                    "INSERT INTO tiles_new (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
-                    batch
-                )
-                conn.commit()  # Commit batch
-                batch.clear()  # Clear batch
-
-        # Commit remaining tiles in the batch
-        if batch:
-            cursor.executemany(
-                "INSERT INTO tiles_new (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
-                batch
-            )
-            conn.commit()
-
-        # Drop the view and rename the new table to tiles
-        cursor.execute("DROP VIEW tiles")
-        cursor.execute("ALTER TABLE tiles_new RENAME TO tiles")
-        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
-    
-    else:
-        # Decompress tile data in the existing tiles table
-        cursor.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles order by zoom_level")
-        tiles = cursor.fetchall()
-        
-        # Process the tiles in batches
-        process_tiles(tqdm(tiles, desc="Compressing tiles", unit="tile"))
-    
-    # Commit and close connections
-    conn.commit()
-    conn.close()
+            key = None
+            if tile_data is not None:
+                key = (hashlib.blake2b(tile_data, digest_size=16).digest(),
+                       zoom_level if zoom_level in self.zoom_funcs else None)
+                output = self._outputs.get(key)
+                if output is not None:
+                    self._outputs.move_to_end(key)
+                    self._held.setdefault(key, [output, 0])[1] += 1
+                    self._keys.append((key, True))
+                    yield zoom_level, tile_column, tile_row, None
+                    continue
+            self._keys.append((key, False))
+            yield zoom_level, tile_column, tile_row, tile_data
+
+    def receive(self, tile_data):
+        """Return the output of the next sent tile, tile_data being the output of the worker."""
+        key, known = self._keys.popleft()
+        if known:
+            held = self._held[key]
+            held[1] -= 1
+            if not held[1]:
+                del self._held[key]
+            self.reused += 1
+            return held[0]
+        if key is not None and tile_data is not None and key not in self._outputs:
+            entry_size = len(tile_data) + len(key[0])
+            if entry_size <= self.max_bytes:
+                self._outputs[key] = tile_data
+                self.size += entry_size
+                while self.size > self.max_bytes:
+                    evicted_key, evicted = self._outputs.popitem(last=False)
+                    self.size -= len(evicted) + len(evicted_key[0])
+        return tile_data
+
+def _transform_tile(func, zoom_funcs, tile):
+    zoom_level, tile_column, tile_row, tile_data = tile
+    if tile_data is None:
+        # A copy of a tile already transformed, or a NULL tile
+        return zoom_level, tile_column, tile_row, None, 0, 0
+    # The tile_cache lookups made by func, counted in the worker process running it
+    hits, lookups = tile_cache.hits, tile_cache.lookups
+    try:
+        tile_data = zoom_funcs.get(zoom_level, func)(tile_data)
+    except Exception as e:
+        logger.error(f"Failed to transform tile {zoom_level}/{tile_column}/{tile_row}: {e}")
+        raise
+    return zoom_level, tile_column, tile_row, tile_data, tile_cache.hits - hits, tile_cache.lookups - lookups
+
+def transform_mbtiles(input_mbtiles, output_mbtiles, func, desc, workers=None, chunk_size=256, batch_size=10000,
+                      metadata=None, zoom_funcs=None, schema=None):
+    """Stream every tile of input_mbtiles through func (a picklable tile_data -> tile_data function), or through
+    zoom_funcs[zoom_level] for the zoom levels in the zoom_funcs dictionary, and write the results with the input
+    metadata, updated by the metadata dictionary (None values deleting the entry), to a fresh output_mbtiles.
+    The tiles are read in key order by a streaming cursor, transformed in chunks on a process pool with a bounded
+    number of chunks in flight, and written back in the same order by executemany batches, so the memory used
+    doesn't depend on the size of the file. The compression caches are per process, so identical tiles are also
+    deduplicated in the parent by TransformedTiles: each distinct input tile is sent to a single worker, once its
+    output is back. The hit ratio of the compression caches of the workers is logged.
+    schema is the schema of the output, 'flat' or 'dedup' (identical tiles stored once), that of the input if None.
+    A key stored more than once in an input without unique index is written once, with the last of its tiles. The
+    output is deleted if the transform fails, so that it can be run again."""
+    with MBTilesReader(input_mbtiles) as reader, \
+            MBTilesWriter(output_mbtiles, schema or reader.schema, batch_size=batch_size) as writer:
+        writer.update_metadata(reader.metadata())
+        writer.update_metadata(metadata or {})
+
+        cache_hits = cache_lookups = 0
+        transformed = TransformedTiles(zoom_funcs)
+        for z, x, y, tile_data, hits, lookups in tqdm(
+                map_many(partial(_transform_tile, func, zoom_funcs or {}), transformed.send(reader.tiles()),
+                         chunk_size=chunk_size, workers=workers),
+                total=reader.count(), desc=desc, unit="tile"):
+            writer.write_tile(z, x, y, transformed.receive(tile_data))
+            cache_hits += hits
+            cache_lookups += lookups
+
+        if writer.schema == 'dedup':
+            tiles, images = writer.count_images()
+            logger.info(f'{tiles} tiles stored as {images} distinct images.')
+    if transformed.reused:
+        logger.info(f'{transformed.reused} tiles reused the output of an identical tile.')
+    if cache_lookups:
+        logger.info(cache_summary(cache_hits, cache_lookups))
+
+def compress_mbtiles(input_mbtiles, output_mbtiles, codec='gzip', level=None, workers=None, train_dictionary=False,
+                     dictionary_size=DEFAULT_DICTIONARY_SIZE, samples=2000, policy=None, schema=None):
+    """Compress the tiles of input_mbtiles with codec at level to output_mbtiles.
+    With train_dictionary, a zstd dictionary of dictionary_size bytes is trained on samples tiles of the input, the
+    tiles are compressed with it and it is stored in the zstd_dictionary metadata.
+    policy is a {zoom_level: (codec, level)} dictionary overriding codec and level for these zoom levels, as
+    suggested by suggest_policy. schema is that of the output, as in transform_mbtiles."""
+    with MBTilesReader(input_mbtiles) as reader:
+        input_codec = reader.compression()
+        input_dictionary = reader.zstd_dictionary()
+        zoom_levels = reader.zoom_levels()
+    dictionary = None
+    if train_dictionary:
+        if codec != 'zstd':
+            raise ValueError(f"Only zstd supports dictionaries, {codec} provided.")
+        sampled = sample_tiles(input_mbtiles, samples, input_codec, input_dictionary)
+        logger.info(f'Training a zstd dictionary of {dictionary_size} bytes on {len(sampled)} tiles.')
+        dictionary = train_zstd_dictionary(sampled, dictionary_size)
+    func = partial(compress_tile_data, codec=codec, level=level, input_codec=input_codec, dictionary=dictionary,
+                   input_dictionary=input_dictionary)
+    zoom_funcs = {}
+    for zoom_level, (zoom_codec, zoom_level_compression) in (policy or {}).items():
+        zoom_funcs[zoom_level] = partial(compress_tile_data, codec=zoom_codec, level=zoom_level_compression,
+                                         input_codec=input_codec, input_dictionary=input_dictionary)
+    codecs = {zoom_codec for zoom_codec, _ in (policy or {}).values()}
+    if any(zoom_level not in zoom_funcs for zoom_level in zoom_levels):
+        codecs.add(codec)
+    # With several codecs, the readers detect the compression of each tile
+    transform_mbtiles(input_mbtiles, output_mbtiles, func, "Compressing tiles", workers=workers,
+                      metadata={'compression': codecs.pop() if len(codecs) == 1 else None,
+                                DICTIONARY_METADATA: encode_dictionary(dictionary) if dictionary else None},
+                      zoom_funcs=zoom_funcs, schema=schema)
+
+def default_matrix():
+    """Return the (codec, level) combinations benchmarked by default, for the available codecs."""
+    matrix = [('gzip', 1), ('gzip', 6), ('gzip', 9)]
+    for codec, levels in (('zstd', (1, 3, 9, 19)), ('brotli', (4, 9, 11))):
+        try:
+            check_codec(codec)
+        except ImportError:
+            continue
+        matrix.extend((codec, level) for level in levels)
+    return matrix
+
+def parse_matrix(text):
+    """Parse a 'codec:level,level codec:level' matrix, ex: 'gzip:6,9 zstd:3,19'."""
+    matrix = []
+    for item in text.split():
+        codec, _, levels = item.partition(':')
+        codec = check_codec(codec)
+        if codec is None:
+            raise ValueError(f"Invalid codec in {item!r}.")
+        for level in (levels.split(',') if levels else [DEFAULT_LEVELS[codec]]):
+            check_codec(codec, int(level))
+            matrix.append((codec, int(level)))
+    return matrix
+
+def benchmark_zoom(item):
+    """Compress and decompress the (zoom_level, tiles, matrix) item tiles with each (codec, level) of matrix.
+    Return (zoom_level, tile count, uncompressed size, results), results holding the compressed size and the
+    compression and decompression times in seconds of each combination."""
+    zoom_level, tiles, matrix = item
+    results = []
+    for codec, level in matrix:
+        start = time.perf_counter()
+        compressed = [compress(tile_data, codec, level) for tile_data in tiles]
+        compress_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for tile_data in compressed:
+            decompress(tile_data, codec)
+        decompress_time = time.perf_counter() - start
+        results.append({'codec': codec, 'level': level, 'size': sum(len(tile_data) for tile_data in compressed),
+                        'compress_time': compress_time, 'decompress_time': decompress_time})
+    return zoom_level, len(tiles), sum(len(tile_data) for tile_data in tiles), results
+
+def benchmark_compression(input_mbtiles, matrix, samples=200, workers=None):
+    """Benchmark the (codec, level) combinations of matrix on samples tiles of each zoom level of input_mbtiles,
+    the zoom levels being benchmarked in parallel. Return the list of benchmark_zoom results."""
+    with MBTilesReader(input_mbtiles) as reader:
+        input_codec = reader.compression()
+        input_dictionary = reader.zstd_dictionary()
+        zoom_levels = reader.zoom_levels()
+    items = ((zoom_level, sample_tiles(input_mbtiles, samples, input_codec, input_dictionary, zoom_level), matrix)
+             for zoom_level in zoom_levels)
+    return list(tqdm(map_many(benchmark_zoom, items, chunk_size=1, workers=workers), total=len(zoom_levels),
+                     desc="Benchmarking zoom levels", unit="zoom"))
+
+def _choose(results, hot, reference):
+    if hot:
+        # Compressed once and served many times: the smallest tiles, then the fastest to decompress
+        return min(results, key=lambda result: (result['size'], result['decompress_time']))
+    # Mostly served once: the fastest to compress among those at least as small as the reference
+    reference_size = next((result['size'] for result in results if (result['codec'], result['level']) == reference),
+                          None)
+    candidates = [result for result in results if reference_size is None or result['size'] <= reference_size]
+    return min(candidates or results, key=lambda result: result['compress_time'])
+
+def suggest_policy(benchmark, hot_zoom=8, reference=('gzip', 9)):
+    """Suggest a {zoom_level: (codec, level)} policy from benchmark_compression results.
+    The zoom levels up to hot_zoom, served many times, get the smallest tiles. The others get the fastest compression
+    producing tiles at least as small as the reference combination.
+    brotli tiles can't be told apart from their bytes, so brotli is only kept if it is chosen for every zoom level."""
+    choices = {}
+    for zoom_level, _, _, results in benchmark:
+        choices[zoom_level] = _choose(results, zoom_level <= hot_zoom, reference)
+    brotli_zooms = [zoom_level for zoom_level, result in choices.items() if result['codec'] == 'brotli']
+    if brotli_zooms and len(brotli_zooms) < len(choices):
+        for zoom_level, _, _, results in benchmark:
+            if zoom_level in brotli_zooms:
+                results = [result for result in results if result['codec'] != 'brotli'] or results
+                choices[zoom_level] = _choose(results, zoom_level <= hot_zoom, reference)
+    return {zoom_level: (result['codec'], result['level']) for zoom_level, result in choices.items()}
+
+def print_benchmark(benchmark, policy):
+    print(f"{'Zoom':<6} {'Tiles':>7} {'Codec':<8} {'Level':>5} {'Size':>12} {'Ratio':>7} "
+          f"{'Compress ms/tile':>17} {'Decompress ms/tile':>19}")
+    print("=" * 89)
+    for zoom_level, count, raw_size, results in benchmark:
+        for result in results:
+            chosen = ' *' if policy.get(zoom_level) == (result['codec'], result['level']) else ''
+            print(f"{zoom_level:<6} {count:>7} {result['codec']:<8} {result['level']:>5} {result['size']:>12} "
+                  f"{result['size'] / raw_size if raw_size else 0:>7.2%} "
+                  f"{1000 * result['compress_time'] / max(count, 1):>17.3f} "
+                  f"{1000 * result['decompress_time'] / max(count, 1):>19.3f}{chosen}")
+    print("\nSuggested policy (* above):")
+    for zoom_level, (codec, level) in policy.items():
+        print(f"  zoom {zoom_level}: {codec} level {level}")
 
 def main():
-    parser = argparse.ArgumentParser(description='Compress Vector MBTiles file with GZIP.')
+    parser = argparse.ArgumentParser(description='Compress Vector MBTiles file with GZIP, ZLIB, ZSTD or BROTLI.')
     parser.add_argument('input', help='Path to the input MBTiles file.')
     parser.add_argument('-o', '--output', help='Path to the output MBTiles file.')
+    parser.add_argument('-c', '--codec', choices=CODECS, default='gzip', help='Compression codec (default is gzip).')
+    parser.add_argument('-l', '--level', type=int,
+                        help='Compression level: 1-9 for gzip and zlib, 1-22 for zstd, 0-11 for brotli '
+                             '(default is 9 for gzip, 6 for zlib, 3 for zstd and 11 for brotli).')
+    parser.add_argument('-d', '--dictionary', action='store_true',
+                        help='Train a zstd dictionary on a sample of the tiles and compress the tiles with it, the '
+                             'dictionary being stored in the zstd_dictionary metadata (zstd only).')
+    parser.add_argument('--dictionary-size', type=int, default=DEFAULT_DICTIONARY_SIZE,
+                        help=f'Maximum size of the dictionary in bytes (default is {DEFAULT_DICTIONARY_SIZE}).')
+    parser.add_argument('--samples', type=int,
+                        help='Number of tiles sampled to train the dictionary (default is 2000), or per zoom level '
+                             'for the benchmark (default is 200).')
+    parser.add_argument('-b', '--benchmark', action='store_true',
+                        help='Benchmark a matrix of codecs and levels on a sample of each zoom level, print the '
+                             'compressed size, compression and decompression times and suggest a codec per zoom level.')
+    parser.add_argument('--matrix', help='Codecs and levels to benchmark, ex: "gzip:6,9 zstd:3,19" (default is gzip 1, 6 '
+                                         'and 9, zstd 1, 3, 9 and 19 and brotli 4, 9 and 11 when installed).')
+    parser.add_argument('--hot-zoom', type=int, default=8,
+                        help='The zoom levels up to hot-zoom, served many times, get the smallest tiles, the others '
+                             'the fastest compression as small as gzip 9 (default is 8).')
+    parser.add_argument('--apply', action='store_true', help='Compress the file with the suggested policy.')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Store identical tiles once, in map and images tables with a tiles view (default is the '
+                             'schema of the input).')
+    parser.add_argument('-w', '--workers', type=int, help='Number of worker processes (default is the number of CPUs). Identical tiles are compressed once across the workers.')
 
     args = parser.parse_args()
+    try:
+        check_codec(args.codec, args.level)
+        if args.dictionary and args.codec != 'zstd':
+            raise ValueError('Dictionaries are only supported by zstd, please add -c zstd.')
+        if args.dictionary and args.benchmark:
+            raise ValueError('The benchmark does not support dictionaries.')
+        matrix = parse_matrix(args.matrix) if args.matrix else default_matrix()
+    except (ValueError, ImportError) as e:
+        logger.error(e)
+        sys.exit(1)
     if not os.path.exists(args.input):
         logging.error('Input MBTiles file does not exist! Please recheck and input a correct file path.')
         sys.exit(1)
         
     input_file_abspath = os.path.abspath(args.input)
+    policy = None
+    if args.benchmark:
+        benchmark = benchmark_compression(input_file_abspath, matrix, samples=args.samples or 200,
+                                          workers=args.workers)
+        policy = suggest_policy(benchmark, hot_zoom=args.hot_zoom)
+        print_benchmark(benchmark, policy)
+        if not args.apply:
+            return
     # Determine the output filename
     if args.output:
         output_file_abspath = os.path.abspath(args.output)
@@ -137,8 +351,16 @@ def main():
     # Inform the user of the conversion
     is_vector, _ = check_vector(args.input)
     if is_vector:
-        logging.info(f'Compressing {input_file_abspath} to {output_file_abspath}.') 
-        compress_mbtiles(input_file_abspath, output_file_abspath)
+        codecs = sorted({codec for codec, _ in policy.values()}) if policy else [args.codec]
+        logging.info(f'Compressing {input_file_abspath} to {output_file_abspath} with {", ".join(codecs)}.') 
+        try:
+            compress_mbtiles(input_file_abspath, output_file_abspath, codec=args.codec, level=args.level,
+                             workers=args.workers, train_dictionary=args.dictionary,
+                             dictionary_size=args.dictionary_size, samples=args.samples or 2000, policy=policy,
+                             schema='dedup' if args.dedup else None)
+        except Exception as e:
+            logger.error(f'Failed to compress {input_file_abspath}, no output written: {e}')
+            sys.exit(1)
     else:
         logging.warning(f'mbtilescompress only supports vector MBTiles. {input_file_abspath} is not a vector MBTiles.')
         sys.exit(1)
@@ -1,118 +1,31 @@
 import argparse, sys, os
-import sqlite3
-import zlib
-import gzip
 import logging
-import shutil
-from tqdm import tqdm
+from functools import partial
 from vtiles.utils.geopreocessing import check_vector
+from vtiles.utils.compression import DICTIONARY_METADATA, decompress
+from vtiles.mbtiles.mbtilescompress import transform_mbtiles
+from vtiles.mbtiles.store import MBTilesReader
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def decompress_tile_data(tile_data):
-    try:
-        if tile_data[:2] == b'\x1f\x8b':  # Check for gzip magic number
-            tile_data = gzip.decompress(tile_data)
-        elif tile_data[:2] == b'\x78\x9c' or tile_data[:2] == b'\x78\x01' or tile_data[:2] == b'\x78\xda':
-            tile_data = zlib.decompress(tile_data) 
-    except Exception as e:
-        logging.error(f"Failed to decompress tile data: {e}")
-        return tile_data
-    return tile_data          
+def decompress_tile_data(tile_data, codec=None, dictionary=None):
+    """Decompress tile_data, codec is only needed for brotli tiles and dictionary for tiles compressed with a zstd
+    dictionary. A tile that can't be decompressed raises, so that no compressed tile is left in the output."""
+    return decompress(tile_data, codec, dictionary)
 
-def decompress_mbtiles(input_mbtiles, output_mbtiles, batch_size=10000):
-    shutil.copyfile(input_mbtiles, output_mbtiles)
-    
-    # Open the copied MBTiles file
-    conn = sqlite3.connect(output_mbtiles)
-    cursor = conn.cursor()
-
-    # Check if the tiles table is a view
-    cursor.execute("SELECT type FROM sqlite_master WHERE name='tiles'")
-    result = cursor.fetchone()
-
-    def process_tiles(tiles):
-        batch = []
-        for zoom_level, tile_column, tile_row, tile_data in tiles:
-            try:
-                decompressed_tile = decompress_tile_data(tile_data)
-                batch.append((decompressed_tile, zoom_level, tile_column, tile_row))
-            except Exception as e:
-                logging.error(f"Error decompressing tile {zoom_level}/{tile_column}/{tile_row}: {e}")
-            
-            # Commit batch once it reaches the batch_size
-            if len(batch) >= batch_size:
-                cursor.executemany(
-                    "UPDATE tiles SET tile_data = ? WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
-                    batch
-                )
-                conn.commit()  # Commit the batch
-                batch.clear()  # Clear batch
-
-        # Commit any remaining tiles in the batch
-        if batch:
-            cursor.executemany(
-                "UPDATE tiles SET tile_data = ? WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
-                batch
-            )
-            conn.commit()
-
-    if result and result[0] == 'view':
-        # Create a new table named tiles_new
-        cursor.execute("CREATE TABLE tiles_new (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
-        
-        # Select data from the view
-        cursor.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles ORDER BY zoom_level")
-        tiles = cursor.fetchall()
-        
-        batch = []
-        for zoom_level, tile_column, tile_row, tile_data in tqdm(tiles, desc="Decompressing tiles", unit="tile"):
-            try:
-                decompressed_tile = decompress_tile_data(tile_data)
-                batch.append((zoom_level, tile_column, tile_row, decompressed_tile))
-            except Exception as e:
-                logging.error(f"Error decompressing tile {zoom_level}/{tile_column}/{tile_row}: {e}")
-            
-            # Insert decompressed data in batches
-            if len(batch) >= batch_size:
-                cursor.executemany(
-                    "INSERT INTO tiles_new (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
-                    batch
-                )
-                conn.commit()  # Commit batch
-                batch.clear()  # Clear batch
-
-        # Commit remaining tiles in the batch
-        if batch:
-            cursor.executemany(
-                "INSERT INTO tiles_new (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
-                batch
-            )
-            conn.commit()
-
-        # Drop the view and rename the new table to tiles
-        cursor.execute("DROP VIEW tiles")
-        cursor.execute("ALTER TABLE tiles_new RENAME TO tiles")
-        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
-
-    else:
-        # Decompress tile data in the existing tiles table
-        cursor.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles ORDER BY zoom_level")
-        tiles = cursor.fetchall()
-        
-        # Process the tiles in batches
-        process_tiles(tqdm(tiles, desc="Decompressing tiles", unit="tile"))
-
-    # Commit and close connections
-    conn.commit()
-    conn.close()
+def decompress_mbtiles(input_mbtiles, output_mbtiles, workers=None):
+    with MBTilesReader(input_mbtiles) as reader:
+        func = partial(decompress_tile_data, codec=reader.compression(), dictionary=reader.zstd_dictionary())
+    transform_mbtiles(input_mbtiles, output_mbtiles, func, "Decompressing tiles", workers=workers,
+                      metadata={'compression': None, DICTIONARY_METADATA: None})
 
 
 def main():
     parser = argparse.ArgumentParser(description='Decompress an MBTiles file.')
     parser.add_argument('input', help='Path to the input MBTiles file.')
     parser.add_argument('-o', '--output', help='Path to the output MBTiles file.')
+    parser.add_argument('-w', '--workers', type=int, help='Number of worker processes (default is the number of CPUs). Identical tiles are decompressed once across the workers.')
 
     args = parser.parse_args()
     if not os.path.exists(args.input):
@@ -141,7 +54,11 @@ def main():
     is_vector, _ = check_vector(args.input)
     if is_vector:
         logging.info(f'Decompressing {input_file_abspath} to {output_file_abspath}.') 
-        decompress_mbtiles(input_file_abspath, output_file_abspath)
+        try:
+            decompress_mbtiles(input_file_abspath, output_file_abspath, workers=args.workers)
+        except Exception as e:
+            logger.error(f'Failed to decompress {input_file_abspath}, no output written: {e}')
+            sys.exit(1)
     else:
         logging.warning(f'mbtilesdecompress only supports vector MBTiles. {input_file_abspath} is not a vector MBTiles.')
         sys.exit(1)
@@ -3,6 +3,7 @@ import shutil
 import sqlite3
 import argparse
 import logging
+from vtiles.utils.mbtilesschema import drop_tiles_schema
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -24,7 +25,8 @@ def remove_duplicates(input_mbtiles, output_mbtiles):
 
             # Step 1: Create a temporary table from the view
             cursor.execute("CREATE TABLE IF NOT EXISTS temp_tiles AS SELECT * FROM tiles")
-            cursor.execute("DROP VIEW IF EXISTS tiles")
+            # Drop the view with the map and images tables behind it
+            drop_tiles_schema(cursor)
         else:
             logging.info("'tiles' is a table. Proceeding with the table directly.")
             cursor.execute("ALTER TABLE tiles RENAME TO temp_tiles")
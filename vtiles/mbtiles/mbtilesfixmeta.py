@@ -3,46 +3,45 @@
 # https://github.com/mapbox/tippecanoe/blob/master/main.cpp#L2033
 
 import os,sys, sqlite3, json
-from vtiles.utils.geopreocessing import check_vector, determine_tileformat,\
-                                         get_zoom_levels,get_bounds_center, decode_tile_data
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from vtiles.utils.geopreocessing import summarize_tile_data
+from functools import partial
+from vtiles.utils.mapbox_vector_tile import map_many
+from vtiles.mbtiles.store import MBTilesReader
+from vtiles.mbtiles.profile import TilesetProfile
 from tqdm import tqdm
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_layer_fields(layer_data):
-    """Extract field types from layer data."""
-    fields = {}
-    for feature in layer_data['features']:
-        for key, value in feature['properties'].items():
-            if key not in fields:  # Only add if not already present
-                fields[key] = type(value).__name__  # Store the type of each field
-    return fields
-
-def decode_tile_batch(tile_batch, zoom_level):
-    """Decode a batch of tiles and extract layer information."""
+def decode_tile_batch(tile_batch, dictionary=None):
+    """Summarize a batch of (zoom_level, tile_column, tile_row, tile_data) tiles and extract layer information."""
     layers = {}
     
-    for tile_data_tuple in tile_batch:
-        tile_data = tile_data_tuple[0]  # Extract tile data from the tuple
-        decoded_tile = decode_tile_data(tile_data)
-        if decoded_tile:  # Ensure decoded_tile is valid
-            for layer_name, layer_data in decoded_tile.items():
+    for tile_zoom, _, _, tile_data in tile_batch:
+        # Only layer names, keys and value types are read, geometries are not decoded
+        tile_summary = summarize_tile_data(tile_data, dictionary=dictionary)
+        if tile_summary:  # Ensure tile_summary is valid
+            for layer_name, layer_summary in tile_summary.items():
                 if layer_name not in layers:
                     # Initialize minzoom and maxzoom
                     layers[layer_name] = {
-                        "fields": extract_layer_fields(layer_data),
-                        "minzoom": zoom_level,
-                        "maxzoom": zoom_level,
+                        "fields": dict(layer_summary['fields']),
+                        "minzoom": tile_zoom,
+                        "maxzoom": tile_zoom,
                     }
                 else:
-                    # Update maxzoom for the layer if it appears in a new zoom level
-                    layers[layer_name]["maxzoom"] = max(layers[layer_name]["maxzoom"], zoom_level)
+                    # Add fields not seen yet and update minzoom and maxzoom for the layer
+                    for key, type_name in layer_summary['fields'].items():
+                        layers[layer_name]["fields"].setdefault(key, type_name)
+                    layers[layer_name]["minzoom"] = min(layers[layer_name]["minzoom"], tile_zoom)
+                    layers[layer_name]["maxzoom"] = max(layers[layer_name]["maxzoom"], tile_zoom)
 
     return layers  
 
+def _decode_tile_batch(tile_batch, dictionary=None):
+    return decode_tile_batch(tile_batch, dictionary), len(tile_batch)
+
 def merge_layer_dicts(layers_accumulated, new_layers):
     """Merge two dictionaries of layers."""
     for name, layer in new_layers.items():
@@ -57,38 +56,23 @@ def merge_layer_dicts(layers_accumulated, new_layers):
 
 def get_layers_from_all_tiles_parallel(mbtiles_file, batch_size=10000, workers=4):
     """Extract layer information from all tiles in the MBTiles file."""
-    conn = sqlite3.connect(mbtiles_file)
-    cursor = conn.cursor()
+    reader = MBTilesReader(mbtiles_file)
 
-    # Query the total number of tiles to set up progress tracking
-    cursor.execute("SELECT COUNT(*) FROM tiles")
-    total_tiles = cursor.fetchone()[0]
+    # Count the tiles on the index to set up progress tracking
+    total_tiles = reader.count()
 
     layers = {}
-    offset = 0
+    dictionary = reader.zstd_dictionary()
 
     with tqdm(total=total_tiles, desc="Processing tiles") as pbar:
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            futures = []
-            # Process tiles in parallel batches
-            while offset < total_tiles:
-                cursor.execute("""SELECT tile_data, zoom_level FROM tiles ORDER BY zoom_level LIMIT ? OFFSET ?""", (batch_size, offset))
-                tile_batch = cursor.fetchall()
-                # Submit a batch for parallel decoding, along with the zoom level
-                zoom_level = tile_batch[0][1] if tile_batch else None  # Get the zoom level from the first tile in the batch
-                futures.append(executor.submit(decode_tile_batch, tile_batch, zoom_level))
-                
-                # Update offset for the next batch
-                offset += batch_size
-            
-            # As tasks complete, update progress and collect layer names
-            for future in as_completed(futures):
-                new_layers = future.result()  # This should return a dictionary
-                merge_layer_dicts(layers, new_layers)
-                pbar.update(batch_size)  
-
-    cursor.close()
-    conn.close()
+        # Stream the tiles in batches from one cursor, at most 2 batches per worker being in flight
+        batches = reader.tile_batches(batch_size, ordered=False)
+        for new_layers, batch_length in map_many(partial(_decode_tile_batch, dictionary=dictionary), batches,
+                                                 chunk_size=1, workers=workers):
+            merge_layer_dicts(layers, new_layers)
+            pbar.update(batch_length)
+
+    reader.close()
     
     # Format the layers into a JSON-compatible structure
     json_output = {
@@ -104,7 +88,10 @@ def get_layers_from_all_tiles_parallel(mbtiles_file, batch_size=10000, workers=4
         })
     return json_output
 
-def fix_vectormetadata(input_mbtiles, compression_type, desc):
+def fix_vectormetadata(input_mbtiles, compression_type, desc, profile=None):
+    # Zoom range, bounds and center come from the profile of the file, scanned here if the caller has none
+    if profile is None:
+        profile = TilesetProfile.scan(input_mbtiles)
     conn = sqlite3.connect(input_mbtiles)       
     cursor = conn.cursor()
     cursor.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);')
@@ -123,12 +110,12 @@ def fix_vectormetadata(input_mbtiles, compression_type, desc):
     cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", ('compression', compression_type))
     
     # Update min zoom, max zoom
-    min_zoom, max_zoom = get_zoom_levels(input_mbtiles)
+    min_zoom, max_zoom = profile.zoom_range()
     cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", ('minzoom', min_zoom))
     cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", ('maxzoom', max_zoom))
 
     # Update bounds and center
-    bounds, center = get_bounds_center(input_mbtiles)
+    bounds, center = profile.bounds_center()
     if bounds:
         cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", ('bounds', bounds))
     if center:
@@ -145,10 +132,15 @@ def fix_vectormetadata(input_mbtiles, compression_type, desc):
 
     conn.commit()
     conn.close() 
+    # The tiles are unchanged, the profile is cached again with the new modification time of the file
+    profile.save(input_mbtiles)
 
     logger.info(f'Fix metadata for {name} done!')
 
-def fix_rastermetadata(input_mbtiles, format,desc):
+def fix_rastermetadata(input_mbtiles, format,desc, profile=None):
+    # Zoom range, bounds and center come from the profile of the file, scanned here if the caller has none
+    if profile is None:
+        profile = TilesetProfile.scan(input_mbtiles)
     conn = sqlite3.connect(input_mbtiles)       
     cursor = conn.cursor()
     cursor.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);')
@@ -164,18 +156,20 @@ def fix_rastermetadata(input_mbtiles, format,desc):
 
   
     # Update min zoom, max zoom
-    min_zoom, max_zoom = get_zoom_levels(input_mbtiles)
+    min_zoom, max_zoom = profile.zoom_range()
     cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", ('minzoom', min_zoom))
     cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", ('maxzoom', max_zoom))
 
     # Update bounds and center
-    bounds, center = get_bounds_center(input_mbtiles)
+    bounds, center = profile.bounds_center()
     if bounds:
         cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", ('bounds', bounds))
     if center:
         cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", ('center', center))
     conn.commit()
     conn.close() 
+    # The tiles are unchanged, the profile is cached again with the new modification time of the file
+    profile.save(input_mbtiles)
 
 def main():
     if len(sys.argv) != 2:
@@ -184,13 +178,12 @@ def main():
     input_mbtiles = sys.argv[1]
     
     if (os.path.exists(input_mbtiles)):
-        is_vector, compression_type = check_vector(input_mbtiles) 
-        tile_format = determine_tileformat(input_mbtiles)
+        profile = TilesetProfile.load(input_mbtiles)
         desc = 'Update metadata by vtiles.mbtiles.mbtilesfixmeta' 
-        if is_vector:
-            fix_vectormetadata(input_mbtiles, compression_type,desc)   
+        if profile.is_vector:
+            fix_vectormetadata(input_mbtiles, profile.compression_type, desc, profile)
         else:
-            fix_rastermetadata(input_mbtiles, tile_format,desc)        
+            fix_rastermetadata(input_mbtiles, profile.tile_format, desc, profile)
     else: 
         logger.error ('MBTiles file does not exist!. Please recheck and input a correct file path.')
         sys.exit(1)
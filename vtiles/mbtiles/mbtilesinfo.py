@@ -1,55 +1,41 @@
 import sqlite3, json
 import os, sys, datetime
 from vtiles.utils.geopreocessing import check_vector,count_tiles
+from vtiles.mbtiles.store import MBTilesReader, open_reader
 
 # Read vector metadata
 def read_vector_metadata(mbtiles):
     try:
         """Read metadata from vector MBTiles file."""
-        connection = sqlite3.connect(mbtiles)
-        cursor = connection.cursor()
-        # Extract metadata
-        # cursor.execute("SELECT name, value FROM metadata where name <>'json'")
-        cursor.execute("SELECT name, value FROM metadata where name <> 'json'")
-        metadata = dict(cursor.fetchall())     
+        with open_reader(mbtiles) as reader:
+            # Extract metadata
+            metadata = reader.metadata()
+        metadata.pop('json', None)
         return metadata
     except sqlite3.Error as e:
             print(f"error reading metadata: {e}")
             print(f"Please use mbtilesfixmeta to create metadata or use mbtilesinspect")
             return None
-    finally:
-        cursor.close()
-        connection.close()  
 
 # Read raster metadata
 def read_raster_metadata(mbtiles):
     try:
         """Read metadata from raster MBTiles file."""
-        connection = sqlite3.connect(mbtiles)
-        cursor = connection.cursor()
-        # Extract metadata
-        cursor.execute("SELECT name, value FROM metadata")
-        metadata = dict(cursor.fetchall())
-        return metadata
+        with open_reader(mbtiles) as reader:
+            # Extract metadata
+            return reader.metadata()
     except sqlite3.Error as e:
         print(f"error reading metadata: {e}")
         print(f"Please use mbtilesfixmeta to create metadata or use mbtilesinspect")
         return None
-    finally:
-        cursor.close()
-        connection.close() 
 
 # list all vector layers
 def read_vector_layers(mbtiles):    
-    connection = sqlite3.connect(mbtiles)
-    cursor = connection.cursor()
-    
     # Fetch the JSON from the metadata
-    cursor.execute("SELECT value FROM metadata WHERE name = 'json'")
-    row = cursor.fetchone()
+    with open_reader(mbtiles) as reader:
+        json_content = reader.metadata_value('json')
     
-    if row is not None:
-        json_content = row[0]
+    if json_content is not None:
         try:
             layers_json = json.loads(json_content)
             # Print vector layers information
@@ -102,8 +88,6 @@ def read_vector_layers(mbtiles):
         #                     print(f"      Type: {attr_type}")
         #                     print(f"      Values: {attr_values}")
         #                     print(" ")            
-    cursor.close()
-    connection.close()
    
 def main():
     if len(sys.argv) != 2:
@@ -121,27 +105,29 @@ def main():
     # print("Date created: ", file_created)
     print("Last modified: ", file_last_modified)
     if (os.path.exists(mbtiles)):
-        is_vector, _ = check_vector(mbtiles) 
-        num_tiles = count_tiles(mbtiles)
+        reader = MBTilesReader(mbtiles)
+        is_vector, _ = check_vector(reader) 
+        num_tiles = count_tiles(reader)
         if is_vector: # vector
-            metadata = read_vector_metadata(mbtiles)
+            metadata = read_vector_metadata(reader)
             if metadata:      
                 print("######")
                 print("Metadata:")
                 for key, value in metadata.items():
                     print(f"{key}: {value}")
-                read_vector_layers(mbtiles)
+                read_vector_layers(reader)
             print('######')
             print(f"Total number of tiles: {num_tiles}")
             
         else:
-            metadata = read_raster_metadata(mbtiles)   
+            metadata = read_raster_metadata(reader)   
             if metadata:         
                 print("###### Metadata:")
                 for key, value in metadata.items():
                     print(f"{key}: {value}")
             print("######")
             print(f"Total number of tiles: {num_tiles}")
+        reader.close()
     else: 
         print ('MBTiles file does not exist!. Please recheck and input a correct file path.')
         return
@@ -1,10 +1,10 @@
-import sqlite3
 import os, sys, argparse, textwrap
-from vtiles.utils.geopreocessing import check_vector, determine_tileformat,\
-                                        count_tiles, count_tiles_for_each_zoom,\
-                                        get_zoom_levels,get_bounds_center,find_duplicates,\
-                                        get_standard_tile_count, decode_tile_data
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from vtiles.utils.geopreocessing import get_standard_tile_count, summarize_tile_data
+from functools import partial
+import math
+from vtiles.utils.mapbox_vector_tile import map_many
+from vtiles.mbtiles.store import MBTilesReader, open_reader
+from vtiles.mbtiles.profile import TilesetProfile
 import logging
 from tqdm import tqdm
 import texttable as tt
@@ -12,31 +12,33 @@ import texttable as tt
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def inspect_mbtiles(mbtiles):
-    is_vector, compression_type = check_vector(mbtiles) 
-    tile_format = determine_tileformat(mbtiles)
-    min_zoom, max_zoom = get_zoom_levels(mbtiles)
-    tile_count = count_tiles(mbtiles)
-    bounds, center = get_bounds_center(mbtiles)
+def inspect_mbtiles(mbtiles, refresh=False):
+    # Format, zooms, counts, bounds and duplicates come from one profile, cached in the metadata of the file
+    profile = TilesetProfile.load(mbtiles, refresh)
+    is_vector, compression_type = profile.is_vector, profile.compression_type
+    min_zoom, max_zoom = profile.zoom_range()
+    bounds, center = profile.bounds_center()
     print(f"Min zoom level: {min_zoom}")
     print(f"Max zoom level: {max_zoom}")
-    print(f"Total number of tiles: {tile_count}")
+    print(f"Total number of tiles: {profile.tile_count}")
     print(f"Bounds: {bounds}")
     print(f"Center: {center}")
-    print(f"Tile format: {tile_format}")
+    print(f"Tile format: {profile.tile_format}")
     print(f"Compression type: {compression_type}")
 
     print("\nTile counts for each zoom level:")
-    tile_count_zoom = count_tiles_for_each_zoom(mbtiles)
     # Print results with standard number of tiles
-    print(f"{'Zoom Level':<12} {'Actual Tile Count':<20} {'Standard Tile Count':<20} {'Matches Standard'}")
-    print("="*62)
-    for zoom_level, actual_tile_count in tile_count_zoom:
+    # The bounds of each zoom level come from the column and row ranges of the profile
+    bounds_by_zoom = profile.bounds_by_zoom()
+    print(f"{'Zoom Level':<12} {'Actual Tile Count':<20} {'Standard Tile Count':<20} {'Matches Standard':<18} {'Bounds'}")
+    print("="*120)
+    for zoom_level, actual_tile_count in profile.count_by_zoom():
         standard_tile_count = get_standard_tile_count(zoom_level)
         matches_standard = "Yes" if actual_tile_count == standard_tile_count else "No"
-        print(f"{zoom_level:<12} {actual_tile_count:<20} {standard_tile_count:<20} {matches_standard}")
+        zoom_bounds = ','.join(f'{coordinate:.6f}' for coordinate in bounds_by_zoom[zoom_level])
+        print(f"{zoom_level:<12} {actual_tile_count:<20} {standard_tile_count:<20} {matches_standard:<18} {zoom_bounds}")
     
-        duplicates, total_duplicates= find_duplicates(mbtiles)
+    duplicates, total_duplicates = profile.duplicates, profile.total_duplicates
     
     # Print duplicates
     print(f"\nTotal number of duplicate rows: {total_duplicates}")
@@ -64,58 +66,44 @@ def inspect_mbtiles(mbtiles):
 
 
 # Function to process a batch of tiles and extract unique layers
-def process_tile_batch(tile_batch):
+def process_tile_batch(tile_batch, dictionary=None):
     layers = set()
-    for tile_column, tile_row, tile_data in tile_batch:
-        # Decode the vector tile using mapbox_vector_tile
-        decoded_tile = decode_tile_data(tile_data)
+    for zoom_level, tile_column, tile_row, tile_data in tile_batch:
+        # Read the layer names from the tile header, geometries are not decoded
+        tile_summary = summarize_tile_data(tile_data, dictionary=dictionary)
         # Add all the layer names to the set
-        layers.update(decoded_tile.keys())
+        if tile_summary:
+            layers.update(tile_summary.keys())
     
     return layers
 
 # Function to process all zoom levels in parallel and accumulate results
 def list_layers_for_all_zoom_levels_parallel(mbtiles_file, batch_size=10000, workers=4):
-    # Connect to the MBTiles file (SQLite database)
-    conn = sqlite3.connect(mbtiles_file)
-    cursor = conn.cursor()
-
-    # Query distinct zoom levels from the tiles table
-    cursor.execute("SELECT DISTINCT zoom_level FROM tiles ORDER BY zoom_level")
-    zoom_levels = cursor.fetchall()
-
-    # Dictionary to accumulate results for each zoom level
-    results = {}
-
-    # Iterate through each zoom level
-    for zoom_level_tuple in zoom_levels:
-        zoom_level = zoom_level_tuple[0]
-
-        # Query the tiles for the current zoom level
-        cursor.execute("SELECT tile_column, tile_row, tile_data FROM tiles WHERE zoom_level = ?", (zoom_level,))
-        tiles = cursor.fetchall()
-
-        # Split tiles into batches of `batch_size`
-        batches = [tiles[i:i + batch_size] for i in range(0, len(tiles), batch_size)]
-
-        # Initialize a set to hold unique layers for this zoom level
-        layers = set()
-
-        # Use ProcessPoolExecutor for parallel processing
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            futures = {executor.submit(process_tile_batch, batch): batch for batch in batches}
-
-            # Use tqdm for progress tracking
-            for future in tqdm(as_completed(futures), total=len(batches), desc=f"Processing Zoom {zoom_level}"):
+    # Open the MBTiles file, or use the reader of the caller
+    with open_reader(mbtiles_file) as reader:
+        # Dictionary to accumulate results for each zoom level
+        results = {}
+        dictionary = reader.zstd_dictionary()
+
+        # Iterate through each zoom level
+        for zoom_level, tile_count in reader.count_by_zoom():
+            # Stream the tiles of the current zoom level in batches of `batch_size`, at most 2 batches per worker
+            # being in memory at once
+            batches = reader.tile_batches(batch_size, zoom_level, ordered=False)
+            total_batches = math.ceil(tile_count / batch_size)
+
+            # Initialize a set to hold unique layers for this zoom level
+            layers = set()
+
+            # Process the batches in parallel, with tqdm for progress tracking
+            for batch_layers in tqdm(map_many(partial(process_tile_batch, dictionary=dictionary), batches,
+                                              chunk_size=1, workers=workers),
+                                     total=total_batches, desc=f"Processing Zoom {zoom_level}"):
                 # Add the layers from the processed batch to the main set
-                layers.update(future.result())
-
-        # Store the sorted layer list for this zoom level
-        results[zoom_level] = sorted(layers)
+                layers.update(batch_layers)
 
-    # Close the database connection
-    cursor.close()
-    conn.close()
+            # Store the sorted layer list for this zoom level
+            results[zoom_level] = sorted(layers)
 
         # Function to format the layers list into multiple lines based on max width
     def format_layer_list(layer_list, max_width):
@@ -147,12 +135,16 @@ def list_layers_for_all_zoom_levels_parallel(mbtiles_file, batch_size=10000, wor
 def main():
     parser = argparse.ArgumentParser(description='Inspect MBTiles file with analyzing tile_data in tiles table.')
     parser.add_argument('input', help='Path to the MBTiles file.')
+    parser.add_argument('--rescan', action='store_true',
+                        help='Scan the tiles again instead of reading the profile cached by a previous run.')
 
     args = parser.parse_args()
     mbtiles = args.input
 
     if (os.path.exists(mbtiles)):
-       inspect_mbtiles(mbtiles)       
+       # One reader shared by all the helpers instead of a connection each
+       with MBTilesReader(mbtiles) as reader:
+           inspect_mbtiles(reader, args.rescan)
     else: 
         logger.error ('MBTiles file does not exist!. Please recheck and input a correct file path.')
         sys.exit(1)
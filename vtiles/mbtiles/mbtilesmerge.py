@@ -1,10 +1,13 @@
-import sqlite3
 import os, sys
-import shutil
-from vtiles.utils.mapbox_vector_tile import encode, decode
-from vtiles.utils.geopreocessing import fix_wkt, check_vector
+import heapq
+from itertools import groupby
+from operator import itemgetter
+from vtiles.utils.mapbox_vector_tile.wire import merge_tiles as merge_wire_tiles
+from vtiles.utils.geopreocessing import check_vector
+from vtiles.utils.compression import (CompressionCache, DICTIONARY_METADATA, decompress, detect_compression,
+                                      tile_cache, uses_dictionary)
+from vtiles.mbtiles.store import MBTilesReader, MBTilesWriter
 import argparse
-import gzip, zlib
 import json
 import logging
 from tqdm import tqdm
@@ -13,71 +16,38 @@ from vtiles.mbtiles.mbtilesfixmeta import fix_vectormetadata
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def merge_json_layers(layer1, layer2):
-    # Create a dictionary to combine features by layer name
-    combined_layer = {}
-    
-    # Add features from the first JSON data
-    for layer in layer1:
-        name = layer['name']
-        if name not in combined_layer:
-            combined_layer[name] = layer
-        else:
-            combined_layer[name]['features'].extend(layer['features'])
-
-    # Add features from the second JSON data
-    for layer in layer2:
-        name = layer['name']
-        if name not in combined_layer:
-            combined_layer[name] = layer
-        else:
-            combined_layer[name]['features'].extend(layer['features'])
-
-    # Convert combined data to a list
-    merged_layer= list(combined_layer.values())
-    
-    return merged_layer
-
-def merge_tiles(tile1, tile2,z=None, x=None, y=None):
-    try:        
-        if tile1 and tile2:
-            if tile1[:2] == b'\x1f\x8b':
-                tile1 = gzip.decompress(tile1)
-            elif tile1[:2] == b'\x78\x9c' or tile1[:2] == b'\x78\x01' or tile1[:2] == b'\x78\xda':
-                tile1 = zlib.decompress(tile1)
-            decoded_tile1 = decode(tile1)
-            decoded_tile1_fixed = fix_wkt(decoded_tile1)
-
-            if tile2[:2] == b'\x1f\x8b':
-                tile2 = gzip.decompress(tile2)
-            elif tile2[:2] == b'\x78\x9c' or tile2[:2] == b'\x78\x01' or tile2[:2] == b'\x78\xda':
-                tile2 = zlib.decompress(tile2)
-            decoded_tile2 = decode(tile2)
-            decoded_tile2_fixed = fix_wkt(decoded_tile2)
-
-            merged_layer = merge_json_layers(decoded_tile1_fixed,decoded_tile2_fixed)
-            # print (merged_tiles)
-            merged_tile_encoded = encode(merged_layer)
-            merged_tile_encoded_gzip = gzip.compress(merged_tile_encoded)   
-            return merged_tile_encoded_gzip
-                
-        elif tile1:
-            if tile1[:2] == b'\x1f\x8b':
-                return tile1
-            elif tile1[:2] == b'\x78\x9c' or tile1[:2] == b'\x78\x01' or tile1[:2] == b'\x78\xda':
-                tile1_decompressed_zlib = zlib.decompress(tile1)
-                return gzip.compress(tile1_decompressed_zlib)
-            else: return  gzip.compress(tile1)   
-        
-        elif tile2:
-            if tile2[:2] == b'\x1f\x8b':
-                return tile2
-            elif tile2[:2] == b'\x78\x9c' or tile2[:2] == b'\x78\x01' or tile2[:2] == b'\x78\xda':
-                tile2_decompressed_zlib = zlib.decompress(tile2)
-                return gzip.compress(tile2_decompressed_zlib)     
-            else: return  gzip.compress(tile2) 
-    except Exception as e:
-        return None
+def merge_tiles(tiles, output_codec='gzip', cache=tile_cache):
+    """Merge tiles, a list of (tile_data, codec, dictionary) of the same key in file order, into one tile compressed
+    with output_codec, codec being the compression of the MBTiles file of the tile, only needed for brotli tiles, and
+    dictionary its zstd dictionary. A single tile already compressed with output_codec, without a dictionary, is kept
+    as is."""
+    if len(tiles) == 1:
+        tile_data, codec, dictionary = tiles[0]
+        if codec == output_codec and not uses_dictionary(tile_data) and \
+                (codec == 'brotli' or detect_compression(tile_data) == output_codec):
+            return tile_data
+    # Concatenate the layers at the wire level, geometries are copied byte for byte, or rescaled to the
+    # larger extent of two same-named layers
+    merged_tile = None
+    for tile_data, codec, dictionary in tiles:
+        tile_data = decompress(tile_data, codec, dictionary)
+        merged_tile = tile_data if merged_tile is None else merge_wire_tiles(merged_tile, tile_data)
+    # Identical merged tiles are compressed once
+    return cache.compress(merged_tile, output_codec)
+
+def tagged_tiles(reader, index):
+    # The tiles of reader with the index of reader, to decompress them with its codec and dictionary once merged
+    for z, x, y, tile_data in reader.tiles():
+        yield z, x, y, tile_data, index
+
+def output_compression(reader):
+    """Return the codec of the merged file: the compression of the first MBTiles file, from its metadata or its
+    first tile, gzip if it is not compressed."""
+    codec = reader.compression()
+    if codec is None:
+        first_tile = reader.first_tile()
+        codec = detect_compression(first_tile) if first_tile else None
+    return codec or 'gzip'
 
 def merge_vector_layers(layer1, layer2):
     layer1_ids = {layer['id'] for layer in layer1}
@@ -207,157 +177,113 @@ def get_center_of_bound(bounds_str):
         logging.error(f"Get center of bound error: {e}")
         return ''
         
-def merge_mbtiles(input_mbtiles, output_mbtiles):   
+def merge_metadata_values(merged_metadata):
+    """Reduce the '; ' joined zoom levels, bounds and center of merged_metadata to the values of the merged file."""
+    # Update format
+    if 'format' in merged_metadata:
+        merged_metadata['format'] = 'pbf'
+
+    # Update minzoom
+    if merged_metadata.get('minzoom'):
+        merged_metadata['minzoom'] = get_min_zoom(merged_metadata['minzoom'])
+
+    # Update maxzoom
+    max_zoom = 0
+    if merged_metadata.get('maxzoom'):
+        max_zoom = get_max_zoom(merged_metadata['maxzoom'])
+        merged_metadata['maxzoom'] = max_zoom
+
+    # Update max bounds
+    if merged_metadata.get('bounds'):
+        merged_metadata['bounds'] = get_max_bound(merged_metadata['bounds'])
+
+    # Update center
+    if 'center' in merged_metadata:
+        center = get_center_of_bound(merged_metadata.get('bounds') or '')
+        merged_metadata['center'] = center + f',{max_zoom}' if center != '' else ''
+
+    # Update description
+    merged_metadata['description'] = 'Merge multiple MBTiles files into a single MBTiles file using mbtilesmerge from vtiles'
+    return merged_metadata
+
+def merge_mbtiles(input_mbtiles, output_mbtiles, schema='flat', batch_size=10000):   
+    """Merge the vector MBTiles files input_mbtiles into output_mbtiles, compressed as the first file. schema is
+    'flat' for a tiles table, 'dedup' for map and images tables with a tiles view. Return True on success; on
+    failure, the error is logged and no output is left."""
     is_vector, compression_type = check_vector(input_mbtiles[0]) 
     if is_vector:
         fix_vectormetadata(input_mbtiles[0], compression_type,'')   
-        shutil.copyfile(input_mbtiles[0], output_mbtiles)
+        readers = []
         try:
-            conn_out = sqlite3.connect(output_mbtiles)       
-            cur_out = conn_out.cursor()
-            cur_out.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)')
-            cur_out.execute('DROP TABLE IF EXISTS tiles_new;')
-            cur_out.execute('CREATE TABLE tiles_new (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))')
-            cur_out.execute('''
-                INSERT INTO tiles_new (zoom_level, tile_column, tile_row, tile_data)
-                SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles;
-                ''')
-            
-            cur_out.execute("SELECT type FROM sqlite_master WHERE name='tiles'")  
-            result = cur_out.fetchone()
-            if result:
-                if result[0] == 'view':
-                    cur_out.execute('DROP VIEW tiles')
-                elif result[0] == 'table':
-                    cur_out.execute('DROP TABLE tiles')
-            cur_out.execute('ALTER TABLE tiles_new RENAME TO tiles')
-            cur_out.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+            readers = [MBTilesReader(mbtiles) for mbtiles in input_mbtiles]
             
             # Merging tiles   
-            cur_out.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles ORDER BY zoom_level')          
-            output_rows = cur_out.fetchall()
-            tiles = {}
-
-            for (z, x, y, tile) in output_rows:
-                key = (z, x, y)
-                tiles[key] = tile
-            
-            connections = [sqlite3.connect(mbtiles) for mbtiles in input_mbtiles]
-            cursors_in = [conn.cursor() for conn in connections]
-            for i, cursor in enumerate(cursors_in):
+            merged_readers = [readers[0]]
+            for i, reader in enumerate(readers):
                 if i == 0:
-                    continue  # Skip the cursor for the first MBTiles file     
-                is_vector, compression_type = check_vector(input_mbtiles[0]) 
+                    continue  # Skip the reader of the first MBTiles file     
+                is_vector, compression_type = check_vector(reader) 
                 if is_vector:
                     fix_vectormetadata(input_mbtiles[i], compression_type,'')
-                    mbtiles_name = os.path.basename(input_mbtiles[i])
-                    cursor.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles ORDER BY zoom_level')
-                    rows = cursor.fetchall()
-                    for (z, x, y, tile) in tqdm(rows, desc=f"Processing tiles from {mbtiles_name}"):
-                        key = (z, x, y)
-                        if key in tiles:
-                            tiles[key] = merge_tiles(tiles[key], tile, z, x, y)
-                        else:
-                            tiles[key] = tile
-
-            for key, tile in tqdm(tiles.items(), desc="Inserting merged tiles"):
-                cur_out.execute('INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)', (key[0], key[1], key[2], tile))
-            conn_out.commit()
-            print(f"Successfully merged MBTiles files into {output_mbtiles}")
-        except Exception as e:
-            logging.error(f"Error Merging tile_data {mbtiles_name}: {e}")
-        
-        try: 
-            # Merging metadata
-            metadata_dicts = []
-            for i, cursor in enumerate(cursors_in):
-                mbtiles_name = os.path.basename(input_mbtiles[i])  
-                cursor.execute('SELECT name, value FROM metadata')
-                metadata_dicts.append({name: value for name, value in cursor.fetchall()})
-
-            merged_metadata = merge_metadata(metadata_dicts)
+                    merged_readers.append(reader)
+
+            # Each file is decompressed with its own codec and dictionary, the merged tiles are compressed as the
+            # first file
+            codecs = [(reader.compression(), reader.zstd_dictionary()) for reader in merged_readers]
+            output_codec = output_compression(merged_readers[0])
+
+            # The output is deleted if a tile can't be merged
+            with MBTilesWriter(output_mbtiles, schema, batch_size=batch_size) as writer:
+                # The inputs are streamed in key order and merged as sorted streams, so only the tiles of the current
+                # key are in memory. heapq.merge keeps the input order for equal keys: the tiles are merged in file
+                # order.
+                streams = heapq.merge(*(tagged_tiles(reader, i) for i, reader in enumerate(merged_readers)),
+                                      key=itemgetter(0, 1, 2))
+                total_tiles = sum(reader.count() for reader in merged_readers)
+                cache = CompressionCache()
+                with tqdm(total=total_tiles, desc="Merging tiles") as pbar:
+                    for (z, x, y), key_tiles in groupby(streams, key=itemgetter(0, 1, 2)):
+                        tiles = [(tile_data, *codecs[i]) for _, _, _, tile_data, i in key_tiles]
+                        try:
+                            tile = merge_tiles(tiles, output_codec, cache)
+                        except Exception as e:
+                            raise ValueError(f"Failed to merge tile {z}/{x}/{y}: {e}") from e
+                        writer.write_tile(z, x, y, tile)
+                        pbar.update(len(tiles))
+                writer.flush()
+                if cache.lookups:
+                    logging.info(cache.summary())
+                if schema == 'dedup':
+                    merged_tiles, images = writer.count_images()
+                    logging.info(f"{merged_tiles} tiles stored as {images} distinct images.")
+                print(f"Successfully merged MBTiles files into {output_mbtiles}")
+
+                # Merging metadata, read again as fix_vectormetadata may have completed it
+                metadata_dicts = [reader.metadata() for reader in readers]
+                merged_metadata = merge_metadata_values(merge_metadata(metadata_dicts))
+                merged_metadata['compression'] = output_codec
+                # The merged tiles are compressed without a dictionary
+                merged_metadata[DICTIONARY_METADATA] = None
+                writer.update_metadata(merged_metadata)
+                print(f"Successfully merged metadata into {output_mbtiles}")
+            return True
 
-            for name, value in tqdm(merged_metadata.items(), desc=f"Inserting merged metadata"):
-                cur_out.execute('INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)', (name, value))
-
-            # Update format
-            cur_out.execute(''' UPDATE metadata SET value = 'pbf' where name = 'format' ''')
-            
-            # Update minzoom
-            cur_out.execute("SELECT value FROM metadata WHERE name = 'minzoom'")
-            zoom_levels = cur_out.fetchone()[0]  # Fetch the value
-            if zoom_levels:
-                min_zoom = get_min_zoom(zoom_levels)
-                cur_out.execute('''
-                    UPDATE metadata 
-                    SET value = ? 
-                    WHERE name = 'minzoom'
-                ''', (min_zoom,))
-
-            # Update maxzoom
-            cur_out.execute("SELECT value FROM metadata WHERE name = 'maxzoom'")
-            zoom_levels = cur_out.fetchone()[0]  # Fetch the value
-
-            max_zoom = 0
-            if zoom_levels:
-                max_zoom = get_max_zoom(zoom_levels)
-                cur_out.execute('''
-                    UPDATE metadata 
-                    SET value = ? 
-                    WHERE name = 'maxzoom'
-                ''', (max_zoom,))
-            
-            # Update max bounds
-            cur_out.execute("SELECT value FROM metadata WHERE name = 'bounds'")
-            bounds = cur_out.fetchone()[0]  # Fetch the value
-            if bounds:
-                min_bound = get_max_bound(bounds)
-
-                cur_out.execute('''
-                    UPDATE metadata 
-                    SET value = ? 
-                    WHERE name = 'bounds'
-                    ''', (min_bound,))
-
-            # Update center
-            cur_out.execute("SELECT value FROM metadata WHERE name = 'bounds'")
-            bound = cur_out.fetchone()[0]  
-            center = get_center_of_bound(bound)
-            center_of_bound = ''
-            if center != '':
-                center_of_bound = center +f',{max_zoom}'
-
-            cur_out.execute('''
-                UPDATE metadata 
-                SET value = ? 
-                WHERE name = 'center'
-                ''', (center_of_bound,))
-
-            # Update description
-            description = 'Merge multiple MBTiles files into a single MBTiles file using mbtilesmerge from vtiles'
-            cur_out.execute('''
-                INSERT OR REPLACE INTO metadata (name, value)
-                VALUES ('description', ?)
-            ''', (description,))
-        
-            conn_out.commit()
-            print(f"Successfully merged metadata into {output_mbtiles}")
-            
         except Exception as e:
-            logging.error(f"Error Merging metadata: {e}")
+            logging.error(f"Error Merging MBTiles: {e}")
+            return False
 
         finally:
-            for conn in connections:
-                conn.close()   
-            conn_out.close()
+            for reader in readers:
+                reader.close()   
     else:
         logging.info('Only vector mbtiles is supported.')
-        return
+        return False
 
 def main():
     parser = argparse.ArgumentParser(description="Merge multiple vector MBTiles files into a single MBTiles file.")
     parser.add_argument('input', nargs='+', help='Paths to the input MBTiles files to merge.')
     parser.add_argument('-o', '--output', help='Output merged MBTiles file. Defaults to "merged.mbtiles" in the current directory.')
+    parser.add_argument('--dedup', action='store_true', help='Store identical tiles once, in map and images tables with a tiles view.')
 
     args = parser.parse_args()
     for file in args.input:
@@ -379,7 +305,8 @@ def main():
             logger.error(f'Output MBTiles file {output_file} already exists! Please recheck and input a correct one. Ex: -o merged.mbtiles')
             sys.exit(1)          
 
-    merge_mbtiles(args.input, output_file)
+    if not merge_mbtiles(args.input, output_file, 'dedup' if args.dedup else 'flat'):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,181 @@
+import argparse, sys, os
+from functools import partial
+from tqdm import tqdm
+import logging
+from vtiles.utils.compression import (DICTIONARY_METADATA, cache_summary, decode_dictionary, decompress,
+                                      detect_compression, normalize_codec, tile_cache, uses_dictionary)
+from vtiles.utils.mapbox_vector_tile import map_many
+from vtiles.utils.mapbox_vector_tile.optimise import optimise_tile
+from vtiles.utils.mapbox_vector_tile.wire import iter_layers
+from vtiles.utils.pmtiles.reader import Reader, MmapSource, all_tiles
+from vtiles.utils.pmtiles.writer import write
+from vtiles.utils.pmtiles.tile import zxy_to_tileid, codec_from_compression
+from vtiles.mbtiles.store import MBTilesReader, MBTilesWriter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def optimise_tile_data(tile, level=None, input_codec=None, dictionary=None):
+    """Optimise one (zoom, column, row, tile_data) tile: reorder the string tables and the line parts of its layers
+    with optimise_tile, then recompress it with the same compression as the input at the given level (the codec
+    default level if None). input_codec is only needed for brotli tiles, dictionary is the zstd dictionary of the
+    tileset, used again for the tiles compressed with it.
+    The tile is kept as is if it can't be decoded or if the optimised tile is not smaller.
+    The optimised tiles are compressed through tile_cache, so that identical tiles are compressed once per process.
+    Return (zoom, column, row, tile_data, input size, layer_sizes, cache hits, cache lookups), layer_sizes being
+    {layer name: [bytes before, bytes after]} of the uncompressed layers and the cache counts those of this tile."""
+    z, x, y, tile_data = tile
+    tile_data = bytes(tile_data)
+    compression = 'brotli' if normalize_codec(input_codec) == 'brotli' else detect_compression(tile_data)
+
+    layer_sizes = {}
+    hits, lookups = tile_cache.hits, tile_cache.lookups
+    try:
+        dictionary = dictionary if uses_dictionary(tile_data) else None
+        raw = decompress(tile_data, compression, dictionary)
+        for name, layer, _ in iter_layers(raw):
+            layer_sizes[name] = [len(layer), len(layer)]
+        optimised = optimise_tile(raw)
+        optimised_data = tile_cache.compress(optimised, compression, level, dictionary)
+    except Exception as e:
+        logger.error(f"Failed to optimise tile {z}/{x}/{y}: {e}")
+        return z, x, y, tile_data, len(tile_data), {}, tile_cache.hits - hits, tile_cache.lookups - lookups
+    hits, lookups = tile_cache.hits - hits, tile_cache.lookups - lookups
+
+    if len(optimised_data) >= len(tile_data):
+        return z, x, y, tile_data, len(tile_data), layer_sizes, hits, lookups
+
+    for name, layer, _ in iter_layers(optimised):
+        layer_sizes.setdefault(name, [0, 0])[1] = len(layer)
+    return z, x, y, optimised_data, len(tile_data), layer_sizes, hits, lookups
+
+
+class OptimiseReport:
+    """Bytes saved per zoom level (stored tile sizes) and per layer (uncompressed layer sizes), and the compression
+    cache lookups summed over the worker processes."""
+
+    def __init__(self):
+        self.zooms = {}
+        self.layers = {}
+        self.cache_hits = 0
+        self.cache_lookups = 0
+
+    def add(self, z, size_before, size_after, layer_sizes, cache_hits=0, cache_lookups=0):
+        self.cache_hits += cache_hits
+        self.cache_lookups += cache_lookups
+        zoom = self.zooms.setdefault(z, [0, 0, 0])
+        zoom[0] += 1
+        zoom[1] += size_before
+        zoom[2] += size_after
+        for name, (before, after) in layer_sizes.items():
+            layer = self.layers.setdefault(name, [0, 0])
+            layer[0] += before
+            layer[1] += after
+
+    def print(self):
+        def saved(before, after):
+            return f"{before - after:>12} {(before - after) / before if before else 0:>8.2%}"
+
+        print(f"{'Zoom':<8} {'Tiles':>10} {'Before':>14} {'After':>14} {'Saved':>12} {'%':>8}")
+        print("=" * 71)
+        for z in sorted(self.zooms):
+            count, before, after = self.zooms[z]
+            print(f"{z:<8} {count:>10} {before:>14} {after:>14} {saved(before, after)}")
+        count = sum(zoom[0] for zoom in self.zooms.values())
+        before = sum(zoom[1] for zoom in self.zooms.values())
+        after = sum(zoom[2] for zoom in self.zooms.values())
+        print(f"{'Total':<8} {count:>10} {before:>14} {after:>14} {saved(before, after)}")
+
+        print(f"\n{'Layer':<30} {'Before':>14} {'After':>14} {'Saved':>12} {'%':>8}")
+        print("=" * 82)
+        for name, (before, after) in sorted(self.layers.items(), key=lambda item: item[1][1] - item[1][0]):
+            print(f"{name:<30} {before:>14} {after:>14} {saved(before, after)}")
+
+
+def optimise_mbtiles(input_mbtiles, output_mbtiles, level=None, workers=None, batch_size=10000):
+    report = OptimiseReport()
+    # The output keeps the metadata and the schema of the input, flat or deduplicated
+    with MBTilesReader(input_mbtiles) as reader, \
+            MBTilesWriter(output_mbtiles, reader.schema, reader.metadata(), batch_size=batch_size) as writer:
+        func = partial(optimise_tile_data, level=level, input_codec=reader.compression(),
+                       dictionary=reader.zstd_dictionary())
+        for z, x, y, tile_data, size, layer_sizes, hits, lookups in tqdm(
+                map_many(func, reader.tiles(ordered=False), workers=workers),
+                total=reader.count(), desc="Optimising tiles", unit="tile"):
+            report.add(z, size, len(tile_data), layer_sizes, hits, lookups)
+            writer.write_tile(z, x, y, tile_data)
+    if report.cache_lookups:
+        logger.info(cache_summary(report.cache_hits, report.cache_lookups))
+    return report
+
+
+def optimise_pmtiles(input_pmtiles, output_pmtiles, level=None, workers=None):
+    report = OptimiseReport()
+    with open(input_pmtiles, 'rb') as f:
+        source = MmapSource(f)
+        reader = Reader(source)
+        header = reader.header()
+        metadata = reader.metadata()
+        total_tiles = header['addressed_tiles_count'] or None
+        tiles = ((z, x, y, tile_data) for (z, x, y), tile_data in all_tiles(source))
+        func = partial(optimise_tile_data, level=level,
+                       input_codec=codec_from_compression(header['tile_compression']),
+                       dictionary=decode_dictionary(metadata.get(DICTIONARY_METADATA)))
+
+        with write(output_pmtiles) as writer:
+            for z, x, y, tile_data, size, layer_sizes, hits, lookups in tqdm(
+                    map_many(func, tiles, workers=workers),
+                    total=total_tiles, desc="Optimising tiles", unit="tile"):
+                report.add(z, size, len(tile_data), layer_sizes, hits, lookups)
+                writer.write_tile(zxy_to_tileid(z, x, y), tile_data)
+            writer.finalize(header, metadata)
+    if report.cache_lookups:
+        logger.info(cache_summary(report.cache_hits, report.cache_lookups))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Optimise a vector MBTiles or PMTiles file: reorder the string tables '
+                                                 'and line parts of every tile and recompress it, on all cores.')
+    parser.add_argument('input', help='Path to the input MBTiles or PMTiles file.')
+    parser.add_argument('-o', '--output', help='Path to the output file, of the same format as the input.')
+    parser.add_argument('-l', '--level', type=int,
+                        help='Compression level, in the range of the tile compression: 1-9 for gzip and zlib, 1-22 '
+                             'for zstd, 0-11 for brotli (default is the codec default level: 9 for gzip).')
+    parser.add_argument('-w', '--workers', type=int, help='Number of worker processes (default is the number of CPUs).')
+
+    args = parser.parse_args()
+    if not os.path.exists(args.input):
+        logger.error('Input file does not exist! Please recheck and input a correct file path.')
+        sys.exit(1)
+
+    input_file_abspath = os.path.abspath(args.input)
+    extension = os.path.splitext(input_file_abspath)[1]
+    if extension not in ('.mbtiles', '.pmtiles'):
+        logger.error(f'Input file {input_file_abspath} must end with .mbtiles or .pmtiles. Please recheck and input a correct one.')
+        sys.exit(1)
+
+    # Determine the output filename
+    if args.output:
+        output_file_abspath = os.path.abspath(args.output)
+        if not output_file_abspath.endswith(extension):
+            logger.error(f'Output file {output_file_abspath} must end with {extension}. Please recheck and input a correct one. Ex: -o tiles{extension}')
+            sys.exit(1)
+    else:
+        output_file_name = os.path.basename(input_file_abspath).replace(extension, f'_optimised{extension}')
+        output_file_abspath = os.path.join(os.path.dirname(input_file_abspath), output_file_name)
+    if os.path.exists(output_file_abspath):
+        logger.error(f'Output file {output_file_abspath} already exists! Please recheck and input a correct one. Ex: -o tiles{extension}')
+        sys.exit(1)
+
+    logger.info(f'Optimising {input_file_abspath} to {output_file_abspath}.')
+    if extension == '.mbtiles':
+        report = optimise_mbtiles(input_file_abspath, output_file_abspath, level=args.level, workers=args.workers)
+    else:
+        report = optimise_pmtiles(input_file_abspath, output_file_abspath, level=args.level, workers=args.workers)
+    report.print()
+
+
+if __name__ == "__main__":
+    main()
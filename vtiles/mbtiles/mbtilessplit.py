@@ -1,14 +1,13 @@
 import sqlite3
-import shutil
-import gzip, zlib
 import json
 import argparse, sys, os
 from tqdm import tqdm
-from vtiles.utils.mapbox_vector_tile import encode, decode
-from vtiles.utils.geopreocessing import fix_wkt
+from vtiles.utils.mapbox_vector_tile.wire import partition_layers
 import logging
 from vtiles.mbtiles.mbtilesfixmeta import fix_vectormetadata
 from vtiles.utils.geopreocessing import check_vector
+from vtiles.utils.compression import CompressionCache, decompress, tile_codec, uses_dictionary
+from vtiles.mbtiles.store import MBTilesReader, MBTilesWriter
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,89 +33,77 @@ def process_metadata(metadata_json, layers_to_keep, exclude=False):
     return metadata_json
 
 
-def process_mbtiles(input_mbtiles, output_mbtiles, layers_to_keep, keep_layers=True):
-    is_vector, compression_type = check_vector(input_mbtiles) 
-    desc = 'Update metadata by vtiles.mbtiles.mbtilesfixmeta' 
-    if is_vector:
-        fix_vectormetadata(input_mbtiles, compression_type,desc)    
-        shutil.copyfile(input_mbtiles, output_mbtiles)    
-        with sqlite3.connect(output_mbtiles) as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT name, value FROM metadata WHERE name = 'json'")
-            metadata = cursor.fetchone()
-            
-            if metadata:
-                _, metadata_value = metadata
-                metadata_json = json.loads(metadata_value)
-                processed_metadata = process_metadata(metadata_json, layers_to_keep, exclude=not keep_layers)
-                cursor.execute("DELETE FROM metadata WHERE name = 'json'")
-                cursor.execute("INSERT INTO metadata (name, value) VALUES ('json', ?)", (json.dumps(processed_metadata),))
-            
-            cursor.execute("SELECT type FROM sqlite_master WHERE name='tiles'")
-            result = cursor.fetchone()
-            if result:
-                if result[0] == 'view':
-                    cursor.execute("DROP VIEW IF EXISTS tiles")
-                else:
-                    cursor.execute("DROP TABLE IF EXISTS tiles")
-            
-            cursor.execute("""
-                CREATE TABLE tiles (
-                    zoom_level INTEGER,
-                    tile_column INTEGER,
-                    tile_row INTEGER,
-                    tile_data BLOB
-                )
-            """)
-            cursor.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
-            
-            try:
-                with sqlite3.connect(input_mbtiles) as in_conn:
-                    in_cursor = in_conn.cursor()
-                    in_cursor.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles ORDER BY zoom_level")
-                    tiles = in_cursor.fetchall()
-                    
-                    for zoom_level, tile_column, tile_row, tile_data in tqdm(tiles, desc="Processing tiles", unit=" tiles"):
-                        if tile_data[:2] == b'\x1f\x8b':
-                            tile_data = gzip.decompress(tile_data)
-                        elif tile_data[:2] in [b'\x78\x9c', b'\x78\x01', b'\x78\xda']:
-                            tile_data = zlib.decompress(tile_data)
-                        
-                        decoded_tile = decode(tile_data)
-                        decoded_tile = fix_wkt(decoded_tile)
-                        
-                        if keep_layers:
-                            filtered_tile = [item for item in decoded_tile if item["name"] in layers_to_keep]
-                        else:
-                            filtered_tile = [item for item in decoded_tile if item["name"] not in layers_to_keep]
-                        
-                        if filtered_tile:
-                            try:
-                                encoded_tile = encode(filtered_tile)
-                                encoded_tile_gzip = gzip.compress(encoded_tile)
-                                cursor.execute("""
-                                    INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data)
-                                    VALUES (?, ?, ?, ?)""", (zoom_level, tile_column, tile_row, encoded_tile_gzip))
-                            except Exception as e:
-                                logger.error(f"Error encoding tile {zoom_level}/{tile_column}/{tile_row}: {e}")
-                
-                description = 'Splitting MBTiles file by selected layers using mbtilessplit from vtiles'
-                cursor.execute('''
-                    INSERT OR REPLACE INTO metadata (name, value)
-                    VALUES ('description', ?)
-                ''', (description,))
-                
-                conn.commit()
-                if keep_layers:
-                    logger.info(f'Successfully saved split MBTiles into {output_mbtiles}')
-                else:
-                    logger.info(f'Successfully saved remaining MBTiles into {output_mbtiles}')
-            
-            except sqlite3.Error as e:
-                logger.error(f"Database error: {e}")
-            except Exception as e:
-                logger.error(f"Unexpected error: {e}")
+def split_tile(tile_data, layers_to_keep, codec=None, dictionary=None):
+    """Split a tile into its kept layers and its remaining layers without decoding them, both uncompressed.
+    codec is the compression of the tileset, only needed for brotli tiles, and dictionary its zstd dictionary."""
+    return partition_layers(decompress(tile_data, codec, dictionary), layers_to_keep)
+
+
+def create_output_mbtiles(output_mbtiles, metadata, layers_to_keep, keep_layers, batch_size=10000):
+    metadata = dict(metadata)
+    if metadata.get('json'):
+        metadata['json'] = json.dumps(process_metadata(json.loads(metadata['json']), layers_to_keep,
+                                                       exclude=not keep_layers))
+    metadata['description'] = 'Splitting MBTiles file by selected layers using mbtilessplit from vtiles'
+    return MBTilesWriter(output_mbtiles, metadata=metadata, batch_size=batch_size)
+
+
+def process_mbtiles(input_mbtiles, output_mbtiles, remained_mbtiles, layers_to_keep, batch_size=10000):
+    """Write the selected layers of every tile to output_mbtiles and the other layers to remained_mbtiles.
+
+    Layers are length-delimited messages in a vector tile, so they are split by byte slicing in a single pass over
+    the input tiles, without decoding or re-encoding any geometry. The split tiles keep the compression of the input
+    tile, and its zstd dictionary. Return True on success; on failure, the error is logged and no output is left.
+    """
+    is_vector, compression_type = check_vector(input_mbtiles)
+    if not is_vector:
+        logger.warning(f'mbtilessplit only supports vector MBTiles. {input_mbtiles} is not a vector MBTiles.')
+        return False
+
+    layers_to_keep = set(layers_to_keep)
+    try:
+        # Both outputs are deleted if a tile can't be split
+        with MBTilesReader(input_mbtiles) as reader, \
+                create_output_mbtiles(output_mbtiles, reader.metadata(), layers_to_keep, True, batch_size) as out_writer, \
+                create_output_mbtiles(remained_mbtiles, reader.metadata(), layers_to_keep, False, batch_size) as remained_writer:
+            metadata = reader.metadata()
+            codec = reader.compression()
+            dictionary = reader.zstd_dictionary()
+
+            # Identical split tiles (the same layers of empty areas) are compressed once
+            cache = CompressionCache()
+            for zoom_level, tile_column, tile_row, tile_data in tqdm(reader.tiles(), total=reader.count(), desc="Processing tiles", unit=" tiles"):
+                try:
+                    kept_tile, remained_tile = split_tile(tile_data, layers_to_keep, codec, dictionary)
+                except Exception as e:
+                    raise ValueError(f"Error splitting tile {zoom_level}/{tile_column}/{tile_row}: {e}") from e
+                output_codec = tile_codec(tile_data, codec)
+                output_dictionary = dictionary if uses_dictionary(tile_data) else None
+                if kept_tile:
+                    out_writer.write_tile(zoom_level, tile_column, tile_row,
+                                          cache.compress(kept_tile, output_codec, dictionary=output_dictionary))
+                if remained_tile:
+                    remained_writer.write_tile(zoom_level, tile_column, tile_row,
+                                               cache.compress(remained_tile, output_codec, dictionary=output_dictionary))
+
+            if cache.lookups:
+                logger.info(cache.summary())
+
+        # Metadata without vector_layers can not be split, so it is rebuilt from the split tiles instead
+        if not metadata.get('json'):
+            desc = 'Splitting MBTiles file by selected layers using mbtilessplit from vtiles'
+            fix_vectormetadata(output_mbtiles, compression_type, desc)
+            fix_vectormetadata(remained_mbtiles, compression_type, desc)
+
+        logger.info(f'Successfully saved split MBTiles into {output_mbtiles}')
+        logger.info(f'Successfully saved remaining MBTiles into {remained_mbtiles}')
+        return True
+
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+    return False
 
 
 def main():
@@ -148,10 +135,15 @@ def main():
             logger.error(f'Output MBTiles  {output_file_abspath} already exists! Please recheck and input a correct one. Ex: -o tiles.mbtiles')
             sys.exit(1)          
     
-    logger.info(f'Splitting {input_file_abspath} to {output_file_abspath}')
-    process_mbtiles(input_file_abspath, output_file_name, args.layers, keep_layers=True)
-    remaining_output = os.path.basename(input_file_abspath).replace('.mbtiles', '_remained.mbtiles')
-    process_mbtiles(input_file_abspath, remaining_output, args.layers, keep_layers=False)
+    remained_file_name = os.path.basename(input_file_abspath).replace('.mbtiles', '_remained.mbtiles')
+    remained_file_abspath = os.path.join(os.path.dirname(input_file_abspath), remained_file_name)
+    if os.path.exists(remained_file_abspath):
+        logger.error(f'Output MBTiles  {remained_file_abspath} already exists! Please remove it before splitting.')
+        sys.exit(1)
+
+    logger.info(f'Splitting {input_file_abspath} to {output_file_abspath} and {remained_file_abspath}')
+    if not process_mbtiles(input_file_abspath, output_file_abspath, remained_file_abspath, args.layers):
+        sys.exit(1)
     logger.info('Splitting MBTiles done!')
 
 if __name__ == "__main__":
@@ -3,7 +3,8 @@ import argparse
 import sqlite3
 import os, sys
 from vtiles.utils.vt2geojson.tools import vt_bytes_to_geojson, _is_url
-import gzip, zlib
+from vtiles.mbtiles.store import MBTilesReader
+from vtiles.utils.compression import decompress
 import logging
 from re import search
 from urllib.request import urlopen
@@ -24,8 +25,9 @@ def tile_data_to_geojson(tile_data, x, y, z, output):
 def process_tile_data(input_path, z, x, y, output, flipy):
     """Handles the main tile data processing logic."""
     tile_data = None    
+    codec, dictionary = None, None
     if input_path.endswith('.mbtiles'):
-        tile_data = read_from_mbtiles(input_path, z, x, y)
+        tile_data, codec, dictionary = read_from_mbtiles(input_path, z, x, y)
     elif input_path.endswith('.pbf'):
         tile_data = read_from_pbf(input_path)
     else:
@@ -35,10 +37,8 @@ def process_tile_data(input_path, z, x, y, output, flipy):
     # Decompress tile data if needed
     if tile_data:
         try:
-            if tile_data[:2] == b'\x1f\x8b':  # Check for gzip magic number
-                tile_data = gzip.decompress(tile_data)
-            elif tile_data[:2] in [b'\x78\x9c', b'\x78\x01', b'\x78\xda']:  # zlib headers
-                tile_data = zlib.decompress(tile_data)
+            # The codec of a pbf file is detected from its magic bytes
+            tile_data = decompress(tile_data, codec, dictionary)
         except Exception as e:
             logger.error(f"Failed to decompress tile data: {e}")
             return
@@ -52,26 +52,19 @@ def process_tile_data(input_path, z, x, y, output, flipy):
 
 
 def read_from_mbtiles(mbtiles_path, z, x, y):
-    """Read tile data from an MBTiles file."""
+    """Read tile data from an MBTiles file, with the compression and the zstd dictionary of the file."""
     try:
-        conn = sqlite3.connect(mbtiles_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT tile_data 
-            FROM tiles 
-            WHERE zoom_level=? 
-            AND tile_column=? 
-            AND tile_row=?''', (z, x, y))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return row[0]
+        with MBTilesReader(mbtiles_path) as reader:
+            tile_data = reader.get_tile(z, x, y)
+            codec, dictionary = reader.compression(), reader.zstd_dictionary()
+        if tile_data is not None:
+            return tile_data, codec, dictionary
         else:
             logger.error(f"Tile not found in MBTiles file at zoom_level={z}, tile_column={x}, tile_row={y}")
-            return None
+            return None, None, None
     except sqlite3.Error as e:
         logger.error(f"Failed to read MBTiles file {mbtiles_path}: {e}")
-        return None
+        return None, None, None
 
 
 def read_from_pbf(pbf_path):
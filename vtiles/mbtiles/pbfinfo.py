@@ -1,7 +1,6 @@
-from vtiles.utils.mapbox_vector_tile import decode
+from vtiles.utils.mapbox_vector_tile import summarize
+from vtiles.utils.compression import decompress, detect_compression
 import sys
-import gzip
-import zlib
 import os
 from datetime import datetime
 
@@ -10,33 +9,23 @@ def read_pbf_tile(pbf_file):
         with open(pbf_file, 'rb') as f:
             tile_data = f.read()
 
-        # Check for GZIP compression
-        if tile_data[:2] == b'\x1f\x8b':
-            compression_type = 'GZIP'
-            tile_data = gzip.decompress(tile_data)
-        # Check for ZLIB compression
-        elif tile_data[:2] == b'\x78\x9c' or tile_data[:2] == b'\x78\x01' or tile_data[:2] == b'\x78\xda':
-            compression_type = 'ZLIB'
-            tile_data = zlib.decompress(tile_data)
-        else:
-            compression_type = 'None'
+        # gzip, zlib and zstd are detected from their magic bytes
+        codec = detect_compression(tile_data)
+        if codec is None:
+            try:
+                # Summarize the tile data, geometries are not decoded
+                return summarize(tile_data), 'None'
+            except Exception:
+                # brotli tiles have no magic bytes
+                codec = 'brotli'
 
-        # Decode the tile data
-        tile = decode(tile_data)
-        return tile, compression_type
+        tile = summarize(decompress(tile_data, codec))
+        return tile, codec.upper()
 
     except Exception as e:
         print(f"Error reading or decoding the PBF file: {e}")
         sys.exit(1)
 
-def count_feature_types(layer_data):
-    from collections import defaultdict
-    feature_types_count = defaultdict(int)  # Use defaultdict to count feature types
-    for feature in layer_data['features']:
-        geometry_type = feature['geometry']['type']
-        feature_types_count[geometry_type] += 1
-    return feature_types_count
-
 def main():
     if len(sys.argv) < 2:
         print("Usage: pbfinfo <path_to_pbf_file>")
@@ -58,8 +47,8 @@ def main():
     # Print layer information
     print("==============")
     for layer_name, layer_data in tile_data.items():
-        num_features = len(layer_data['features'])
-        feature_types_count = count_feature_types(layer_data)
+        num_features = layer_data['features']
+        feature_types_count = layer_data['geometry_types']
         
         print(f"Layer '{layer_name}':")
         print(f"  Total features: {num_features} features")
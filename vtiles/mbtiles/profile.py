@@ -0,0 +1,167 @@
+"""Profile of an MBTiles file, computed in a single pass over its tile index and cached in a sidecar file.
+
+A `TilesetProfile` holds what the tools check before they start: vector or raster, compression, tile format, zoom
+range, tile counts and the column/row range of each zoom level, bounds, center and duplicate keys. It is computed
+with one GROUP BY on the tile index, the first tile and, without a unique index, the duplicates query, then stored
+as JSON next to the file, in `<file>.vtiles-profile.json`, with the size and modification time of the file, so that
+the next command reads it back instead of scanning the tiles again. The MBTiles file itself is never written to.
+"""
+import json
+import logging
+import os
+
+from vtiles.mbtiles.store import open_reader
+from vtiles.utils.geopreocessing import check_vector, compute_max_bound, detect_tile_format, tile_range_bounds
+
+logger = logging.getLogger(__name__)
+
+PROFILE_VERSION = 1
+# Duplicate keys kept in the profile, the total being counted on all of them
+MAX_DUPLICATES = 1000
+DEFAULT_BOUNDS = '-180.000000,-85.051129,180.000000,85.051129'
+DEFAULT_CENTER = '0,0,0'
+PROFILE_SUFFIX = '.vtiles-profile.json'
+
+
+def file_key(path):
+    """Return the [size, modification time in ns] of path, which the cached profile must match."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def profile_path(path):
+    """Return the path of the sidecar file caching the profile of the MBTiles file at path."""
+    return os.fspath(path) + PROFILE_SUFFIX
+
+
+def _path(mbtiles):
+    # mbtiles is a path or an open MBTilesReader
+    return getattr(mbtiles, 'path', mbtiles)
+
+
+class TilesetProfile:
+    """Format, compression and per zoom level aggregates of an MBTiles file.
+
+    `zooms` is {zoom_level: (tile count, min column, max column, min row, max row)}, rows in the TMS scheme of the
+    file. `duplicates` is the [(zoom_level, tile_column, tile_row, count)] list of the keys stored more than once,
+    the most duplicated first, and `total_duplicates` the number of extra rows.
+    """
+
+    def __init__(self, is_vector, compression_type, tile_format, zooms, duplicates=(), total_duplicates=0):
+        self.is_vector = is_vector
+        self.compression_type = compression_type
+        self.tile_format = tile_format
+        self.zooms = dict(zooms)
+        self.duplicates = [tuple(duplicate) for duplicate in duplicates]
+        self.total_duplicates = total_duplicates
+
+    @property
+    def min_zoom(self):
+        return min(self.zooms) if self.zooms else None
+
+    @property
+    def max_zoom(self):
+        return max(self.zooms) if self.zooms else None
+
+    @property
+    def tile_count(self):
+        return sum(count for count, *_ in self.zooms.values())
+
+    def zoom_range(self):
+        """Return (min zoom, max zoom), (None, None) for an empty file, as `MBTilesReader.zoom_range`."""
+        return self.min_zoom, self.max_zoom
+
+    def count_by_zoom(self):
+        """Return the [(zoom_level, tile count)] list, by increasing zoom level, as `MBTilesReader.count_by_zoom`."""
+        return [(zoom_level, self.zooms[zoom_level][0]) for zoom_level in sorted(self.zooms)]
+
+    def bounds_at_zoom(self, zoom_level):
+        """Return the (west, south, east, north) bounds of the tiles of zoom_level, None if it has no tiles."""
+        if zoom_level not in self.zooms:
+            return None
+        _, min_column, max_column, min_row, max_row = self.zooms[zoom_level]
+        return tile_range_bounds(zoom_level, min_column, max_column, min_row, max_row)
+
+    def bounds_by_zoom(self):
+        """Return {zoom_level: (west, south, east, north)}, the bounds of each zoom level."""
+        return {zoom_level: self.bounds_at_zoom(zoom_level) for zoom_level in sorted(self.zooms)}
+
+    def bounds_center(self):
+        """Return the bounds and center metadata strings from the tiles of the max zoom level, as
+        `vtiles.utils.geopreocessing.get_bounds_center`: the whole world for an empty file."""
+        if not self.zooms:
+            return DEFAULT_BOUNDS, DEFAULT_CENTER
+        bounds = compute_max_bound([self.bounds_at_zoom(self.max_zoom)])
+        return ','.join(map(str, bounds[:4])), ','.join(map(str, bounds[4:])) + f',{self.max_zoom}'
+
+    def to_dict(self):
+        return {
+            'version': PROFILE_VERSION,
+            'is_vector': self.is_vector,
+            'compression_type': self.compression_type,
+            'tile_format': self.tile_format,
+            'zooms': [[zoom_level, *self.zooms[zoom_level]] for zoom_level in sorted(self.zooms)],
+            'duplicates': [list(duplicate) for duplicate in self.duplicates],
+            'total_duplicates': self.total_duplicates,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a profile from `to_dict` output, None if it was written by another version."""
+        if data.get('version') != PROFILE_VERSION:
+            return None
+        zooms = {zoom_level: tuple(stats) for zoom_level, *stats in data['zooms']}
+        return cls(data['is_vector'], data['compression_type'], data['tile_format'], zooms,
+                   data['duplicates'], data['total_duplicates'])
+
+    @classmethod
+    def scan(cls, mbtiles):
+        """Compute the profile of mbtiles, a path or an open `MBTilesReader`."""
+        with open_reader(mbtiles) as reader:
+            is_vector, compression_type = check_vector(reader)
+            tile_format = 'pbf' if is_vector else detect_tile_format(reader.first_tile())
+            zooms = {zoom_level: tuple(stats) for zoom_level, *stats in reader.zoom_stats()}
+            duplicates = reader.duplicates()
+        total_duplicates = sum(count - 1 for _, _, _, count in duplicates)
+        return cls(is_vector, compression_type, tile_format, zooms, duplicates[:MAX_DUPLICATES], total_duplicates)
+
+    @classmethod
+    def cached(cls, mbtiles):
+        """Return the profile cached next to mbtiles, a path or an open `MBTilesReader`, None if there is none or
+        the size or the modification time of the file changed since."""
+        path = _path(mbtiles)
+        try:
+            with open(profile_path(path)) as f:
+                data = json.load(f)
+            if data.get('key') != file_key(path):
+                return None
+            return cls.from_dict(data)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    @classmethod
+    def load(cls, mbtiles, refresh=False):
+        """Return the cached profile of mbtiles, or scan it and cache the result. With refresh, the file is always
+        scanned again."""
+        profile = None if refresh else cls.cached(mbtiles)
+        if profile is None:
+            profile = cls.scan(mbtiles)
+            profile.save(_path(mbtiles))
+        return profile
+
+    def save(self, path):
+        """Cache the profile next to the MBTiles file at path, keyed by the current size and modification time of
+        the file. Nothing is cached if the sidecar file can't be written."""
+        data = self.to_dict()
+        cache_path = profile_path(path)
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            data['key'] = file_key(path)
+            # Written aside and renamed, so that a concurrent reader never sees a partial file
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to cache the profile of {path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
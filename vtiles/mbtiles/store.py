@@ -0,0 +1,344 @@
+"""Tuned SQLite access to MBTiles files, shared by the vtiles tools.
+
+`MBTilesReader` opens a file read-only and memory mapped, and streams its tiles by zoom level or key range.
+`MBTilesWriter` creates a new file with bulk load settings and inserts its tiles in `executemany` batches, in the
+flat or the deduplicated schema of `vtiles.utils.mbtilesschema`. Both run a small fixed set of SQL statements, so
+that sqlite3 prepares each of them once per connection and reuses it from its statement cache.
+"""
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+from vtiles.utils.compression import DICTIONARY_METADATA, decode_dictionary, normalize_codec
+from vtiles.utils.mbtilesschema import (check_schema, count_images, create_tiles_index, create_tiles_schema,
+                                        delete_duplicate_keys, insert_tiles, is_deduplicated)
+
+logger = logging.getLogger(__name__)
+
+# Bytes of the file mapped in memory by the readers: pages are read from the OS cache without a copy
+DEFAULT_MMAP_SIZE = 1 << 30
+# Page cache of each connection, in KiB
+DEFAULT_CACHE_SIZE = 64 * 1024
+# Page size of the new files: most tiles fit in a page instead of spilling to overflow pages
+DEFAULT_PAGE_SIZE = 8192
+DEFAULT_BATCH_SIZE = 10000
+
+TILE_QUERY = "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?"
+TILE_KEY = ['zoom_level', 'tile_column', 'tile_row']
+
+
+def read_only_uri(path):
+    """Return the URI opening `path` read-only: a missing file raises instead of being created empty."""
+    return f'{Path(path).resolve().as_uri()}?mode=ro'
+
+
+class MBTilesReader:
+    """Read-only access to an MBTiles file, usable as a context manager.
+
+    The tile iterators are lazy: rows are fetched from SQLite as they are consumed, so a whole tileset never has to
+    fit in memory. Queries that don't need tile_data run on the `map` table of a deduplicated file.
+    """
+
+    def __init__(self, path, mmap_size=DEFAULT_MMAP_SIZE, cache_size=DEFAULT_CACHE_SIZE, check_same_thread=True):
+        self.path = path
+        self.conn = sqlite3.connect(read_only_uri(path), uri=True, check_same_thread=check_same_thread)
+        self.conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        self.conn.execute(f"PRAGMA cache_size = {-int(cache_size)}")
+        self._deduplicated = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    @property
+    def deduplicated(self):
+        """Tell whether the file has the deduplicated map and images schema."""
+        if self._deduplicated is None:
+            self._deduplicated = is_deduplicated(self.conn.cursor())
+        return self._deduplicated
+
+    @property
+    def schema(self):
+        return 'dedup' if self.deduplicated else 'flat'
+
+    @property
+    def tiles_table(self):
+        """The table to query for the tile coordinates, see `vtiles.utils.mbtilesschema.tiles_table`."""
+        return 'map' if self.deduplicated else 'tiles'
+
+    def metadata(self):
+        """Return the metadata as a {name: value} dictionary."""
+        return dict(self.conn.execute("SELECT name, value FROM metadata"))
+
+    def metadata_value(self, name):
+        """Return the value of the `name` metadata entry, None if there is none or no metadata table."""
+        try:
+            row = self.conn.execute("SELECT value FROM metadata WHERE name = ?", (name,)).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def compression(self):
+        """Return the codec in the compression metadata, None if there is none or it is not a known codec."""
+        try:
+            return normalize_codec(self.metadata_value('compression'))
+        except ValueError:
+            return None
+
+    def zstd_dictionary(self):
+        """Return the zstd dictionary stored in the metadata, None if there is none."""
+        return decode_dictionary(self.metadata_value(DICTIONARY_METADATA))
+
+    def count(self, zoom_level=None, min_zoom=None, max_zoom=None, start=None, stop=None):
+        """Return the number of tiles, selected as in `tiles`. It is counted on the index, without reading the
+        tile_data, to size the progress bars of the streaming jobs."""
+        where, params = self._where(zoom_level, min_zoom, max_zoom, start, stop)
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.tiles_table}{where}", params).fetchone()[0]
+
+    def count_by_zoom(self):
+        """Return the [(zoom_level, tile count)] list, by increasing zoom level."""
+        return self.conn.execute(f"SELECT zoom_level, COUNT(*) FROM {self.tiles_table} "
+                                 f"GROUP BY zoom_level ORDER BY zoom_level").fetchall()
+
+    def zoom_levels(self):
+        """Return the list of the zoom levels holding tiles, in increasing order."""
+        return [zoom_level for zoom_level, in self.conn.execute(
+            f"SELECT DISTINCT zoom_level FROM {self.tiles_table} ORDER BY zoom_level")]
+
+    def zoom_range(self):
+        """Return (min zoom, max zoom), (None, None) for an empty file."""
+        return self.conn.execute(f"SELECT MIN(zoom_level), MAX(zoom_level) FROM {self.tiles_table}").fetchone()
+
+    def zoom_stats(self):
+        """Return the [(zoom_level, tile count, min column, max column, min row, max row)] list by increasing zoom
+        level, in a single GROUP BY on the tile index."""
+        return self.conn.execute(
+            f"SELECT zoom_level, COUNT(*), MIN(tile_column), MAX(tile_column), MIN(tile_row), MAX(tile_row) "
+            f"FROM {self.tiles_table} GROUP BY zoom_level ORDER BY zoom_level").fetchall()
+
+    def tile_range(self, zoom_level=None):
+        """Return (zoom_level, min column, max column, min row, max row) of the tiles of zoom_level, the max zoom
+        level if None, from MIN/MAX aggregates on the tile index. None if there are no such tiles."""
+        zoom = "?" if zoom_level is not None else f"(SELECT MAX(zoom_level) FROM {self.tiles_table})"
+        row = self.conn.execute(
+            f"SELECT zoom_level, MIN(tile_column), MAX(tile_column), MIN(tile_row), MAX(tile_row) "
+            f"FROM {self.tiles_table} WHERE zoom_level = {zoom}",
+            () if zoom_level is None else (zoom_level,)).fetchone()
+        return row if row and row[0] is not None else None
+
+    def has_unique_index(self):
+        """Tell whether a unique (zoom_level, tile_column, tile_row) index rules duplicate tiles out."""
+        for _, name, unique, *_ in self.conn.execute(f"PRAGMA index_list({self.tiles_table})").fetchall():
+            columns = [column for _, _, column in self.conn.execute(f"PRAGMA index_info('{name}')")]
+            if unique and columns == TILE_KEY:
+                return True
+        return False
+
+    def duplicates(self):
+        """Return the [(zoom_level, tile_column, tile_row, count)] of the keys stored more than once, the most
+        duplicated first. Without a unique index, this is a scan of the tiles."""
+        if self.has_unique_index():
+            return []
+        return self.conn.execute(
+            f"SELECT zoom_level, tile_column, tile_row, COUNT(*) AS count FROM {self.tiles_table} "
+            f"GROUP BY zoom_level, tile_column, tile_row HAVING COUNT(*) > 1 ORDER BY count DESC").fetchall()
+
+    def first_tile(self):
+        """Return the tile_data of a tile of the file, None if it is empty."""
+        row = self.conn.execute("SELECT tile_data FROM tiles LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def get_tile(self, zoom_level, tile_column, tile_row):
+        """Return the tile_data of a tile (TMS row), None if it doesn't exist."""
+        row = self.conn.execute(TILE_QUERY, (zoom_level, tile_column, tile_row)).fetchone()
+        return row[0] if row else None
+
+    def _where(self, zoom_level, min_zoom, max_zoom, start, stop):
+        clauses, params = [], []
+        if zoom_level is not None:
+            clauses.append("zoom_level = ?")
+            params.append(zoom_level)
+        if min_zoom is not None:
+            clauses.append("zoom_level >= ?")
+            params.append(min_zoom)
+        if max_zoom is not None:
+            clauses.append("zoom_level <= ?")
+            params.append(max_zoom)
+        # Row values compare the keys in index order, so key ranges are index range scans
+        if start is not None:
+            clauses.append("(zoom_level, tile_column, tile_row) >= (?, ?, ?)")
+            params.extend(start)
+        if stop is not None:
+            clauses.append("(zoom_level, tile_column, tile_row) < (?, ?, ?)")
+            params.extend(stop)
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def tiles(self, zoom_level=None, min_zoom=None, max_zoom=None, start=None, stop=None, ordered=True):
+        """Yield the (zoom_level, tile_column, tile_row, tile_data) tiles, of `zoom_level` or between `min_zoom` and
+        `max_zoom` if given, with a key from `start` (included) to `stop` (excluded) if given, the keys being
+        (zoom_level, tile_column, tile_row) tuples. The tiles are yielded in key order when `ordered`, in storage
+        order otherwise."""
+        where, params = self._where(zoom_level, min_zoom, max_zoom, start, stop)
+        order = " ORDER BY zoom_level, tile_column, tile_row" if ordered else ""
+        yield from self.conn.execute(
+            f"SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles{where}{order}", params)
+
+    def tile_batches(self, batch_size=DEFAULT_BATCH_SIZE, zoom_level=None, min_zoom=None, max_zoom=None, start=None,
+                     stop=None, ordered=True):
+        """Yield the tiles selected as in `tiles` in lists of up to `batch_size` tiles, fetched from the cursor
+        one batch at a time, so that only the batches being processed are held in memory."""
+        where, params = self._where(zoom_level, min_zoom, max_zoom, start, stop)
+        order = " ORDER BY zoom_level, tile_column, tile_row" if ordered else ""
+        cursor = self.conn.execute(
+            f"SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles{where}{order}", params)
+        try:
+            yield from iter(lambda: cursor.fetchmany(batch_size), [])
+        finally:
+            cursor.close()
+
+    def coordinates(self, zoom_level=None, min_zoom=None, max_zoom=None, start=None, stop=None, ordered=True):
+        """Yield the (zoom_level, tile_column, tile_row) keys of the tiles, selected as in `tiles`."""
+        where, params = self._where(zoom_level, min_zoom, max_zoom, start, stop)
+        order = " ORDER BY zoom_level, tile_column, tile_row" if ordered else ""
+        yield from self.conn.execute(
+            f"SELECT zoom_level, tile_column, tile_row FROM {self.tiles_table}{where}{order}", params)
+
+    def sample(self, samples, zoom_level=None):
+        """Return the tile_data of about `samples` tiles picked at random, of `zoom_level` only if given, in a
+        single pass over the tiles."""
+        where, params = self._where(zoom_level, None, None, None, None)
+        total_tiles = self.count(zoom_level)
+        # Keep each tile with a probability of samples / total_tiles
+        modulo = max(total_tiles // samples, 1)
+        condition = f"{where} AND" if where else " WHERE"
+        return [tile_data for tile_data, in self.conn.execute(
+            f"SELECT tile_data FROM tiles{condition} abs(random()) % ? = 0 LIMIT ?", params + [modulo, samples])]
+
+
+class MBTilesWriter:
+    """Bulk writer of a new MBTiles file, usable as a context manager.
+
+    The file has no rollback journal and is not synced on each transaction, so a failed job has nothing to recover:
+    the file is deleted when the `with` block raises, or when `close` fails. The tiles are inserted in batches of
+    `batch_size` with `executemany`, and the unique (zoom_level, tile_column, tile_row) index is built on `close`,
+    which is faster than updating it on each insert. If a key was written twice, as when copying an input without a
+    unique index, the last tile written is kept. With `replace`, the index is created first and a tile written twice
+    replaces the first one on insert.
+    """
+
+    def __init__(self, path, schema='flat', metadata=None, batch_size=DEFAULT_BATCH_SIZE, page_size=DEFAULT_PAGE_SIZE,
+                 cache_size=DEFAULT_CACHE_SIZE, replace=False):
+        if os.path.exists(path):
+            raise FileExistsError(f"{path} already exists.")
+        self.path = path
+        self.schema = check_schema(schema)
+        self.batch_size = batch_size
+        self.replace = replace
+        self.tiles_written = 0
+        self._batch = []
+        self.conn = sqlite3.connect(path)
+        self.cursor = self.conn.cursor()
+        # The page size must be set before the first table is created
+        self.cursor.execute(f"PRAGMA page_size = {int(page_size)}")
+        self.cursor.execute(f"PRAGMA cache_size = {-int(cache_size)}")
+        self.cursor.execute("PRAGMA journal_mode = OFF")
+        self.cursor.execute("PRAGMA synchronous = OFF")
+        self.cursor.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        self.cursor.execute("CREATE UNIQUE INDEX name ON metadata (name)")
+        create_tiles_schema(self.cursor, schema, index=replace)
+        if metadata:
+            self.update_metadata(metadata)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def update_metadata(self, metadata):
+        """Insert or replace the `metadata` {name: value} entries, a None value deleting the entry."""
+        for name, value in metadata.items():
+            if value is None:
+                self.cursor.execute("DELETE FROM metadata WHERE name = ?", (name,))
+            else:
+                self.cursor.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", (name, value))
+
+    def write_tile(self, zoom_level, tile_column, tile_row, tile_data):
+        """Queue a tile (TMS row) for insertion, the batch being inserted once full."""
+        self._batch.append((zoom_level, tile_column, tile_row, tile_data))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_tiles(self, tiles):
+        """Write the (zoom_level, tile_column, tile_row, tile_data) tiles of the `tiles` iterable."""
+        for tile in tiles:
+            self.write_tile(*tile)
+
+    def flush(self):
+        """Insert the queued tiles and commit them."""
+        if self._batch:
+            insert_tiles(self.cursor, self._batch, self.schema)
+            self.tiles_written += len(self._batch)
+            self._batch.clear()
+        self.conn.commit()
+
+    def count_images(self):
+        """Return (tiles, distinct images) as in `vtiles.utils.mbtilesschema.count_images`."""
+        self.flush()
+        return count_images(self.cursor)
+
+    def close(self):
+        """Insert the queued tiles, build the tile index and close the file, which is deleted if this fails."""
+        if self.conn is None:
+            return
+        try:
+            self.flush()
+            if not self.replace:
+                self._create_index()
+            self.conn.commit()
+        except BaseException:
+            self.abort()
+            raise
+        self.conn.close()
+        self.conn = None
+
+    def _create_index(self):
+        try:
+            create_tiles_index(self.cursor, self.schema)
+        except sqlite3.IntegrityError:
+            # Only files with duplicate keys pay for the GROUP BY
+            deleted = delete_duplicate_keys(self.cursor, self.schema)
+            logger.warning(f"{deleted} tiles written twice to {self.path}, the last one written is kept.")
+            create_tiles_index(self.cursor, self.schema)
+
+    def abort(self):
+        """Close and delete the file, of a job which failed."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@contextmanager
+def open_reader(mbtiles, **kwargs):
+    """Yield an MBTilesReader of `mbtiles`, a path or an open MBTilesReader. A reader opened here is closed on exit,
+    a given one is left open, so that a job can share one reader between the helpers it calls."""
+    if isinstance(mbtiles, MBTilesReader):
+        yield mbtiles
+        return
+    reader = MBTilesReader(mbtiles, **kwargs)
+    try:
+        yield reader
+    finally:
+        reader.close()
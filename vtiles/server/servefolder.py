@@ -1,20 +1,16 @@
 from http.server import SimpleHTTPRequestHandler, HTTPServer
 import os
+from vtiles.utils.compression import content_encoding, detect_compression
 
 class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
 
     def check_compressed(self, pbf_file):
         try:
             with open(pbf_file, 'rb') as f:
-                tile_data = f.read(2)  # Read only the first two bytes
-            # Check for GZIP compression
-            if tile_data[:2] == b'\x1f\x8b':
-                return 'GZIP'
-            # Check for ZLIB compression
-            elif tile_data[:2] == b'\x78\x9c' or tile_data[:2] == b'\x78\x01' or tile_data[:2] == b'\x78\xda':
-                return 'ZLIB'
-            else:
-                return None
+                tile_data = f.read(4)  # Read only the magic bytes
+            # GZIP, ZLIB or ZSTD, brotli tiles having no magic bytes
+            codec = detect_compression(tile_data)
+            return codec.upper() if codec else None
         except Exception as e:
             print(f"Error reading PBF file: {e}")
             return None
@@ -25,10 +21,9 @@ class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
             file_path = self.translate_path(self.path)  # Get the full file path
             compression_type = self.check_compressed(file_path)  # Check the compression type
 
-            if compression_type == 'GZIP':
-                self.send_header('Content-Encoding', 'gzip')
-            elif compression_type == 'ZLIB':
-                self.send_header('Content-Encoding', 'deflate')  # ZLIB uses 'deflate' as encoding
+            if compression_type:
+                # ZLIB uses 'deflate' as encoding
+                self.send_header('Content-Encoding', content_encoding(compression_type))
 
         SimpleHTTPRequestHandler.end_headers(self)
 
@@ -3,6 +3,8 @@ import json
 import sqlite3
 import logging
 from wsgiref.util import shift_path_info
+from vtiles.utils.compression import http_tile
+from vtiles.mbtiles.store import MBTilesReader
 from wsgiref.simple_server import make_server, WSGIServer
 from socketserver import ThreadingMixIn
 
@@ -41,9 +43,8 @@ class MBTilesApplication:
         if tile_image_ext not in SUPPORTED_IMAGE_EXTENSIONS:
             raise InvalidImageExtension(f"{tile_image_ext} not in {SUPPORTED_IMAGE_EXTENSIONS}!")
 
-        self.mbtiles_db = sqlite3.connect(
-            f"file:{mbtiles_filepath}?mode=ro",
-            check_same_thread=False, uri=True)
+        # One read-only reader shared by the request threads, sqlite3 serializing the calls
+        self.reader = MBTilesReader(mbtiles_filepath, check_same_thread=False)
         self.tile_image_ext = tile_image_ext
         self.zoom_offset = zoom_offset
         self.maxzoom = None
@@ -51,7 +52,7 @@ class MBTilesApplication:
 
         # Set content types dynamically based on extension
         self.tile_content_type = self._determine_content_type(tile_image_ext)
-        self.tile_content_encoding = 'gzip' if tile_image_ext == '.pbf' else None
+        self.tile_compression = None
 
         self._populate_supported_zoom_levels()
 
@@ -74,9 +75,16 @@ class MBTilesApplication:
         Query the metadata table and obtain max/min zoom levels,
         setting to self.minzoom, self.maxzoom as integers
         """
-        query = 'SELECT name, value FROM metadata WHERE name="minzoom" OR name="maxzoom";'
-        for name, value in self.mbtiles_db.execute(query):
+        for name in ('minzoom', 'maxzoom'):
+            value = self.reader.metadata_value(name)
+            if value is None:
+                continue
             setattr(self, name.lower(), max(int(value) - self.zoom_offset, 0))
+        # Only needed for brotli tiles, the other compressions are detected from the tiles
+        if self.reader.compression() == 'brotli':
+            self.tile_compression = 'brotli'
+        # Tiles compressed with the zstd dictionary of the tileset are decompressed before being sent
+        self.zstd_dictionary = self.reader.zstd_dictionary()
 
     def __call__(self, environ, start_response):
         if environ['REQUEST_METHOD'] == 'GET':
@@ -84,9 +92,8 @@ class MBTilesApplication:
             base_uri = shift_path_info(environ)
 
             if base_uri == 'metadata':
-                query = 'SELECT * FROM metadata;'
                 try:
-                    metadata_results = self.mbtiles_db.execute(query).fetchall()
+                    metadata_results = list(self.reader.metadata().items())
                     status = '200 OK'
                     response_headers = [('Content-type', 'application/json')]
                     start_response(status, response_headers)
@@ -127,16 +134,14 @@ class MBTilesApplication:
                     start_response(status, response_headers)
                     return [f'Unable to parse PATH_INFO({environ["PATH_INFO"]}), expecting "z/x/y.{ext}"'.encode('utf8'), ' '.join(i for i in e.args).encode('utf8')]
 
-                query = 'SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?;'
-                values = (zoom, x, y)
                 try:
-                    tile_results = self.mbtiles_db.execute(query, values).fetchone()
-                    if tile_results:
-                        tile_data = tile_results[0]
+                    tile_data = self.reader.get_tile(zoom, x, y)
+                    if tile_data is not None:
                         status = '200 OK'
                         response_headers = [('Content-type', self.tile_content_type)]
-                        if self.tile_content_encoding:
-                            response_headers.append(('Content-Encoding', self.tile_content_encoding))
+                        tile_data, encoding = http_tile(tile_data, self.tile_compression, self.zstd_dictionary)
+                        if encoding:
+                            response_headers.append(('Content-Encoding', encoding))
                         start_response(status, response_headers)
                         return [tile_data]
                     else:
@@ -6,6 +6,8 @@ import json
 import re
 from socketserver import ThreadingMixIn
 from vtiles.utils.pmtiles.reader import Reader, MmapSource
+from vtiles.utils.pmtiles.tile import codec_from_compression
+from vtiles.utils.compression import DICTIONARY_METADATA, decode_dictionary, http_tile
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,6 +41,9 @@ def main():
         header = reader.header()
         fmt = header["tile_type"]
         fmt = 'pbf'
+        tile_codec = codec_from_compression(header["tile_compression"])
+        # Tiles compressed with the zstd dictionary of the tileset are decompressed before being sent
+        zstd_dictionary = decode_dictionary(reader.metadata().get(DICTIONARY_METADATA))
 
         class Handler(http.server.SimpleHTTPRequestHandler):
             def do_GET(self):
@@ -68,8 +73,10 @@ def main():
                 if args.cors_allow_all:
                     self.send_header("Access-Control-Allow-Origin", "*")
                 if fmt == "pbf":
+                    data, tile_encoding = http_tile(data, tile_codec, zstd_dictionary)
                     self.send_header("Content-Type", "application/x-protobuf")
-                    self.send_header("Content-Encoding", "gzip")
+                    if tile_encoding:
+                        self.send_header("Content-Encoding", tile_encoding)
                 else:
                     self.send_header("Content-Type", "image/" + fmt)
                 self.end_headers()
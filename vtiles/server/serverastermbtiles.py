@@ -9,10 +9,10 @@ https://github.com/mapbox/mbtiles-spec
 """
 import os
 import json
-import sqlite3
 import mimetypes
 import logging
 from wsgiref.util import shift_path_info
+from vtiles.mbtiles.store import MBTilesReader
 from wsgiref.simple_server import make_server, WSGIServer
 from socketserver import ThreadingMixIn
 
@@ -58,9 +58,8 @@ class MBTilesApplication:
         if tile_image_ext not in SUPPORTED_IMAGE_EXTENSIONS:
             raise InvalidImageExtension("{} not in {}!".format(tile_image_ext, SUPPORTED_IMAGE_EXTENSIONS))
 
-        self.mbtiles_db = sqlite3.connect(
-            "file:{}?mode=ro".format(mbtiles_filepath),
-            check_same_thread=False, uri=True)
+        # One read-only reader shared by the request threads, sqlite3 serializing the calls
+        self.reader = MBTilesReader(mbtiles_filepath, check_same_thread=False)
         self.tile_image_ext = tile_image_ext
         self.tile_content_type = mimetypes.types_map[tile_image_ext.lower()]
         self.zoom_offset = zoom_offset
@@ -75,9 +74,11 @@ class MBTilesApplication:
         setting to self.minzoom, self.maxzoom as integers
         :return: None
         """
-        query = 'SELECT name, value FROM metadata WHERE name="minzoom" OR name="maxzoom";'
         # add maxzoom, minzoom to instance
-        for name, value in self.mbtiles_db.execute(query):
+        for name in ('minzoom', 'maxzoom'):
+            value = self.reader.metadata_value(name)
+            if value is None:
+                continue
             setattr(self, name.lower(), max(int(value) - self.zoom_offset, 0))
 
     def __call__(self, environ, start_response):
@@ -87,8 +88,7 @@ class MBTilesApplication:
 
             # handle 'metadata' requests
             if base_uri == 'metadata':
-                query = 'SELECT * FROM metadata;'
-                metadata_results = self.mbtiles_db.execute(query).fetchall()
+                metadata_results = list(self.reader.metadata().items())
                 if metadata_results:
                     status = '200 OK'
                     response_headers = [('Content-type', 'application/json')]
@@ -123,16 +123,13 @@ class MBTilesApplication:
                     start_response(status, response_headers)
                     return ['Unable to parse PATH_INFO({}), expecting "z/x/y.(png|jpg)"'.format(environ['PATH_INFO']).encode('utf8'), ' '.join(i for i in e.args).encode('utf8')]
 
-                query = 'SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?;'
                 if not USE_OSGEO_TMS_TILE_ADDRESSING:
                     # adjust y to use XYZ google addressing
                     ymax = 1 << zoom
                     y = ymax - y - 1
-                values = (zoom, x, y)
-                tile_results = self.mbtiles_db.execute(query, values).fetchone()
+                tile_result = self.reader.get_tile(zoom, x, y)
 
-                if tile_results:
-                    tile_result = tile_results[0]
+                if tile_result is not None:
                     status = '200 OK'
                     response_headers = [('Content-type', self.tile_content_type)]
                     start_response(status, response_headers)
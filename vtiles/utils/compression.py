@@ -0,0 +1,278 @@
+"""Tile compression codecs: gzip, zlib, zstd and brotli.
+
+gzip, zlib and zstd tiles are recognised by their magic bytes. brotli streams have no magic bytes, so brotli tiles
+can only be decompressed when the codec is known, from the MBTiles `compression` metadata or the PMTiles header.
+zstd needs the `zstandard` package and brotli the `brotli` package.
+
+zstd tiles can be compressed with a dictionary trained on tiles of the tileset, stored base64 encoded in the
+`zstd_dictionary` entry of the MBTiles metadata or of the PMTiles JSON metadata. Such tiles can only be decompressed
+with the dictionary, and can't be sent as is to HTTP clients.
+
+Large tilesets hold many byte-identical tiles (ocean, empty land): `CompressionCache` compresses each distinct tile
+once, `tile_cache` being the cache of the current process. The caches are not shared between processes: with a pool
+of N workers, a tile may be compressed up to N times, unless the parent deduplicates the tiles before sending them,
+as `vtiles.mbtiles.mbtilescompress.transform_mbtiles` does.
+"""
+import base64
+import gzip
+import hashlib
+import zlib
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CODECS = ('gzip', 'zlib', 'zstd', 'brotli')
+
+# gzip.compress compresses at level 9 by default, which is what the tools always used
+DEFAULT_LEVELS = {'gzip': 9, 'zlib': 6, 'zstd': 3, 'brotli': 11}
+LEVEL_RANGES = {'gzip': (1, 9), 'zlib': (1, 9), 'zstd': (1, 22), 'brotli': (0, 11)}
+
+# HTTP Content-Encoding of each codec, zlib streams being sent as 'deflate'
+CONTENT_ENCODINGS = {'gzip': 'gzip', 'zlib': 'deflate', 'zstd': 'zstd', 'brotli': 'br'}
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZLIB_HEADERS = (b'\x78\x01', b'\x78\x5e', b'\x78\x9c', b'\x78\xda')
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Metadata entry holding the base64 encoded zstd dictionary
+DICTIONARY_METADATA = 'zstd_dictionary'
+# Default size of the trained dictionaries, the zstd CLI default
+DEFAULT_DICTIONARY_SIZE = 112640
+# Default memory bound of the compression caches, in compressed bytes
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+# Approximate memory used by a cache entry besides the compressed tile: key, digest and linked list node
+_CACHE_ENTRY_OVERHEAD = 200
+
+_zstd_compressors = {}
+_zstd_decompressors = {}
+_zstd_dictionaries = {}
+
+
+def normalize_codec(codec):
+    """Return the lower case name of `codec`, `None` for no compression ('none', '' or `None`).
+    Raise ValueError for an unknown codec."""
+    if codec is None:
+        return None
+    codec = str(codec).lower()
+    if codec in ('', 'none'):
+        return None
+    if codec == 'deflate':
+        return 'zlib'
+    if codec == 'br':
+        return 'brotli'
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec {codec!r}, expected one of {', '.join(CODECS)} or none.")
+    return codec
+
+
+def check_codec(codec, level=None):
+    """Check that `codec` is available and `level` in its range, raise ValueError or ImportError otherwise."""
+    codec = normalize_codec(codec)
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError("zstd compression needs the zstandard package: pip install zstandard")
+    if codec == 'brotli' and brotli is None:
+        raise ImportError("brotli compression needs the brotli package: pip install brotli")
+    if codec is not None and level is not None:
+        low, high = LEVEL_RANGES[codec]
+        if not low <= level <= high:
+            raise ValueError(f"The {codec} compression level must be between {low} and {high}. {level} provided.")
+    return codec
+
+
+def detect_compression(tile_data):
+    """Return the codec of `tile_data` from its magic bytes: 'gzip', 'zlib', 'zstd' or `None`."""
+    if tile_data[:2] == GZIP_MAGIC:
+        return 'gzip'
+    if tile_data[:2] in ZLIB_HEADERS:
+        return 'zlib'
+    if tile_data[:4] == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+
+def tile_codec(tile_data, codec=None):
+    """Return the codec of `tile_data`: 'brotli' when `codec`, the codec of the tileset, is brotli, the codec
+    detected from its magic bytes otherwise."""
+    return 'brotli' if normalize_codec(codec) == 'brotli' else detect_compression(tile_data)
+
+
+def _zstd_dictionary(dictionary):
+    if dictionary is None:
+        return None
+    zstd_dictionary = _zstd_dictionaries.get(dictionary)
+    if zstd_dictionary is None:
+        zstd_dictionary = _zstd_dictionaries[dictionary] = zstandard.ZstdCompressionDict(dictionary)
+    return zstd_dictionary
+
+
+def compress(data, codec, level=None, dictionary=None):
+    """Compress `data` with `codec` at `level` (the codec default level if `None`), return `data` itself if `codec`
+    is `None`. gzip members are written with a zero mtime, so that identical tiles stay identical. `dictionary` is a
+    zstd dictionary, ignored by the other codecs."""
+    codec = check_codec(codec, level)
+    if codec is None:
+        return data
+    if level is None:
+        level = DEFAULT_LEVELS[codec]
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    if codec == 'zstd':
+        compressor = _zstd_compressors.get((level, dictionary))
+        if compressor is None:
+            compressor = _zstd_compressors[(level, dictionary)] = zstandard.ZstdCompressor(
+                level=level, dict_data=_zstd_dictionary(dictionary))
+        return compressor.compress(data)
+    return brotli.compress(data, quality=level)
+
+
+def decompress(data, codec=None, dictionary=None):
+    """Decompress `data`, return it as is if it is not compressed. The codec is detected from the magic bytes,
+    unless `codec` is 'brotli': brotli streams have none and may start like a zlib or gzip stream. `dictionary` is
+    the zstd dictionary of the tileset, only needed for the tiles compressed with it."""
+    codec = tile_codec(data, codec)
+    if codec is None:
+        return data
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    check_codec(codec)
+    if codec == 'zstd':
+        if not uses_dictionary(data):
+            dictionary = None
+        decompressor = _zstd_decompressors.get(dictionary)
+        if decompressor is None:
+            decompressor = _zstd_decompressors[dictionary] = zstandard.ZstdDecompressor(
+                dict_data=_zstd_dictionary(dictionary))
+        try:
+            return decompressor.decompress(data)
+        except zstandard.ZstdError:
+            if uses_dictionary(data) and dictionary is None:
+                raise
+            # Frames written without their content size can't be decompressed in one shot
+            with decompressor.stream_reader(data) as reader:
+                return reader.read()
+    return brotli.decompress(data)
+
+
+def content_encoding(codec):
+    """Return the HTTP Content-Encoding of `codec`, `None` if it is not compressed."""
+    codec = normalize_codec(codec)
+    return CONTENT_ENCODINGS[codec] if codec else None
+
+
+def tile_content_encoding(tile_data, codec=None):
+    """Return the HTTP Content-Encoding of `tile_data`, detected from its magic bytes unless `codec` is 'brotli'."""
+    return content_encoding(tile_codec(tile_data, codec))
+
+
+def http_tile(tile_data, codec=None, dictionary=None):
+    """Return `tile_data` as sent to HTTP clients and its Content-Encoding: tiles compressed with a zstd dictionary
+    are decompressed, as clients don't have the dictionary, the other tiles are sent as they are."""
+    if dictionary is not None and uses_dictionary(tile_data):
+        return decompress(tile_data, 'zstd', dictionary), None
+    return tile_data, tile_content_encoding(tile_data, codec)
+
+
+def uses_dictionary(tile_data):
+    """Tell whether `tile_data` is a zstd frame compressed with a dictionary."""
+    if tile_data[:4] != ZSTD_MAGIC:
+        return False
+    check_codec('zstd')
+    return zstandard.get_frame_parameters(tile_data).dict_id != 0
+
+
+def train_dictionary(samples, dict_size=DEFAULT_DICTIONARY_SIZE):
+    """Train a zstd dictionary of at most `dict_size` bytes on `samples`, a list of uncompressed tiles, and return
+    it as bytes. zstd needs a few hundred samples at least."""
+    check_codec('zstd')
+    return zstandard.train_dictionary(dict_size, list(samples)).as_bytes()
+
+
+def encode_dictionary(dictionary):
+    """Return `dictionary` as the text stored in the metadata."""
+    return base64.b64encode(dictionary).decode('ascii')
+
+
+def decode_dictionary(value):
+    """Return the dictionary stored in the metadata as `value`, `None` if there is none."""
+    return base64.b64decode(value) if value else None
+
+
+class CompressionCache:
+    """LRU cache of compressed tiles, keyed by a blake2b digest of the uncompressed tile and by the codec, level and
+    dictionary, so that each distinct tile is compressed once. The cache holds at most `max_bytes` of compressed
+    tiles, the least recently used ones being evicted first. `hits` and `misses` count the lookups."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses
+
+    @property
+    def hit_ratio(self):
+        """Return the share of the lookups served from the cache, 0 before the first lookup."""
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def compress(self, data, codec, level=None, dictionary=None):
+        """Return `compress(data, codec, level, dictionary)`, computed once per distinct `data`."""
+        codec = check_codec(codec, level)
+        if codec is None:
+            return data
+        if level is None:
+            level = DEFAULT_LEVELS[codec]
+        key = (hashlib.blake2b(data, digest_size=16).digest(), codec, level,
+               dictionary if codec == 'zstd' else None)
+        compressed = self._entries.get(key)
+        if compressed is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return compressed
+        self.misses += 1
+        compressed = compress(data, codec, level, dictionary)
+        entry_size = len(compressed) + _CACHE_ENTRY_OVERHEAD
+        if entry_size <= self.max_bytes:
+            self._entries[key] = compressed
+            self.size += entry_size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted) + _CACHE_ENTRY_OVERHEAD
+        return compressed
+
+    def clear(self):
+        """Empty the cache and reset the counters."""
+        self._entries.clear()
+        self.size = self.hits = self.misses = 0
+
+    def summary(self):
+        """Return the hit ratio as a log line."""
+        return cache_summary(self.hits, self.lookups)
+
+
+def cache_summary(hits, lookups):
+    """Return the log line reporting `hits` out of `lookups` compression cache lookups, as summed over processes."""
+    ratio = hits / lookups if lookups else 0.0
+    return (f"Compression cache: {hits} of {lookups} tiles ({ratio:.1%}) reused an already compressed tile, "
+            f"{lookups - hits} compressed.")
+
+
+tile_cache = CompressionCache()
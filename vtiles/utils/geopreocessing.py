@@ -14,9 +14,10 @@ import boto3
 import requests
 import ujson
 import sqlite3
-from vtiles.utils.mapbox_vector_tile import decode
-import zlib, gzip
+from vtiles.utils.mapbox_vector_tile import decode, summarize
+from vtiles.utils.compression import decompress, detect_compression, uses_dictionary
 import vtiles.utils.mercantile as mercantile
+from vtiles.mbtiles.store import open_reader
 import binascii
 CHUNK_SIZE = 1024
 
@@ -123,172 +124,138 @@ def fix_wkt(data):
     return result
 
 
+# The helpers reading an MBTiles take a path or an open vtiles.mbtiles.store.MBTilesReader, which a job calling
+# several of them can share instead of opening a connection in each one
+def read_zstd_dictionary(mbtiles):
+    """Return the zstd dictionary stored in the metadata of mbtiles, None if there is none."""
+    try:
+        with open_reader(mbtiles) as reader:
+            return reader.zstd_dictionary()
+    except sqlite3.Error:
+        return None
+
 # Check if mbtiles is vector
 def check_vector(mbtiles):   
     compression_type = None
     try:   
-        conn = sqlite3.connect(mbtiles)
-        cursor = conn.cursor()
-        cursor.execute("SELECT tile_data FROM tiles LIMIT 1")
-        tile_data = cursor.fetchone()[0]
-                  
-        if tile_data[:2] == b'\x1f\x8b':
-            compression_type = 'GZIP'
-            tile_data = gzip.decompress(tile_data)
-        elif tile_data[:2] == b'\x78\x9c' or tile_data[:2] == b'\x78\x01' or tile_data[:2] == b'\x78\xda':
-            compression_type = 'ZLIB'
-            tile_data = zlib.decompress(tile_data)
+        with open_reader(mbtiles) as reader:
+            tile_data = reader.first_tile()
+
+            codec = detect_compression(tile_data)
+            if codec is None:
+                try:
+                    decode(tile_data)
+                    return True, compression_type
+                except Exception:
+                    # brotli tiles have no magic bytes
+                    codec = 'brotli'
+            tile_data = decompress(tile_data, codec, reader.zstd_dictionary() if uses_dictionary(tile_data) else None)
+        compression_type = codec.upper()
         decode(tile_data)
         return True, compression_type
     except:
         return False, compression_type
-    finally:
-        cursor.close()
-        conn.close()
 
 def determine_tileformat(mbtiles):
     tile_format = ''  
-    conn = sqlite3.connect(mbtiles)
-    cursor = conn.cursor()    
     try:
-        # Open database connection and cursor
-        is_vector,_ = check_vector(mbtiles)
-        if is_vector:
-            tile_format = 'pbf'
-        else: 
-            # Get a tile's binary data from the tiles table
-            cursor.execute("SELECT tile_data FROM tiles LIMIT 1;")
-            tile_data = cursor.fetchone()[0]  # Access the first element of the tuple
-            
-            if tile_data:
-                # Convert the binary data to a hex string for inspection
-                hex_data = binascii.hexlify(tile_data[:12]).decode('utf-8')            
-                # Check the format based on the hex data
-                if hex_data.startswith('52494646') and '57454250' in hex_data:  # WebP
-                    tile_format = 'webp'  # WebP format
-                elif hex_data.startswith('89504e47'):
-                    tile_format = 'png'  # PNG format
-                elif hex_data.startswith('ffd8ff'):
-                    tile_format = 'jpg'  # JPG format
-                else:
-                    tile_format='unknown' # Unknown format if none match
+        with open_reader(mbtiles) as reader:
+            is_vector,_ = check_vector(reader)
+            if is_vector:
+                tile_format = 'pbf'
+            else: 
+                # Get a tile's binary data from the tiles table
+                tile_format = detect_tile_format(reader.first_tile())
     except Exception as e:
         print (f"Error reading format from tile_data: {e}")
-    
-    finally:
-        cursor.close()
-        conn.close()
 
     return tile_format  # Return the determined tile_format
 
-def decode_tile_data(tile_data):   
+def detect_tile_format(tile_data):
+    """Return the raster format of tile_data from its first bytes: webp, png, jpg or unknown, '' without tile_data."""
+    tile_format = ''
+    if tile_data:
+        # Convert the binary data to a hex string for inspection
+        hex_data = binascii.hexlify(tile_data[:12]).decode('utf-8')            
+        # Check the format based on the hex data
+        if hex_data.startswith('52494646') and '57454250' in hex_data:  # WebP
+            tile_format = 'webp'  # WebP format
+        elif hex_data.startswith('89504e47'):
+            tile_format = 'png'  # PNG format
+        elif hex_data.startswith('ffd8ff'):
+            tile_format = 'jpg'  # JPG format
+        else:
+            tile_format='unknown' # Unknown format if none match
+    return tile_format
+
+def read_vector_tile(tile_data, read, codec=None, dictionary=None):
+    """Decompress tile_data and read it with read (decode or summarize). Without codec, a tile with no magic bytes
+    which can't be read as is is tried as a brotli tile. dictionary is the zstd dictionary of the tileset."""
+    if codec is None and detect_compression(tile_data) is None:
+        try:
+            return read(tile_data)
+        except Exception:
+            try:
+                tile_data = decompress(tile_data, 'brotli')
+            except Exception:
+                pass
+    else:
+        tile_data = decompress(tile_data, codec, dictionary)
+    return read(tile_data)
+
+def decode_tile_data(tile_data, codec=None, dictionary=None):   
     try:
-        if tile_data[:2] == b'\x1f\x8b':  # GZip compressed
-            tile_data = gzip.decompress(tile_data)
-        elif tile_data[:2] in (b'\x78\x9c', b'\x78\x01', b'\x78\xda'):  # Zlib compressed
-            tile_data = zlib.decompress(tile_data)
-        decoded_tile = decode(tile_data)    
+        decoded_tile = read_vector_tile(tile_data, decode, codec, dictionary)
     except Exception as e:
         print(f"Error decoding tile data: {e}")
         return None  # Handle failure gracefully
     return decoded_tile
 
+def summarize_tile_data(tile_data, codec=None, dictionary=None):
+    """Summarize layers, fields and feature counts of a tile without decoding its geometries.
+    codec is only needed for brotli tiles, the other compressions being detected, and dictionary for tiles
+    compressed with the zstd dictionary of the tileset."""
+    try:
+        tile_summary = read_vector_tile(tile_data, summarize, codec, dictionary)
+    except Exception as e:
+        print(f"Error summarizing tile data: {e}")
+        return None
+    return tile_summary
+
 
 def count_tiles(mbtiles):
     """Count the number of tiles in the MBTiles file."""
-    num_tiles = None
-    connection = sqlite3.connect(mbtiles)
-    cursor = connection.cursor()
-    cursor.execute("SELECT COUNT(*) FROM tiles")
-    num_tiles = cursor.fetchone()[0]   
-    
-    cursor.close()
-    connection.close()    
-    
-    return num_tiles
+    with open_reader(mbtiles) as reader:
+        return reader.count()
 
 def count_tiles_for_each_zoom(mbtiles):
     """Count the number of tiles for each zoom level in the tiles table."""
-    conn = sqlite3.connect(mbtiles)
-    cursor = conn.cursor()
-
-    query = """
-    SELECT zoom_level, COUNT(*) AS tile_count
-    FROM tiles
-    GROUP BY zoom_level
-    ORDER BY zoom_level;
-    """
-    
-    cursor.execute(query)
-    results = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-    return results
+    with open_reader(mbtiles) as reader:
+        return reader.count_by_zoom()
 
 def find_duplicates(mbtiles):
     """Find duplicate rows in the tiles table and calculate the total number of duplicates."""
-    conn = sqlite3.connect(mbtiles)
-    cursor = conn.cursor()
-
-    query = """
-    SELECT zoom_level, tile_column, tile_row, COUNT(*) AS count
-    FROM tiles
-    GROUP BY zoom_level, tile_column, tile_row
-    HAVING COUNT(*) > 1
-    ORDER BY count DESC
-    """
-    
-    cursor.execute(query)
-    duplicates = cursor.fetchall()
+    with open_reader(mbtiles) as reader:
+        duplicates = reader.duplicates()
 
     # Calculate the total number of duplicate rows
     total_duplicates = sum(count - 1 for _, _, _, count in duplicates)
 
-    conn.close()
-    
     return duplicates, total_duplicates
 
 def get_zoom_levels(mbtiles):
-    conn = sqlite3.connect(mbtiles)
-    cursor = conn.cursor()
-    
-    # Query to get min and max zoom levels
-    cursor.execute('''
-        SELECT MIN(zoom_level) AS min_zoom, MAX(zoom_level) AS max_zoom
-        FROM tiles
-    ''')
-    
-    result = cursor.fetchone()    
-
-    cursor.close()
-    conn.close()    
-    min_zoom = result[0] if result else None
-    max_zoom = result[1] if result else None  
-
-    return min_zoom, max_zoom
-
-def get_bounds_at_zoom(mbtiles, zoom_level):
-    # Connect to the MBTiles SQLite database
-    conn = sqlite3.connect(mbtiles)
-    cursor = conn.cursor()
-
-    # Query tiles at the specified zoom level
-    cursor.execute("SELECT tile_column, tile_row FROM tiles WHERE zoom_level = ?", (zoom_level,))
-    tiles = cursor.fetchall()
-
-    # Calculate bounding boxes for each tile
-    bounds = []
-    for tile in tiles:
-        x, y = tile
-        flip_y = (1 << zoom_level) - 1 - y # TMS scheme
-        # Calculate bounds for the given tile coordinates
-        tile_bounds = mercantile.bounds(x,flip_y, zoom_level)
-        bounds.append(tile_bounds)
-
-    cursor.close()
-    conn.close()
-    return bounds
+    # Min and max zoom levels
+    with open_reader(mbtiles) as reader:
+        return reader.zoom_range()
+
+def tile_range_bounds(zoom_level, min_column, max_column, min_row, max_row):
+    """Return the (west, south, east, north) bounds of the tiles of zoom_level from min_column to max_column and from
+    min_row to max_row (TMS rows), from the bounds of the two corner tiles."""
+    flip = (1 << zoom_level) - 1
+    # The max TMS row is the northernmost row
+    west, _, _, north = mercantile.bounds(min_column, flip - max_row, zoom_level)
+    _, south, east, _ = mercantile.bounds(max_column, flip - min_row, zoom_level)
+    return west, south, east, north
 
 def compute_max_bound(bounds):
     # Initialize min and max coordinates with extreme values
@@ -314,9 +281,10 @@ def compute_max_bound(bounds):
 def get_bounds_center(mbtiles):   
     boundsString, centerString = None, None
     try:    
-        _,max_zoom = get_zoom_levels(mbtiles)
-        bounds_at_max_zoom = get_bounds_at_zoom(mbtiles, max_zoom)
-        bounds = compute_max_bound(bounds_at_max_zoom)
+        # The extent of the max zoom level, in a single aggregate query
+        with open_reader(mbtiles) as reader:
+            max_zoom, *tile_range = reader.tile_range()
+        bounds = compute_max_bound([tile_range_bounds(max_zoom, *tile_range)])
         boundsString = ','.join(map(str, bounds[:4]))
         centerString = ','.join(map(str, bounds[4:]))+ f',{max_zoom}'     
         return boundsString, centerString
@@ -1,9 +1,20 @@
 import warnings
 
-from . import decoder, encoder
-
-
-def decode(tile, per_layer_options=None, default_options=None, **kwargs):
+from . import columnar, decoder, encoder, wire
+from .columnar import FeatureTable
+from .encoder import EncodedGeometry, TileGeometry
+
+
+def decode(
+    tile,
+    per_layer_options=None,
+    default_options=None,
+    layers=None,
+    exclude_layers=None,
+    output="dict",
+    geometry="geojson",
+    **kwargs,
+):
     """Decode the provided `tile`
 
     Args:
@@ -19,6 +30,29 @@ def decode(tile, per_layer_options=None, default_options=None, **kwargs):
             These options are taken for layers without entry in `per_layer_options`. For all missing options values,
             the global default values are taken.
 
+        stats:
+            An optional dictionary updated with the numbers of checked polygons (`"validated"`) and of invalid ones
+            (`"invalid"`) once the tile is encoded.
+
+        layers:
+            An optional collection of layer names to decode. The other layers are skipped at the wire level, before
+            any parsing. All layers are decoded when it is `None`.
+
+        exclude_layers:
+            An optional collection of layer names to skip at the wire level.
+
+        output:
+            `"dict"` to decode each feature into a dictionary, `"columnar"` to decode each layer into a `FeatureTable`
+            holding NumPy arrays of ids, types, tile coordinates with their offsets and tag indices, along with the
+            key and value tables. Only the `y_coord_down` option applies to the columnar output. Default to `"dict"`.
+
+        geometry:
+            `"geojson"` to decode the geometries into GeoJSON-like dictionaries, `"shapely"` to build them as shapely
+            geometries, in bulk per layer with the shapely vectorized constructors. With the columnar output, they are
+            stored in the `geometries` attribute of each `FeatureTable`. The `transformer` option is not supported
+            with shapely geometries, they stay in tile space. Features without a valid geometry, such as polygons
+            of zero area, get an empty shapely geometry of the type `"geojson"` gives them. Default to `"geojson"`.
+
     Returns:
         The decoded layers data.
 
@@ -35,17 +69,54 @@ def decode(tile, per_layer_options=None, default_options=None, **kwargs):
     if kwargs:
         warnings.warn("`decode` signature has changed, use `default_options` instead", DeprecationWarning, stacklevel=2)
         default_options = {**kwargs, **(default_options or {})}
+    if layers is not None or exclude_layers is not None:
+        tile = wire.filter_layers(tile, layers=layers, exclude_layers=exclude_layers)
+    if output not in ("dict", "columnar"):
+        raise ValueError(f"The output must be 'dict' or 'columnar'. {output!r} provided.")
+    if geometry not in ("geojson", "shapely"):
+        raise ValueError(f"The geometry must be 'geojson' or 'shapely'. {geometry!r} provided.")
+    if output == "columnar":
+        return columnar.decode_tile(
+            tile,
+            per_layer_options=per_layer_options,
+            default_options=default_options,
+            shapely_geometries=geometry == "shapely",
+        )
+    if geometry == "shapely":
+        return columnar.decode_shapely(tile, per_layer_options=per_layer_options, default_options=default_options)
     vector_tile = decoder.TileData(pbf_data=tile, per_layer_options=per_layer_options, default_options=default_options)
     message = vector_tile.get_message()
     return message
 
 
-def encode(layers, per_layer_options=None, default_options=None, **kwargs):
+def summarize(tile):
+    """Summarize the provided `tile` without decoding any geometry.
+
+    Only the layer names, versions, extents, keys, value types, feature types and feature counts are read from the
+    wire format, which makes it much cheaper than `decode` when the geometries are not needed.
+
+    Args:
+        tile:
+            The tile to summarize.
+
+    Returns:
+        A dictionary mapping each layer name to a dictionary holding its `version`, `extent`, `keys`, the number of
+        `features`, the number of features per geometry type (`"Point"`, `"LineString"`, `"Polygon"` or `"Unknown"`)
+        in `geometry_types` and, in `fields`, the Python type name (`"str"`, `"int"`, `"float"` or `"bool"`) of the
+        first value found for each key.
+    """
+    return wire.summarize(tile)
+
+
+def encode(layers, per_layer_options=None, default_options=None, stats=None, **kwargs):
     """Encode the `layers` into a MVT tile.
 
     Args:
         layers:
-            The layer data to encode.
+            The layer data to encode. The geometry of a feature can be a WKT or WKB string, a shapely geometry, a
+            GeoJSON-like dictionary or, for geometries already in tile space, an `EncodedGeometry` holding the MVT
+            commands or a `TileGeometry` holding the tile coordinates. These two last ones are encoded directly,
+            without going through shapely.
 
         per_layer_options:
             An optional dictionary containing per layer options. The keys are the layer names and the values are
@@ -78,6 +149,14 @@ def encode(layers, per_layer_options=None, default_options=None, **kwargs):
             * `check_winding_order`: it forces the check of the winding order for polygons. Default to True.
             * `max_geometry_validate_tries`: the number of tries when trying to enforce the good winding order. Default
             to 5.
+            * `validate`: how polygons are checked when `check_winding_order` is `True`. Default to `"full"`.
+                * `"full"`: every polygon is rebuilt with rounded coordinates, oriented and checked for validity.
+                * `"sample"`: only one polygon out of `validate_sample_rate` is, the others are encoded as they are.
+                * `"none"`: polygons are trusted and encoded as they are, e.g. when re-encoding geometries decoded
+                from a valid tile.
+            * `validate_sample_rate`: the sampling rate of the `"sample"` validation. Default to 100.
+            * `trusted`: a shortcut for `validate="none"` when set to `True`, whatever the `validate` option is.
+            Default to `False`.
     """
     if kwargs:
         warnings.warn("`encode` signature has changed, use `default_options` instead", DeprecationWarning, stacklevel=2)
@@ -95,4 +174,9 @@ def encode(layers, per_layer_options=None, default_options=None, **kwargs):
         layer_options = per_layer_options.get(layer_name, None)
         vector_tile.add_layer(features=layers["features"], name=layer_name, options=layer_options)
 
+    if stats is not None:
+        stats.update(vector_tile.stats)
     return vector_tile.tile.SerializeToString()
+
+
+from .batch import decode_many, encode_many, map_many  # noqa: E402
@@ -0,0 +1,171 @@
+import atexit
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from ..compression import check_codec, compress, decompress
+from . import decode, encode
+
+_pool = None
+_pool_workers = None
+
+
+def get_pool(workers=None):
+    """Return the persistent process pool shared by `encode_many` and `decode_many`, creating it on first use.
+
+    The pool is recreated when a different number of `workers` is asked for. It is shut down at exit, or by
+    `shutdown_pool`.
+    """
+    global _pool, _pool_workers
+    workers = workers or os.cpu_count() or 1
+    if _pool is not None and _pool_workers != workers:
+        shutdown_pool()
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    """Shut the persistent process pool down, the next batch call creates a new one."""
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+        _pool_workers = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _decode_chunk(tiles, detect_compression, codec, dictionary, kwargs):
+    return [decode(decompress(tile, codec, dictionary) if detect_compression else tile, **kwargs) for tile in tiles]
+
+
+def _encode_chunk(layers_list, compression, kwargs):
+    return [compress(encode(layers, **kwargs), compression) for layers in layers_list]
+
+
+def _map_chunk(items, func):
+    return [func(item) for item in items]
+
+
+def _run_chunks(func, items, args, chunk_size, workers, max_pending):
+    """Apply `func(chunk, *args)` to the chunks of `items` and yield the results in the input order.
+
+    With one worker the chunks are processed in the current process. Otherwise they are submitted to the persistent
+    pool, with at most `max_pending` chunks in flight so that a large or endless `items` iterable is consumed at the
+    pace of the caller.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"The chunk_size must be positive. {chunk_size} provided.")
+    items = iter(items)
+    chunks = iter(lambda: list(islice(items, chunk_size)), [])
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for chunk in chunks:
+            yield from func(chunk, *args)
+        return
+
+    pool = get_pool(workers)
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(func, chunk, *args))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def decode_many(
+    tiles, detect_compression=True, chunk_size=64, workers=None, max_pending=None, codec=None, dictionary=None, **kwargs
+):
+    """Decode the serialized `tiles` on the persistent process pool.
+
+    Args:
+        tiles:
+            An iterable of serialized tiles, consumed lazily.
+
+        detect_compression:
+            Decompress the gzip, zlib or zstd compressed tiles in the workers, detected from their magic bytes.
+            Default to `True`.
+
+        chunk_size:
+            The number of tiles sent to a worker at once. Default to 64.
+
+        workers:
+            The number of worker processes, the number of CPUs when `None`. With a single worker, the tiles are
+            decoded in the current process.
+
+        max_pending:
+            The maximum number of chunks in flight, twice the number of workers when `None`.
+
+        codec:
+            The codec of the tileset, only needed for brotli tiles, which have no magic bytes.
+
+        dictionary:
+            The zstd dictionary of the tileset, only needed for the tiles compressed with it.
+
+        kwargs:
+            The arguments of `decode`. They are sent to the workers, so they must be picklable: a `transformer`
+            must be a module-level function.
+
+    Returns:
+        A generator of the decoded tiles, in the order of `tiles`.
+    """
+    args = (detect_compression, codec, dictionary, kwargs)
+    return _run_chunks(_decode_chunk, tiles, args, chunk_size, workers, max_pending)
+
+
+def encode_many(layers_list, compression=None, chunk_size=64, workers=None, max_pending=None, **kwargs):
+    """Encode the tiles described by `layers_list` on the persistent process pool.
+
+    Args:
+        layers_list:
+            An iterable of `layers` arguments of `encode`, one per tile, consumed lazily.
+
+        compression:
+            `"gzip"`, `"zlib"`, `"zstd"` or `"brotli"` to compress the encoded tiles in the workers, at the default
+            level of the codec. Default to `None`.
+
+        chunk_size:
+            The number of tiles sent to a worker at once. Default to 64.
+
+        workers:
+            The number of worker processes, the number of CPUs when `None`. With a single worker, the tiles are
+            encoded in the current process.
+
+        max_pending:
+            The maximum number of chunks in flight, twice the number of workers when `None`.
+
+        kwargs:
+            The arguments of `encode`. They are sent to the workers, so they must be picklable.
+
+    Returns:
+        A generator of the encoded tiles, in the order of `layers_list`.
+    """
+    check_codec(compression)  # check the compression before starting
+    return _run_chunks(_encode_chunk, layers_list, (compression, kwargs), chunk_size, workers, max_pending)
+
+
+def map_many(func, items, chunk_size=64, workers=None, max_pending=None):
+    """Apply `func` to the `items` on the persistent process pool, as the lazy, order preserving `map` of
+    `decode_many` and `encode_many`.
+
+    Args:
+        func:
+            A picklable callable of one argument: a module-level function or a `functools.partial` of one.
+
+        items:
+            An iterable of picklable items, consumed lazily.
+
+        chunk_size, workers, max_pending:
+            As in `decode_many`.
+
+    Returns:
+        A generator of the results, in the order of `items`.
+    """
+    return _run_chunks(_map_chunk, items, (func,), chunk_size, workers, max_pending)
@@ -0,0 +1,351 @@
+import numpy as np
+import shapely
+
+from .utils import CMD_BITS, CMD_LINE_TO, CMD_MASK, CMD_MOVE_TO, LINESTRING, POINT, POLYGON, get_decode_options
+from .wire import LayerReader, iter_layers, unpack_varints_numpy
+
+# Geometry of the features of each type left without any valid part, of the type the dictionary decoding gives them
+EMPTY_GEOMETRIES = {
+    POINT: shapely.MultiPoint(),
+    LINESTRING: shapely.LineString(),
+    POLYGON: shapely.MultiPolygon(),
+}
+
+
+class FeatureTable:
+    """Columnar decoding of a layer: the features are stored in a few NumPy arrays instead of one dictionary per
+    feature.
+
+    The geometries are stored as in GeoArrow: `coordinates` holds the points of all the features, `part_offsets`
+    splits them into parts (a run of points, a line or a ring) and `geometry_offsets` splits the parts into features.
+    The points of the part `j` are `coordinates[part_offsets[j]:part_offsets[j + 1]]` and the parts of the feature `i`
+    are the parts `geometry_offsets[i]` to `geometry_offsets[i + 1]` excluded. Rings are not closed and are not grouped
+    into polygons, their winding order tells the exterior rings from the interior ones.
+
+    Attributes:
+        name: The layer name.
+        extent: The layer extent.
+        version: The layer version.
+        keys: The list of the layer keys.
+        values: The list of the layer values, as Python values.
+        ids: The `uint64` array of the feature ids, 0 when missing.
+        types: The `uint8` array of the MVT geometry types.
+        coordinates: The `int32` array of shape `(n, 2)` of the tile coordinates of all the points.
+        part_offsets: The `int64` array of the start of each part in `coordinates`, followed by the number of points.
+        geometry_offsets: The `int64` array of the first part of each feature, followed by the number of parts.
+        tag_keys: The `uint32` array of the key indices of the tags of all the features.
+        tag_values: The `uint32` array of the value indices of the tags of all the features.
+        tag_offsets: The `int64` array of the first tag of each feature, followed by the number of tags.
+        geometries: The array of the shapely geometries of the features when decoded with `geometry="shapely"`,
+            `None` otherwise.
+    """
+
+    def __init__(self, name, extent, version, keys, values, ids, types, coordinates, part_offsets, geometry_offsets,
+                 tag_keys, tag_values, tag_offsets):
+        self.name = name
+        self.extent = extent
+        self.version = version
+        self.keys = keys
+        self.values = values
+        self.ids = ids
+        self.types = types
+        self.coordinates = coordinates
+        self.part_offsets = part_offsets
+        self.geometry_offsets = geometry_offsets
+        self.tag_keys = tag_keys
+        self.tag_values = tag_values
+        self.tag_offsets = tag_offsets
+        self.geometries = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def parts(self, index):
+        """Return the list of the coordinate arrays of the parts of the feature `index`."""
+        offsets = self.part_offsets[self.geometry_offsets[index] : self.geometry_offsets[index + 1] + 1]
+        return [self.coordinates[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def properties(self, index):
+        """Return the properties dictionary of the feature `index`."""
+        start, end = self.tag_offsets[index], self.tag_offsets[index + 1]
+        return {
+            self.keys[key_idx]: self.values[val_idx]
+            for key_idx, val_idx in zip(self.tag_keys[start:end].tolist(), self.tag_values[start:end].tolist())
+        }
+
+    def column(self, key):
+        """Return the list of the values of the property `key` of every feature, `None` where it is missing."""
+        result = [None] * len(self)
+        if key not in self.keys:
+            return result
+        mask = self.tag_keys == self.keys.index(key)
+        features = np.searchsorted(self.tag_offsets, np.flatnonzero(mask), side="right") - 1
+        for feature, val_idx in zip(features.tolist(), self.tag_values[mask].tolist()):
+            result[feature] = self.values[val_idx]
+        return result
+
+    def to_shapely(self):
+        """Return the geometries of the features as a NumPy array of shapely geometries.
+
+        The geometries are built per geometry type with the shapely vectorized constructors. As in the dictionary
+        decoding, polygon rings of zero area are dropped and a new polygon starts at each ring having the winding order
+        of the first ring of the feature. A feature left without any valid part (no geometry, only zero-area rings,
+        lines of a single point) gets an empty geometry: a `MultiPoint`, a `LineString` or a `MultiPolygon` as in the
+        dictionary decoding. Only the features of unknown geometry type get `None`.
+        """
+        geometries = np.full(len(self), None, dtype=object)
+        part_lengths = np.diff(self.part_offsets)
+        part_features = np.repeat(np.arange(len(self)), np.diff(self.geometry_offsets))
+        point_parts = np.repeat(np.arange(len(part_lengths)), part_lengths)
+        coordinates = self.coordinates.astype(np.float64)
+
+        for geom_type, build in ((POINT, _build_points), (LINESTRING, _build_lines), (POLYGON, _build_polygons)):
+            part_mask = self.types[part_features] == geom_type
+            if not part_mask.any():
+                continue
+            point_mask = part_mask[point_parts]
+            # renumber the selected parts and features from 0
+            _, part_index = np.unique(point_parts[point_mask], return_inverse=True)
+            features, feature_index = np.unique(part_features[part_mask], return_inverse=True)
+            geometries[features] = build(coordinates[point_mask], part_index, feature_index)
+
+        missing = shapely.is_missing(geometries)
+        for geom_type, empty in EMPTY_GEOMETRIES.items():
+            for i in np.flatnonzero(missing & (self.types == geom_type)):
+                geometries[i] = empty
+        return geometries
+
+
+def _single_or_multi(parts, part_features, multi):
+    """Return per feature the only one of its `parts` or, when it has several, the `multi` geometry gathering them."""
+    counts = np.bincount(part_features)
+    result = np.empty(len(counts), dtype=object)
+    single = counts == 1
+    result[single] = parts[single[part_features]]
+    if not single.all():
+        several = ~single[part_features]
+        _, indices = np.unique(part_features[several], return_inverse=True)
+        result[~single] = multi(parts[several], indices=indices)
+    return result
+
+
+def _build_points(coordinates, part_index, part_features):
+    # a single run of points per feature: each feature has one part
+    points = shapely.points(coordinates)
+    return _single_or_multi(points, part_features[part_index], shapely.multipoints)
+
+
+def _select_parts(coordinates, part_index, part_features, kept):
+    """Keep only the parts flagged in `kept`, renumbering them from 0."""
+    point_mask = kept[part_index]
+    _, part_index = np.unique(part_index[point_mask], return_inverse=True)
+    return coordinates[point_mask], part_index, part_features[kept]
+
+
+def _build_lines(coordinates, part_index, part_features):
+    geometries = np.full(part_features.max() + 1, None, dtype=object)
+    # lines need at least two points
+    coordinates, part_index, line_features = _select_parts(
+        coordinates, part_index, part_features, np.bincount(part_index) >= 2
+    )
+    if len(line_features) == 0:
+        return geometries
+    lines = shapely.linestrings(coordinates, indices=part_index)
+    features, feature_index = np.unique(line_features, return_inverse=True)
+    geometries[features] = _single_or_multi(lines, feature_index, shapely.multilinestrings)
+    return geometries
+
+
+def _build_polygons(coordinates, part_index, part_features):
+    geometries = np.full(part_features.max() + 1, None, dtype=object)
+
+    # signed area of each ring with the shoelace formula, the ring being closed on its first point
+    starts = np.flatnonzero(np.r_[True, part_index[1:] != part_index[:-1]])
+    following = np.arange(1, len(coordinates) + 1)
+    following[np.r_[starts[1:] - 1, len(coordinates) - 1]] = starts
+    x, y = coordinates[:, 0], coordinates[:, 1]
+    areas = np.add.reduceat(x * y[following] - x[following] * y, starts)
+
+    kept = areas != 0
+    coordinates, part_index, ring_features = _select_parts(coordinates, part_index, part_features, kept)
+    if len(ring_features) == 0:
+        return geometries
+    signs = np.sign(areas[kept])
+    rings = shapely.linearrings(coordinates, indices=part_index)
+
+    first_rings = np.flatnonzero(np.r_[True, ring_features[1:] != ring_features[:-1]])
+    exteriors = signs == np.repeat(signs[first_rings], np.diff(np.r_[first_rings, len(rings)]))
+    polygons = shapely.polygons(rings, indices=np.cumsum(exteriors) - 1)
+    features, feature_index = np.unique(ring_features[exteriors], return_inverse=True)
+    geometries[features] = _single_or_multi(polygons, feature_index, shapely.multipolygons)
+    return geometries
+
+
+def _unpack_concatenated(chunks):
+    """Unpack the packed varint field contents `chunks` at once.
+
+    Returns:
+        The `int64` array of all the integers and the `int64` array of the offset of the first integer of each chunk,
+        followed by the number of integers.
+    """
+    data = b"".join(chunks)
+    byte_offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(chunk) for chunk in chunks], out=byte_offsets[1:])
+    values = unpack_varints_numpy(data).astype(np.int64)
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) < 0x80)
+    return values, np.searchsorted(ends, byte_offsets)
+
+
+def _decode_geometries(commands, offsets, extent, y_coord_down):
+    """Decode the geometry command integers `commands` of all the features of a layer, `offsets` giving the first
+    integer of each feature.
+
+    Only the command integers are walked in Python, the parameters are gathered, zig-zag decoded and summed into
+    absolute coordinates with NumPy.
+
+    Returns:
+        The `coordinates`, `part_offsets` and `geometry_offsets` arrays as described in `FeatureTable`.
+    """
+    command_list = commands.tolist()
+    run_starts = []
+    run_lengths = []
+    part_starts = []
+    feature_parts = [0]
+    feature_pairs = [0]
+    pairs = 0
+    for feature_start, feature_end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        i = feature_start
+        while i < feature_end:
+            header = command_list[i]
+            cmd = header & CMD_MASK
+            cmd_len = header >> CMD_BITS
+            i += 1
+            if cmd == CMD_MOVE_TO or cmd == CMD_LINE_TO:
+                if cmd == CMD_MOVE_TO or len(part_starts) == feature_parts[-1]:
+                    part_starts.append(pairs)
+                run_starts.append(i)
+                run_lengths.append(cmd_len)
+                pairs += cmd_len
+                i += 2 * cmd_len
+        feature_parts.append(len(part_starts))
+        feature_pairs.append(pairs)
+
+    run_lengths = np.array(run_lengths, dtype=np.int64)
+    run_offsets = np.zeros(len(run_lengths), dtype=np.int64)
+    np.cumsum(run_lengths[:-1], out=run_offsets[1:])
+    x_positions = np.repeat(np.array(run_starts, dtype=np.int64) - 2 * run_offsets, run_lengths)
+    x_positions += 2 * np.arange(pairs, dtype=np.int64)
+    deltas = np.column_stack((commands[x_positions], commands[x_positions + 1]))
+    deltas = (deltas >> 1) ^ -(deltas & 1)
+
+    # the cursor is reset at the beginning of each feature
+    coordinates = np.cumsum(deltas, axis=0)
+    feature_pairs = np.array(feature_pairs, dtype=np.int64)
+    bases = np.zeros((len(feature_pairs) - 1, 2), dtype=np.int64)
+    non_empty = feature_pairs[:-1] > 0
+    bases[non_empty] = coordinates[feature_pairs[:-1][non_empty] - 1]
+    coordinates -= np.repeat(bases, np.diff(feature_pairs), axis=0)
+    if not y_coord_down:
+        coordinates[:, 1] = extent - coordinates[:, 1]
+
+    part_offsets = np.array(part_starts + [pairs], dtype=np.int64)
+    return coordinates.astype(np.int32), part_offsets, np.array(feature_parts, dtype=np.int64)
+
+
+def decode_layer(layer, y_coord_down=False):
+    """Decode the serialized `layer` message into a `FeatureTable`.
+
+    Args:
+        layer:
+            The serialized layer.
+
+        y_coord_down:
+            The y coordinates are flipped (`extent - y`) unless it is `True`.
+
+    Returns:
+        The `FeatureTable` of the layer.
+    """
+    reader = LayerReader(layer)
+    n_features = len(reader)
+    ids = np.zeros(n_features, dtype=np.uint64)
+    types = np.zeros(n_features, dtype=np.uint8)
+    tags = []
+    geometries = []
+    for i, feature in enumerate(reader.features):
+        ids[i] = feature.id
+        types[i] = feature.type
+        tags.append(feature.packed_tags)
+        geometries.append(feature.packed_geometry)
+
+    commands, command_offsets = _unpack_concatenated(geometries)
+    coordinates, part_offsets, geometry_offsets = _decode_geometries(
+        commands, command_offsets, reader.extent, y_coord_down
+    )
+    tag_indices, tag_offsets = _unpack_concatenated(tags)
+
+    return FeatureTable(
+        name=reader.name,
+        extent=reader.extent,
+        version=reader.version,
+        keys=reader.keys,
+        values=reader.values,
+        ids=ids,
+        types=types,
+        coordinates=coordinates,
+        part_offsets=part_offsets,
+        geometry_offsets=geometry_offsets,
+        tag_keys=tag_indices[0::2].astype(np.uint32),
+        tag_values=tag_indices[1::2].astype(np.uint32),
+        tag_offsets=tag_offsets // 2,
+    )
+
+
+def _get_options(name, per_layer_options, default_options, output_name):
+    options = get_decode_options(layer_options=per_layer_options.get(name, None), default_options=default_options)
+    if options["transformer"] is not None:
+        raise ValueError(f"The transformer option is not supported with the {output_name} output.")
+    return options
+
+
+def decode_tile(tile, per_layer_options=None, default_options=None, shapely_geometries=False):
+    """Decode the serialized `tile` into a dictionary mapping each layer name to its `FeatureTable`.
+
+    Only the `y_coord_down` option is supported, the coordinates stay in tile space. When `shapely_geometries` is
+    `True`, the `geometries` attribute of each table is filled with `FeatureTable.to_shapely`.
+    """
+    if per_layer_options is None:
+        per_layer_options = {}
+    tables = {}
+    for name, layer, _ in iter_layers(tile):
+        options = _get_options(name, per_layer_options, default_options, "columnar")
+        table = decode_layer(layer, y_coord_down=options["y_coord_down"])
+        if shapely_geometries:
+            table.geometries = table.to_shapely()
+        tables[name] = table
+    return tables
+
+
+def decode_shapely(tile, per_layer_options=None, default_options=None):
+    """Decode the serialized `tile` into the same layers and features dictionaries as `TileData.get_message`, but with
+    shapely geometries built per layer by `FeatureTable.to_shapely`. Features without geometry get an empty geometry
+    of their type, features of unknown type a `None` geometry.
+
+    The `y_coord_down` and `geojson` options are supported, the coordinates stay in tile space.
+    """
+    if per_layer_options is None:
+        per_layer_options = {}
+    tile_data = {}
+    for name, layer, _ in iter_layers(tile):
+        options = _get_options(name, per_layer_options, default_options, "shapely")
+        table = decode_layer(layer, y_coord_down=options["y_coord_down"])
+        geometries = table.to_shapely()
+        feature_types = ["Feature"] * len(table) if options["geojson"] else table.types.tolist()
+        features = [
+            {"geometry": geometry, "properties": table.properties(i), "id": feature_id, "type": feature_type}
+            for i, (geometry, feature_id, feature_type) in enumerate(zip(geometries, table.ids.tolist(), feature_types))
+        ]
+        layer_data = {"extent": table.extent, "version": table.version, "features": features}
+        if options["geojson"]:
+            layer_data["type"] = "FeatureCollection"
+        tile_data[name] = layer_data
+    return tile_data
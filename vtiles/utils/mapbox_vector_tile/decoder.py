@@ -1,16 +1,22 @@
+import numpy as np
+
 from .Mapbox import vector_tile_pb2 as vector_tile
 from .utils import (
     CMD_BITS,
     CMD_LINE_TO,
+    CMD_MASK,
     CMD_MOVE_TO,
     CMD_SEG_END,
     LINESTRING,
     POINT,
     POLYGON,
     get_decode_options,
-    zig_zag_decode,
 )
 
+# Runs of at least this many coordinate pairs (and rings of at least this many points) are decoded with NumPy, below
+# this the array conversion costs more than it saves.
+NUMPY_MIN_PAIRS = 32
+
 
 class TileData:
     def __init__(self, pbf_data, per_layer_options=None, default_options=None):
@@ -60,10 +66,6 @@ class TileData:
             tile[layer_name] = tile_data
         return tile
 
-    @staticmethod
-    def zero_pad(val):
-        return "0" + val if val[0] == "b" else val
-
     @staticmethod
     def parse_value(val):
         for candidate in (
@@ -81,7 +83,12 @@ class TileData:
 
     @staticmethod
     def _area_sign(ring):
-        a = sum(ring[i][0] * ring[i + 1][1] - ring[i + 1][0] * ring[i][1] for i in range(len(ring) - 1))
+        if len(ring) >= NUMPY_MIN_PAIRS:
+            # int64 for tile coordinates, float64 for the coordinates of a transformer, never truncated
+            xy = np.array(ring)
+            a = np.dot(xy[:-1, 0], xy[1:, 1]) - np.dot(xy[1:, 0], xy[:-1, 1])
+        else:
+            a = sum(p[0] * q[1] - q[0] * p[1] for p, q in zip(ring, ring[1:]))
         return -1 if a < 0 else 1 if a > 0 else 0
 
     @staticmethod
@@ -89,19 +96,42 @@ class TileData:
         if coords and coords[0] != coords[-1]:
             coords.append(coords[0])
 
+    @staticmethod
+    def _parse_run_numpy(params, x, y, coords, extent, y_coord_down, transformer):
+        """Decode a run of zig-zag encoded parameter integers with NumPy, append the points to `coords` and return the
+        final cursor position."""
+        deltas = np.array(params, dtype=np.int64)
+        deltas = (deltas >> 1) ^ -(deltas & 1)
+        xs = np.cumsum(deltas[0::2]) + x
+        ys = np.cumsum(deltas[1::2]) + y
+        x = int(xs[-1])
+        y = int(ys[-1])
+
+        if not y_coord_down:
+            ys = extent - ys
+
+        if transformer is None:
+            coords.extend(np.column_stack((xs, ys)).tolist())
+        else:
+            coords.extend([*transformer(px, py)] for px, py in zip(xs.tolist(), ys.tolist()))
+        return x, y
+
     def parse_geometry(self, geom, ftype, extent, y_coord_down, transformer):  # noqa:C901
         # [9 0 8192 26 0 10 2 0 0 2 15]
+        # The whole repeated field is copied once, then walked in a single pass: command integers are split with bit
+        # arithmetic and the parameter integers are zig-zag decoded inline, or with NumPy for long runs.
+        geom = list(geom)
+        end = len(geom)
         i = 0
         coords = []
-        dx = 0
-        dy = 0
+        x = 0
+        y = 0
         parts = []  # for multi linestrings and polygons
 
-        while i != len(geom):
-            item = bin(geom[i])
-            ilen = len(item)
-            cmd = int(self.zero_pad(item[(ilen - CMD_BITS) : ilen]), 2)
-            cmd_len = int(self.zero_pad(item[: ilen - CMD_BITS]), 2)
+        while i < end:
+            header = geom[i]
+            cmd = header & CMD_MASK
+            cmd_len = header >> CMD_BITS
 
             i = i + 1
 
@@ -123,30 +153,24 @@ class TileData:
                     parts.append(coords)
                     coords = []
 
-                for _ in range(cmd_len):
-                    x = geom[i]
-                    i = i + 1
-
-                    y = geom[i]
-                    i = i + 1
-
-                    # zigzag decode
-                    x = zig_zag_decode(x)
-                    y = zig_zag_decode(y)
-
-                    x = x + dx
-                    y = y + dy
-
-                    dx = x
-                    dy = y
-
-                    if not y_coord_down:
-                        y = extent - y
-
-                    if transformer is None:
-                        coords.append([x, y])
-                    else:
-                        coords.append([*transformer(x, y)])
+                run_end = i + 2 * cmd_len
+                if cmd_len >= NUMPY_MIN_PAIRS:
+                    x, y = self._parse_run_numpy(geom[i:run_end], x, y, coords, extent, y_coord_down, transformer)
+                else:
+                    for j in range(i, run_end, 2):
+                        # zigzag decode
+                        dx = geom[j]
+                        dy = geom[j + 1]
+                        x += (dx >> 1) ^ -(dx & 1)
+                        y += (dy >> 1) ^ -(dy & 1)
+
+                        out_y = y if y_coord_down else extent - y
+
+                        if transformer is None:
+                            coords.append([x, out_y])
+                        else:
+                            coords.append([*transformer(x, out_y)])
+                i = run_end
 
         if ftype == POINT:
             if len(coords) == 1:
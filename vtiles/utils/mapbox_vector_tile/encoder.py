@@ -1,5 +1,8 @@
+from collections import namedtuple
 from numbers import Number
 
+import numpy as np
+import shapely
 from shapely.geometry import shape as shapely_shape
 from shapely.geometry.base import BaseGeometry
 from shapely.geometry.multipolygon import MultiPolygon
@@ -11,7 +14,15 @@ from shapely.wkt import loads as load_wkt
 from .geom_encoder import GeometryEncoder
 from .Mapbox import vector_tile_pb2 as vector_tile
 from .polygon import make_it_valid
-from .utils import get_encode_options
+from .utils import LINESTRING, POINT, POLYGON, get_encode_options
+
+# A geometry given as already encoded MVT commands, `type` being the MVT geometry type (`POINT`, `LINESTRING` or
+# `POLYGON`) and `commands` the sequence of command and parameter integers, copied as is in the tile.
+EncodedGeometry = namedtuple("EncodedGeometry", ["type", "commands"])
+
+# A geometry given in tile space, `type` being the MVT geometry type (`POINT`, `LINESTRING` or `POLYGON`) and
+# `coordinates` the list of points, lines or rings as described in `GeometryEncoder.encode_tile_geometry`.
+TileGeometry = namedtuple("TileGeometry", ["type", "coordinates"])
 
 
 def on_invalid_geometry_raise(shape):
@@ -39,6 +50,10 @@ class VectorTile:
         self.seen_values_idx = {}
         self.seen_values_bool_idx = {}
         self.seen_layer_names = set()
+        self.polygon_idx = 0
+        self.invalid_shape = False
+        # Number of polygonal features checked for winding order and validity, and number of those found invalid
+        self.stats = {"validated": 0, "invalid": 0}
 
     def add_layer(self, name, features, options=None):
         if not name:
@@ -57,12 +72,20 @@ class VectorTile:
         self.seen_keys_idx = {}
         self.seen_values_idx = {}
         self.seen_values_bool_idx = {}
+        self.polygon_idx = 0
+
+        if self.layer_options["transformer"] is None:
+            self.add_features_array(features)
+            return
 
         for feature in features:
             # skip missing or empty geometries
             geometry_spec = feature.get("geometry")
             if geometry_spec is None:
                 continue
+            if isinstance(geometry_spec, (EncodedGeometry, TileGeometry)):
+                self.add_tile_feature(feature, geometry_spec)
+                continue
             shape = self._load_geometry(geometry_spec)
 
             if shape is None:
@@ -73,12 +96,102 @@ class VectorTile:
 
             if self.layer_options["quantize_bounds"]:
                 shape = self.quantize(shape)
-            if self.layer_options["check_winding_order"]:
+            if self.should_validate(shape):
+                self.invalid_shape = False
                 shape = self.enforce_winding_order(shape)
+                self.stats["validated"] += 1
+                if self.invalid_shape:
+                    self.stats["invalid"] += 1
 
             if shape is not None and not shape.is_empty:
                 self.add_feature(feature, shape)
 
+    def add_features_array(self, features):
+        """Add the `features` to the current layer, the geometries of the whole layer being quantized, oriented and
+        checked for validity at once on a shapely array. Only the invalid polygons go through the per feature
+        `enforce_winding_order`, so the result is the same as adding the features one by one."""
+        features = list(features)
+        shapes = np.full(len(features), None, dtype=object)
+        for i, feature in enumerate(features):
+            geometry_spec = feature.get("geometry")
+            if geometry_spec is None or isinstance(geometry_spec, (EncodedGeometry, TileGeometry)):
+                continue
+            shape = self._load_geometry(geometry_spec)
+            if shape is None:
+                raise NotImplementedError("Can't do geometries that are not wkt, wkb, or shapely geometries")
+            shapes[i] = shape
+
+        loaded = np.flatnonzero(shapes != None)  # noqa: E711
+        loaded = loaded[~shapely.is_empty(shapes[loaded])]
+        if self.layer_options["quantize_bounds"]:
+            shapes[loaded] = self.quantize_array(shapes[loaded])
+
+        if self.layer_options["check_winding_order"] and self.layer_options["validate"] != "none":
+            polygons = loaded[np.isin(shapely.get_type_id(shapes[loaded]), (3, 6))]
+            ordinals = np.arange(self.polygon_idx, self.polygon_idx + len(polygons))
+            self.polygon_idx += len(polygons)
+            if self.layer_options["validate"] == "sample":
+                polygons = polygons[ordinals % self.layer_options["validate_sample_rate"] == 0]
+            shapes[polygons] = self.enforce_winding_order_array(shapes[polygons])
+
+        for i, feature in enumerate(features):
+            shape = shapes[i]
+            if shape is not None:
+                if not shape.is_empty:
+                    self.add_feature(feature, shape)
+                continue
+            geometry_spec = feature.get("geometry")
+            if isinstance(geometry_spec, (EncodedGeometry, TileGeometry)):
+                self.add_tile_feature(feature, geometry_spec)
+
+    def quantize_array(self, shapes):
+        """Same as `quantize` on an array of shapes."""
+        minx, miny, maxx, maxy = self.layer_options["quantize_bounds"]
+        extents = self.layer_options["extents"]
+        scale = np.array([extents / (maxx - minx), extents / (maxy - miny)])
+        offset = np.array([minx, miny])
+        return shapely.transform(shapes, lambda coords: np.rint(scale * (coords - offset)))
+
+    def orient_array(self, shapes):
+        """Orient the polygons of the array `shapes` as `orient` does with the sign of the `y_coord_down` option."""
+        exterior_cw = not self.layer_options["y_coord_down"]
+        # orient_polygons is new in shapely 2.1, the per polygon fallback below is the path of the pinned shapely 2.0
+        if hasattr(shapely, "orient_polygons"):
+            return shapely.orient_polygons(shapes, exterior_cw=exterior_cw)
+        sign = -1.0 if exterior_cw else 1.0
+        return np.array(
+            [
+                orient(shape, sign=sign)
+                if shape.geom_type == "Polygon"
+                else MultiPolygon([orient(part, sign=sign) for part in shape.geoms])
+                for shape in shapes
+            ],
+            dtype=object,
+        )
+
+    def enforce_winding_order_array(self, shapes):
+        """Same as `enforce_winding_order` on an array of polygons and multipolygons: they are rounded, oriented and
+        checked for validity at once, the invalid ones being handled one by one by `enforce_winding_order`."""
+        oriented = self.orient_array(shapely.transform(shapes, np.rint))
+        invalid = np.flatnonzero(~shapely.is_valid(oriented))
+        for i in invalid:
+            oriented[i] = self.enforce_winding_order(shapes[i])
+        self.stats["validated"] += len(shapes)
+        self.stats["invalid"] += len(invalid)
+        return oriented
+
+    def should_validate(self, shape):
+        """Tell whether the winding order and the validity of `shape` must be enforced, according to the
+        `check_winding_order`, `validate` and `validate_sample_rate` options. Only polygonal shapes are concerned."""
+        if not self.layer_options["check_winding_order"] or self.layer_options["validate"] == "none":
+            return False
+        if shape.geom_type not in ("Polygon", "MultiPolygon"):
+            return False
+        self.polygon_idx += 1
+        if self.layer_options["validate"] == "sample":
+            return (self.polygon_idx - 1) % self.layer_options["validate_sample_rate"] == 0
+        return True
+
     def enforce_winding_order(self, shape, n_try=1):
         if shape.geom_type == "MultiPolygon":
             # If we are a multipolygon, we need to ensure that the winding orders of the constituent polygons are
@@ -113,6 +226,7 @@ class VectorTile:
     def handle_shape_validity(self, shape, n_try):
         if shape.is_valid:
             return shape
+        self.invalid_shape = True
 
         if n_try >= self.layer_options["max_geometry_validate_tries"]:
             # ensure that we don't recurse indefinitely with an invalid geometry handler that doesn't validate
@@ -191,8 +305,22 @@ class VectorTile:
     def add_feature(self, feature, shape):
         geom_encoder = GeometryEncoder(self.layer_options["y_coord_down"], self.layer_options["extents"])
         geometry = geom_encoder.encode(shape)
-
         feature_type = self._get_feature_type(shape)
+        self._add_encoded_feature(feature, feature_type, geometry)
+
+    def add_tile_feature(self, feature, geometry_spec):
+        """Add a feature whose geometry is an `EncodedGeometry` or a `TileGeometry`. The geometry is already in tile
+        space, so the transformer, the quantization and the winding order and validity checks are not applied."""
+        if geometry_spec.type not in (POINT, LINESTRING, POLYGON):
+            raise ValueError(f"Cannot encode unknown geometry type: {geometry_spec.type}")
+        if isinstance(geometry_spec, EncodedGeometry):
+            geometry = geometry_spec.commands
+        else:
+            geom_encoder = GeometryEncoder(self.layer_options["y_coord_down"], self.layer_options["extents"])
+            geometry = geom_encoder.encode_tile_geometry(geometry_spec.type, geometry_spec.coordinates)
+        self._add_encoded_feature(feature, geometry_spec.type, geometry)
+
+    def _add_encoded_feature(self, feature, feature_type, geometry):
         if len(geometry) == 0:
             # Don't add geometry if it's too small
             return
@@ -1,6 +1,21 @@
 import itertools as it
 
-from .utils import CMD_BITS, CMD_FAKE, CMD_LINE_TO, CMD_MOVE_TO, CMD_SEG_END, zig_zag_encode
+import numpy as np
+
+from .utils import (
+    CMD_BITS,
+    CMD_FAKE,
+    CMD_LINE_TO,
+    CMD_MOVE_TO,
+    CMD_SEG_END,
+    LINESTRING,
+    POINT,
+    POLYGON,
+    zig_zag_encode,
+)
+
+# Minimum number of points of an arc to encode it with numpy rather than point by point
+NUMPY_MIN_POINTS = 32
 
 
 class GeometryEncoder:
@@ -36,8 +51,8 @@ class GeometryEncoder:
         self._geometry = [cmd_move_to]
         last_x = 0
         last_y = 0
-        for point in points:
-            x, y = self.coords_on_grid(point.x, point.y)
+        for point_x, point_y in points:
+            x, y = self.coords_on_grid(point_x, point_y)
             dx, dy = x - last_x, y - last_y
             self._geometry.append(zig_zag_encode(dx))
             self._geometry.append(zig_zag_encode(dy))
@@ -75,24 +90,60 @@ class GeometryEncoder:
         self._last_x, self._last_y = last_x, last_y
         return True
 
+    def encode_arc_array(self, coords):
+        """Same as `encode_arc` for a sequence of at least one point, the rounding, y flip, deltas, removal of the
+        zero-length segments and zig-zag encoding being computed on numpy arrays.
+        """
+        xy = np.asarray(coords)[:, :2]
+        if xy.dtype.kind == "f":
+            xy = np.rint(xy)
+        xy = xy.astype(np.int64)
+        if not self._y_coord_down:
+            xy[:, 1] = self._extents - xy[:, 1]
+        deltas = np.diff(xy, axis=0)
+        deltas = deltas[(deltas != 0).any(axis=1)]
+        pairs_added = len(deltas)
+        if pairs_added == 0:
+            return False
+        x, y = int(xy[0, 0]), int(xy[0, 1])
+        dx, dy = x - self._last_x, y - self._last_y
+        self._geometry.extend(
+            [
+                self.encode_cmd_length(CMD_MOVE_TO, 1),
+                zig_zag_encode(dx),
+                zig_zag_encode(dy),
+                self.encode_cmd_length(CMD_LINE_TO, pairs_added),
+            ]
+        )
+        self._geometry.extend(((deltas << 1) ^ (deltas >> 31)).ravel().tolist())
+        self._last_x, self._last_y = int(xy[-1, 0]), int(xy[-1, 1])
+        return True
+
+    def encode_line(self, coords):
+        if len(coords) >= NUMPY_MIN_POINTS:
+            return self.encode_arc_array(coords)
+        return self.encode_arc(iter(coords))
+
     def encode_multilinestring(self, shape):
         for arc in shape.geoms:
-            coords = iter(arc.coords)
-            self.encode_arc(coords)
+            self.encode_line(arc.coords)
 
-    def encode_ring(self, ring):
-        coords = self.omit_last(iter(ring.coords))
-        if not self.encode_arc(coords):
+    def encode_ring(self, coords, closed=True):
+        if len(coords) >= NUMPY_MIN_POINTS:
+            added = self.encode_arc_array(np.asarray(coords)[:-1] if closed else coords)
+        else:
+            added = self.encode_arc(self.omit_last(iter(coords)) if closed else iter(coords))
+        if not added:
             return False
         cmd_seg_end = self.encode_cmd_length(CMD_SEG_END, 1)
         self._geometry.append(cmd_seg_end)
         return True
 
     def encode_polygon(self, shape):
-        if not self.encode_ring(shape.exterior):
+        if not self.encode_ring(shape.exterior.coords):
             return
         for arc in shape.interiors:
-            self.encode_ring(arc)
+            self.encode_ring(arc.coords)
 
     def encode_multipolygon(self, shape):
         for polygon in shape.geoms:
@@ -107,10 +158,9 @@ class GeometryEncoder:
             cmd_encoded = self.encode_cmd_length(CMD_MOVE_TO, 1)
             self._geometry = [cmd_encoded, zig_zag_encode(x), zig_zag_encode(y)]
         elif shape.geom_type == "MultiPoint":
-            self.encode_multipoint(shape.geoms)
+            self.encode_multipoint([(point.x, point.y) for point in shape.geoms])
         elif shape.geom_type == "LineString":
-            coords = iter(shape.coords)
-            self.encode_arc(coords)
+            self.encode_line(shape.coords)
         elif shape.geom_type == "MultiLineString":
             self.encode_multilinestring(shape)
         elif shape.geom_type == "Polygon":
@@ -120,3 +170,33 @@ class GeometryEncoder:
         else:
             raise NotImplementedError(f"Can't do {shape.geom_type} geometries")
         return self._geometry
+
+    def encode_tile_geometry(self, geom_type, geometry):
+        """Encode a geometry already in tile space, without going through shapely.
+
+        Args:
+            geom_type:
+                The MVT geometry type: `POINT`, `LINESTRING` or `POLYGON`.
+
+            geometry:
+                The list of points for `POINT`, the list of lines for `LINESTRING` and the list of rings for `POLYGON`,
+                each line or ring being a list of points. Rings are encoded in the given order and orientation, they
+                may be closed or not.
+
+        Returns:
+            The encoded geometry commands.
+        """
+        if geom_type == POINT:
+            if geometry:
+                self.encode_multipoint(geometry)
+        elif geom_type == LINESTRING:
+            for line in geometry:
+                if line:
+                    self.encode_line(line)
+        elif geom_type == POLYGON:
+            for ring in geometry:
+                if ring:
+                    self.encode_ring(ring, closed=tuple(ring[0]) == tuple(ring[-1]))
+        else:
+            raise NotImplementedError(f"Can't do geometries of type {geom_type}")
+        return self._geometry
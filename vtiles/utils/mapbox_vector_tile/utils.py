@@ -3,6 +3,7 @@
 #
 # Command size
 CMD_BITS = 3
+CMD_MASK = (1 << CMD_BITS) - 1
 
 # Commands
 CMD_MOVE_TO = 1
@@ -44,8 +45,13 @@ DEFAULT_ENCODE_OPTIONS = {
     "on_invalid_geometry": None,
     "check_winding_order": True,
     "max_geometry_validate_tries": 5,
+    "validate": "full",
+    "validate_sample_rate": 100,
+    "trusted": False,
 }
 
+VALIDATE_MODES = ("full", "sample", "none")
+
 DEFAULT_DECODE_OPTIONS = {"y_coord_down": False, "transformer": None, "geojson": True}
 
 
@@ -113,10 +119,19 @@ def get_encode_options(layer_options, default_options):
     # Checks on final values
     extents = result["extents"]
     max_geometry_validate_tries = result["max_geometry_validate_tries"]
+    validate = result["validate"]
+    validate_sample_rate = result["validate_sample_rate"]
     if extents <= 0:
         raise ValueError(f"The extents must be positive. {extents} provided.")
     if max_geometry_validate_tries <= 0:
         raise ValueError(f"The max_geometry_validate_tries must be positive. {max_geometry_validate_tries} provided.")
+    if validate not in VALIDATE_MODES:
+        validate_modes_msg = ", ".join(f"{x!r}" for x in VALIDATE_MODES)
+        raise ValueError(f"The validate option must be one of {validate_modes_msg}. {validate!r} provided.")
+    if validate_sample_rate <= 0:
+        raise ValueError(f"The validate_sample_rate must be positive. {validate_sample_rate} provided.")
+    if result["trusted"]:
+        result["validate"] = "none"
 
     return result
 
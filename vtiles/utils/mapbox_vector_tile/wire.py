@@ -0,0 +1,668 @@
+#
+# Helpers walking the protobuf wire format of a vector tile directly, without building message objects.
+#
+import struct
+
+import numpy as np
+
+# Wire types
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+# Field numbers of the `tile` message
+TILE_LAYERS = 3
+
+# Field numbers of the `tile.layer` message
+LAYER_NAME = 1
+LAYER_FEATURES = 2
+LAYER_KEYS = 3
+LAYER_VALUES = 4
+LAYER_EXTENT = 5
+LAYER_VERSION = 15
+
+# Field numbers of the `tile.feature` message
+FEATURE_ID = 1
+FEATURE_TAGS = 2
+FEATURE_TYPE = 3
+FEATURE_GEOMETRY = 4
+
+# Python type names of the values decoded from each field of the `tile.value` message
+VALUE_TYPE_NAMES = {1: "str", 2: "float", 3: "float", 4: "int", 5: "int", 6: "int", 7: "bool"}
+
+# Names of the `tile.GeomType` enum values
+GEOM_TYPE_NAMES = {0: "Unknown", 1: "Point", 2: "LineString", 3: "Polygon"}
+
+# Packed fields of at least this many bytes are unpacked with NumPy
+NUMPY_MIN_BYTES = 64
+
+
+def read_varint(buf, pos):
+    """Read the varint starting at `pos` in `buf` and return its value and the position right after it."""
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def write_varint(out, value):
+    """Append the varint encoding of the unsigned integer `value` to the bytearray `out`."""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def iter_fields(buf):
+    """Iterate over the top-level fields of the protobuf message `buf`.
+
+    Args:
+        buf:
+            The serialized message, as `bytes` or `memoryview`.
+
+    Returns:
+        A generator of `(field_number, wire_type, value, start, end)` tuples, where `value` is an integer for
+        varint and fixed size fields and a `memoryview` slice for length-delimited fields, and `start:end` is the
+        span of the whole field (key included) in `buf`.
+    """
+    view = memoryview(buf)
+    pos = 0
+    end = len(view)
+    while pos < end:
+        start = pos
+        key, pos = read_varint(view, pos)
+        field_number = key >> 3
+        wire_type = key & 0x7
+        if wire_type == WIRE_VARINT:
+            value, pos = read_varint(view, pos)
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, pos = read_varint(view, pos)
+            value = view[pos : pos + length]
+            pos += length
+        elif wire_type == WIRE_FIXED64:
+            value = int.from_bytes(view[pos : pos + 8], "little")
+            pos += 8
+        elif wire_type == WIRE_FIXED32:
+            value = int.from_bytes(view[pos : pos + 4], "little")
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type} for field {field_number}")
+        yield field_number, wire_type, value, start, pos
+
+
+def layer_name(layer):
+    """Return the name of the serialized `layer` message, reading only its name field."""
+    for field_number, wire_type, value, _, _ in iter_fields(layer):
+        if field_number == LAYER_NAME and wire_type == WIRE_LENGTH_DELIMITED:
+            return bytes(value).decode("utf-8")
+    return None
+
+
+def unpack_varints(buf):
+    """Return the list of integers of the packed repeated varint field content `buf`."""
+    if len(buf) >= NUMPY_MIN_BYTES:
+        return unpack_varints_numpy(buf).tolist()
+    values = []
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        value, pos = read_varint(buf, pos)
+        values.append(value)
+    return values
+
+
+def unpack_varints_numpy(buf):
+    """Return the integers of the packed repeated varint field content `buf` as a `uint64` NumPy array.
+
+    Every byte without continuation bit ends a varint, the 7-bit groups are shifted according to their rank in their
+    varint and summed per varint.
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    ranks = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    groups = (data & 0x7F).astype(np.uint64) << (ranks * 7).astype(np.uint64)
+    return np.add.reduceat(groups, starts)
+
+
+def parse_value(value):
+    """Return the Python value held by the serialized `tile.value` message `value`."""
+    for field_number, _, field_value, _, _ in iter_fields(value):
+        if field_number == 1:
+            return bytes(field_value).decode("utf-8")
+        elif field_number == 2:
+            return struct.unpack("<f", field_value.to_bytes(4, "little"))[0]
+        elif field_number == 3:
+            return struct.unpack("<d", field_value.to_bytes(8, "little"))[0]
+        elif field_number == 4:
+            return field_value - (1 << 64) if field_value >= 1 << 63 else field_value
+        elif field_number == 5:
+            return field_value
+        elif field_number == 6:
+            return (field_value >> 1) ^ -(field_value & 1)
+        elif field_number == 7:
+            return bool(field_value)
+    raise ValueError(f"{bytes(value)!r} is an unknown value")
+
+
+def value_type_name(value):
+    """Return the Python type name `decode` gives to the serialized `tile.value` message `value`."""
+    for field_number, _, _, _, _ in iter_fields(value):
+        if field_number in VALUE_TYPE_NAMES:
+            return VALUE_TYPE_NAMES[field_number]
+    raise ValueError(f"{bytes(value)!r} is an unknown value")
+
+
+def iter_layers(tile):
+    """Iterate over the layers of the serialized `tile`.
+
+    Returns:
+        A generator of `(name, layer, field)` tuples where `layer` is the serialized layer message and `field` the
+        whole tile field holding it (key and length included), both as `memoryview` slices of `tile`.
+    """
+    view = memoryview(tile)
+    for field_number, wire_type, value, start, end in iter_fields(view):
+        if field_number == TILE_LAYERS and wire_type == WIRE_LENGTH_DELIMITED:
+            yield layer_name(value), value, view[start:end]
+
+
+def select_layer(name, layers=None, exclude_layers=None):
+    """Tell whether the layer `name` is kept by the `layers` / `exclude_layers` selection."""
+    if layers is not None and name not in layers:
+        return False
+    if exclude_layers is not None and name in exclude_layers:
+        return False
+    return True
+
+
+def filter_layers(tile, layers=None, exclude_layers=None):
+    """Return a serialized tile holding only the selected layers of `tile`.
+
+    The layers are copied byte for byte, nothing else than the layer names is parsed.
+
+    Args:
+        tile:
+            The serialized tile.
+
+        layers:
+            An optional collection of layer names to keep. All layers are kept when it is `None`.
+
+        exclude_layers:
+            An optional collection of layer names to drop.
+
+    Returns:
+        The filtered serialized tile.
+    """
+    return b"".join(
+        field for name, _, field in iter_layers(tile) if select_layer(name, layers=layers, exclude_layers=exclude_layers)
+    )
+
+
+def summarize_layer(layer):
+    """Summarize the serialized `layer` message without decoding any geometry.
+
+    The layer is scanned once: the geometries are skipped by their length, the feature tags are only read until a
+    value type is known for every key and the value types are only read for the values those tags refer to.
+
+    Returns:
+        A dictionary holding the layer `name`, `version`, `extent`, `keys`, the number of `features`, the number of
+        features per geometry type in `geometry_types` and, in `fields`, the type name of the first value found for
+        each key.
+    """
+    # indexing bytes is cheaper than indexing a memoryview
+    buf = bytes(layer)
+    name = None
+    version = 1
+    extent = 4096
+    keys = []
+    values = []
+    features = []
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key = buf[pos]
+        if key & 0x80:
+            key, pos = read_varint(buf, pos)
+        else:
+            pos += 1
+        wire_type = key & 0x7
+        if wire_type == WIRE_LENGTH_DELIMITED:
+            length = buf[pos]
+            if length & 0x80:
+                length, pos = read_varint(buf, pos)
+            else:
+                pos += 1
+            start = pos
+            pos += length
+            field_number = key >> 3
+            if field_number == LAYER_FEATURES:
+                features.append((start, pos))
+            elif field_number == LAYER_KEYS:
+                keys.append(buf[start:pos].decode("utf-8"))
+            elif field_number == LAYER_VALUES:
+                values.append((start, pos))
+            elif field_number == LAYER_NAME:
+                name = buf[start:pos].decode("utf-8")
+        elif wire_type == WIRE_VARINT:
+            value, pos = read_varint(buf, pos)
+            if key >> 3 == LAYER_EXTENT:
+                extent = value
+            elif key >> 3 == LAYER_VERSION:
+                version = value
+        elif wire_type == WIRE_FIXED64:
+            pos += 8
+        elif wire_type == WIRE_FIXED32:
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type} for field {key >> 3}")
+
+    def value_type(val_idx):
+        start, stop = values[val_idx]
+        # the value is usually a single field with a one byte key
+        type_name = VALUE_TYPE_NAMES.get(buf[start] >> 3) if start < stop else None
+        return type_name or value_type_name(buf[start:stop])
+
+    def add_fields(tags):
+        for key_idx, val_idx in zip(tags[::2], tags[1::2]):
+            key = keys[key_idx]
+            if key not in fields:
+                fields[key] = value_type(val_idx)
+
+    type_counts = {}
+    fields = {}
+    for pos, stop in features:
+        geom_type = 0
+        loose_tags = []
+        while pos < stop:
+            key = buf[pos]
+            if key & 0x80:
+                key, pos = read_varint(buf, pos)
+            else:
+                pos += 1
+            wire_type = key & 0x7
+            if wire_type == WIRE_LENGTH_DELIMITED:
+                length = buf[pos]
+                if length & 0x80:
+                    length, pos = read_varint(buf, pos)
+                else:
+                    pos += 1
+                if key >> 3 == FEATURE_TAGS and len(fields) < len(keys):
+                    # tags are only read until a value type is known for every key
+                    add_fields(unpack_varints(buf[pos : pos + length]))
+                pos += length
+            elif wire_type == WIRE_VARINT:
+                value = buf[pos]
+                if value & 0x80:
+                    value, pos = read_varint(buf, pos)
+                else:
+                    pos += 1
+                if key >> 3 == FEATURE_TYPE:
+                    geom_type = value
+                elif key >> 3 == FEATURE_TAGS:
+                    loose_tags.append(value)
+            elif wire_type == WIRE_FIXED64:
+                pos += 8
+            elif wire_type == WIRE_FIXED32:
+                pos += 4
+            else:
+                raise ValueError(f"Unsupported wire type {wire_type} for field {key >> 3}")
+        if loose_tags and len(fields) < len(keys):
+            add_fields(loose_tags)
+        type_counts[geom_type] = type_counts.get(geom_type, 0) + 1
+
+    geometry_types = {}
+    for geom_type, count in type_counts.items():
+        type_name = GEOM_TYPE_NAMES.get(geom_type, "Unknown")
+        geometry_types[type_name] = geometry_types.get(type_name, 0) + count
+
+    return {
+        "name": name,
+        "version": version,
+        "extent": extent,
+        "features": len(features),
+        "geometry_types": geometry_types,
+        "keys": keys,
+        "fields": fields,
+    }
+
+
+def summarize(tile):
+    """Summarize the layers of the serialized `tile` without decoding any geometry.
+
+    Returns:
+        A dictionary mapping each layer name to its summary as described in `summarize_layer`.
+    """
+    summary = {}
+    for _, layer, _ in iter_layers(tile):
+        layer_summary = summarize_layer(layer)
+        summary[layer_summary.pop("name")] = layer_summary
+    return summary
+
+
+def partition_layers(tile, layers):
+    """Split the serialized `tile` in two serialized tiles, the first holding the layers whose name is in `layers` and
+    the second the other ones. The layers are copied byte for byte in a single scan."""
+    selected = []
+    others = []
+    for name, _, field in iter_layers(tile):
+        (selected if name in layers else others).append(field)
+    return b"".join(selected), b"".join(others)
+
+
+def _read_layer(layer):
+    """Split the serialized `layer` message into its name, extent, version, keys, values and features, the last three
+    as lists of `memoryview` slices."""
+    name = None
+    extent = 4096
+    version = 1
+    keys = []
+    values = []
+    features = []
+    for field_number, _, value, _, _ in iter_fields(layer):
+        if field_number == LAYER_FEATURES:
+            features.append(value)
+        elif field_number == LAYER_KEYS:
+            keys.append(value)
+        elif field_number == LAYER_VALUES:
+            values.append(value)
+        elif field_number == LAYER_NAME:
+            name = value
+        elif field_number == LAYER_EXTENT:
+            extent = value
+        elif field_number == LAYER_VERSION:
+            version = value
+    return name, extent, version, keys, values, features
+
+
+def _merge_table(table, other):
+    """Append the entries of `other` missing from `table` and return the index of each entry of `other` in `table`."""
+    index = {bytes(entry): i for i, entry in enumerate(table)}
+    remap = []
+    for entry in other:
+        entry = bytes(entry)
+        if entry not in index:
+            index[entry] = len(table)
+            table.append(entry)
+        remap.append(index[entry])
+    return remap
+
+
+def _rescale_geometry(geometry, scale):
+    """Return the geometry command and parameter integers `geometry` with the coordinates multiplied by `scale`.
+
+    The absolute coordinates are scaled and rounded, then encoded again as deltas, so the rounding errors do not add
+    up along the lines."""
+    rescaled = []
+    x = y = 0
+    scaled_x = scaled_y = 0
+    pos = 0
+    while pos < len(geometry):
+        command = geometry[pos]
+        rescaled.append(command)
+        pos += 1
+        if command & 0x7 not in (1, 2):
+            # ClosePath has no parameters
+            continue
+        for _ in range(command >> 3):
+            dx, dy = geometry[pos], geometry[pos + 1]
+            x += (dx >> 1) ^ -(dx & 1)
+            y += (dy >> 1) ^ -(dy & 1)
+            new_x, new_y = round(x * scale), round(y * scale)
+            rescaled.append(((new_x - scaled_x) << 1) ^ ((new_x - scaled_x) >> 63))
+            rescaled.append(((new_y - scaled_y) << 1) ^ ((new_y - scaled_y) >> 63))
+            scaled_x, scaled_y = new_x, new_y
+            pos += 2
+    return rescaled
+
+
+def _rewrite_feature(feature, key_remap=None, value_remap=None, scale=None):
+    """Return the serialized `feature` with its tags pointing to the remapped keys and values and its geometry
+    rescaled by `scale`, when given. Tags are read from packed and non-packed fields alike and written packed, in
+    place of the first of them. The other fields are copied byte for byte."""
+    writer = MessageWriter()
+    tags = None
+    tags_offset = None
+    for field_number, wire_type, value, start, end in iter_fields(feature):
+        if field_number == FEATURE_TAGS and key_remap is not None:
+            if tags is None:
+                tags = []
+                tags_offset = len(writer.buf)
+            tags.extend(unpack_varints(value) if wire_type == WIRE_LENGTH_DELIMITED else [value])
+        elif field_number == FEATURE_GEOMETRY and wire_type == WIRE_LENGTH_DELIMITED and scale is not None:
+            writer.write_packed(FEATURE_GEOMETRY, _rescale_geometry(unpack_varints(value), scale))
+        else:
+            writer.write_raw(feature[start:end])
+    if tags is None:
+        return writer.getvalue()
+    tags[::2] = [key_remap[idx] for idx in tags[::2]]
+    tags[1::2] = [value_remap[idx] for idx in tags[1::2]]
+    packed = MessageWriter()
+    packed.write_packed(FEATURE_TAGS, tags)
+    return bytes(writer.buf[:tags_offset] + packed.buf + writer.buf[tags_offset:])
+
+
+def merge_layers(layer, other):
+    """Merge the features of the serialized `other` layer into the serialized `layer`.
+
+    The key and value tables are merged and the tags of the features of `other` are remapped accordingly. When the
+    two layers have different extents, the merged layer has the larger one and the geometries of the other layer are
+    rescaled to it, otherwise geometries are copied byte for byte.
+
+    Returns:
+        The serialized merged layer.
+    """
+    name, extent, version, keys, values, features = _read_layer(layer)
+    _, other_extent, _, other_keys, other_values, other_features = _read_layer(other)
+    merged_extent = max(extent, other_extent)
+    scale = merged_extent / extent if extent != merged_extent else None
+    other_scale = merged_extent / other_extent if other_extent != merged_extent else None
+
+    keys = [bytes(key) for key in keys]
+    values = [bytes(value) for value in values]
+    key_remap = _merge_table(keys, other_keys)
+    value_remap = _merge_table(values, other_values)
+    identity = key_remap == list(range(len(key_remap))) and value_remap == list(range(len(value_remap)))
+
+    writer = MessageWriter()
+    # A nameless layer stays nameless
+    if name is not None:
+        writer.write_bytes(LAYER_NAME, name)
+    for feature in features:
+        if scale is not None:
+            feature = _rewrite_feature(feature, scale=scale)
+        writer.write_bytes(LAYER_FEATURES, feature)
+    remap = (None, None) if identity else (key_remap, value_remap)
+    for feature in other_features:
+        if not identity or other_scale is not None:
+            feature = _rewrite_feature(feature, *remap, scale=other_scale)
+        writer.write_bytes(LAYER_FEATURES, feature)
+    for key in keys:
+        writer.write_bytes(LAYER_KEYS, key)
+    for value in values:
+        writer.write_bytes(LAYER_VALUES, value)
+    writer.write_varint(LAYER_EXTENT, merged_extent)
+    writer.write_varint(LAYER_VERSION, version)
+    return writer.getvalue()
+
+
+def merge_tiles(tile, other):
+    """Merge the serialized `other` tile into the serialized `tile`.
+
+    Layers of `other` whose name is not in `tile` are appended byte for byte, layers with the same name are merged
+    with `merge_layers`.
+
+    Returns:
+        The serialized merged tile.
+    """
+    fields = {}
+    layers = {}
+    for name, layer, field in iter_layers(tile):
+        fields[name] = bytes(field)
+        layers[name] = layer
+    for name, layer, field in iter_layers(other):
+        if name in fields:
+            merged = merge_layers(layers[name], layer)
+            writer = MessageWriter()
+            writer.write_bytes(TILE_LAYERS, merged)
+            fields[name] = writer.getvalue()
+            layers[name] = memoryview(merged)
+        else:
+            fields[name] = bytes(field)
+            layers[name] = layer
+    return b"".join(fields.values())
+
+
+class FeatureReader:
+    """Lazy view over a serialized `tile.feature` message.
+
+    Only the field boundaries are read when the reader is built, the tags and the geometry are unpacked when
+    accessed.
+
+    Attributes:
+        id: The feature id, 0 when missing.
+        type: The MVT geometry type.
+        layer: The `LayerReader` of the layer holding the feature, used to resolve the properties.
+        packed_tags: The packed tags field content as a `memoryview`, empty when missing.
+        packed_geometry: The packed geometry field content as a `memoryview`, empty when missing.
+    """
+
+    __slots__ = ("id", "type", "layer", "packed_tags", "packed_geometry")
+
+    def __init__(self, buf, layer=None):
+        self.id = 0
+        self.type = 0
+        self.layer = layer
+        self.packed_tags = memoryview(b"")
+        self.packed_geometry = memoryview(b"")
+        for field_number, wire_type, value, _, _ in iter_fields(buf):
+            if field_number == FEATURE_GEOMETRY and wire_type == WIRE_LENGTH_DELIMITED:
+                self.packed_geometry = value
+            elif field_number == FEATURE_TAGS and wire_type == WIRE_LENGTH_DELIMITED:
+                self.packed_tags = value
+            elif field_number == FEATURE_TYPE:
+                self.type = value
+            elif field_number == FEATURE_ID:
+                self.id = value
+
+    @property
+    def tags(self):
+        """The list of key and value indices, alternated."""
+        return unpack_varints(self.packed_tags)
+
+    @property
+    def geometry(self):
+        """The list of geometry command and parameter integers."""
+        return unpack_varints(self.packed_geometry)
+
+    @property
+    def properties(self):
+        """The dictionary of the feature properties."""
+        keys = self.layer.keys
+        values = self.layer.values
+        tags = self.tags
+        return {keys[key_idx]: values[val_idx] for key_idx, val_idx in zip(tags[::2], tags[1::2])}
+
+
+class LayerReader:
+    """Lazy view over a serialized `tile.layer` message.
+
+    The fields are scanned once when the reader is built, keys and values are decoded on first access and the
+    features are only read when iterated.
+
+    Attributes:
+        name: The layer name.
+        version: The layer version.
+        extent: The layer extent.
+    """
+
+    __slots__ = ("name", "version", "extent", "_keys", "_values", "_features")
+
+    def __init__(self, buf):
+        self.name = None
+        self.version = 1
+        self.extent = 4096
+        self._keys = []
+        self._values = []
+        self._features = []
+        for field_number, _, value, _, _ in iter_fields(buf):
+            if field_number == LAYER_FEATURES:
+                self._features.append(value)
+            elif field_number == LAYER_KEYS:
+                self._keys.append(value)
+            elif field_number == LAYER_VALUES:
+                self._values.append(value)
+            elif field_number == LAYER_NAME:
+                self.name = bytes(value).decode("utf-8")
+            elif field_number == LAYER_EXTENT:
+                self.extent = value
+            elif field_number == LAYER_VERSION:
+                self.version = value
+
+    def __len__(self):
+        return len(self._features)
+
+    @property
+    def keys(self):
+        """The list of the layer keys."""
+        if self._keys and isinstance(self._keys[0], memoryview):
+            self._keys = [bytes(key).decode("utf-8") for key in self._keys]
+        return self._keys
+
+    @property
+    def values(self):
+        """The list of the layer values, as Python values."""
+        if self._values and isinstance(self._values[0], memoryview):
+            self._values = [parse_value(value) for value in self._values]
+        return self._values
+
+    @property
+    def features(self):
+        """A generator of `FeatureReader` over the layer features."""
+        return (FeatureReader(feature, self) for feature in self._features)
+
+
+class MessageWriter:
+    """Streaming writer of a protobuf message, appending the fields to a bytearray in the order they are written."""
+
+    __slots__ = ("buf",)
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def write_varint(self, field_number, value):
+        """Write the varint field `field_number`, negative values are written as 64-bit two's complement."""
+        write_varint(self.buf, (field_number << 3) | WIRE_VARINT)
+        write_varint(self.buf, value if value >= 0 else value + (1 << 64))
+
+    def write_bytes(self, field_number, data):
+        """Write the length-delimited field `field_number` holding `data`, `str` being UTF-8 encoded."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        write_varint(self.buf, (field_number << 3) | WIRE_LENGTH_DELIMITED)
+        write_varint(self.buf, len(data))
+        self.buf += data
+
+    def write_packed(self, field_number, values):
+        """Write the packed repeated varint field `field_number` holding the unsigned integers `values`."""
+        packed = bytearray()
+        for value in values:
+            write_varint(packed, value)
+        self.write_bytes(field_number, packed)
+
+    def write_raw(self, data):
+        """Append already serialized fields."""
+        self.buf += data
+
+    def getvalue(self):
+        """Return the serialized message."""
+        return bytes(self.buf)
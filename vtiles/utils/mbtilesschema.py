@@ -0,0 +1,113 @@
+"""MBTiles tile schemas.
+
+The flat schema stores every tile in full in a `tiles` table. The deduplicated schema stores each distinct tile once
+in an `images(tile_id, tile_data)` table, `map(zoom_level, tile_column, tile_row, tile_id)` pointing each tile to its
+image, and a `tiles` view joining them, so that readers query `tiles` the same way. The `tile_id` is a digest of the
+tile content, so the byte-identical tiles (ocean, empty land, solid raster fills) share one image.
+"""
+import hashlib
+
+SCHEMAS = ('flat', 'dedup')
+
+TILES_VIEW = """
+    CREATE VIEW tiles AS
+    SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column, map.tile_row AS tile_row,
+           images.tile_data AS tile_data
+    FROM map JOIN images ON images.tile_id = map.tile_id
+"""
+
+
+def check_schema(schema):
+    """Return `schema`, raise ValueError if it is not 'flat' or 'dedup'."""
+    if schema not in SCHEMAS:
+        raise ValueError(f"Unknown MBTiles schema {schema!r}, expected one of {', '.join(SCHEMAS)}.")
+    return schema
+
+
+def create_tiles_schema(cursor, schema='flat', index=True):
+    """Create the tables of `schema` with `cursor`. Without `index`, the unique indexes are left to
+    `create_tiles_index`, as building them once the tiles are inserted is faster."""
+    if check_schema(schema) == 'flat':
+        cursor.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+    else:
+        cursor.execute("CREATE TABLE map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT)")
+        # The images are looked up by tile_id on every insert, so they are indexed from the start
+        cursor.execute("CREATE TABLE images (tile_id TEXT PRIMARY KEY, tile_data BLOB)")
+        cursor.execute(TILES_VIEW)
+    if index:
+        create_tiles_index(cursor, schema)
+
+
+def create_tiles_index(cursor, schema='flat'):
+    """Create the unique (zoom_level, tile_column, tile_row) index of `schema`."""
+    if check_schema(schema) == 'flat':
+        cursor.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+    else:
+        cursor.execute("CREATE UNIQUE INDEX map_index ON map (zoom_level, tile_column, tile_row)")
+
+
+def delete_duplicate_keys(cursor, schema='flat'):
+    """Delete the rows of `schema` sharing a (zoom_level, tile_column, tile_row) key with a row inserted after them,
+    so that the unique index can be built, as INSERT OR REPLACE would have kept the last one. With the deduplicated
+    schema, the images left without a tile are deleted too. Return the number of deleted tiles."""
+    table = 'tiles' if check_schema(schema) == 'flat' else 'map'
+    cursor.execute(f"DELETE FROM {table} WHERE rowid NOT IN "
+                   f"(SELECT MAX(rowid) FROM {table} GROUP BY zoom_level, tile_column, tile_row)")
+    deleted = cursor.rowcount
+    if schema == 'dedup' and deleted:
+        cursor.execute("DELETE FROM images WHERE tile_id NOT IN (SELECT tile_id FROM map)")
+    return deleted
+
+
+def drop_tiles_schema(cursor):
+    """Drop the `tiles` table or view, and the `map` and `images` tables of a deduplicated MBTiles."""
+    row = cursor.execute("SELECT type FROM sqlite_master WHERE name = 'tiles'").fetchone()
+    if row:
+        cursor.execute(f"DROP {'VIEW' if row[0] == 'view' else 'TABLE'} tiles")
+    cursor.execute("DROP TABLE IF EXISTS map")
+    cursor.execute("DROP TABLE IF EXISTS images")
+
+
+def is_deduplicated(cursor):
+    """Tell whether the MBTiles of `cursor` has the deduplicated schema: `map` and `images` tables."""
+    names = {name for name, in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('map', 'images')")}
+    return names == {'map', 'images'}
+
+
+def tiles_table(cursor):
+    """Return the table to query for the tile coordinates, without tile_data: 'map' for a deduplicated MBTiles, which
+    spares the join of the `tiles` view with the images, 'tiles' otherwise."""
+    return 'map' if is_deduplicated(cursor) else 'tiles'
+
+
+def tile_id(tile_data):
+    """Return the content digest identifying `tile_data` in the images table."""
+    return hashlib.blake2b(tile_data, digest_size=16).hexdigest()
+
+
+def insert_tiles(cursor, tiles, schema='flat'):
+    """Insert or replace `tiles`, a list of (zoom_level, tile_column, tile_row, tile_data) tuples, with `cursor`.
+    With the deduplicated schema, each distinct tile_data is stored once in images."""
+    if check_schema(schema) == 'flat':
+        cursor.executemany(
+            "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)", tiles)
+        return
+    images = {}
+    rows = []
+    for zoom_level, tile_column, tile_row, tile_data in tiles:
+        digest = tile_id(tile_data)
+        images[digest] = tile_data
+        rows.append((zoom_level, tile_column, tile_row, digest))
+    cursor.executemany("INSERT OR IGNORE INTO images (tile_id, tile_data) VALUES (?, ?)", images.items())
+    cursor.executemany("INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+                       rows)
+
+
+def count_images(cursor):
+    """Return (tiles, distinct images) of a deduplicated MBTiles, (tiles, tiles) of a flat one."""
+    if not is_deduplicated(cursor):
+        count = cursor.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+        return count, count
+    return (cursor.execute("SELECT COUNT(*) FROM map").fetchone()[0],
+            cursor.execute("SELECT COUNT(*) FROM images").fetchone()[0])
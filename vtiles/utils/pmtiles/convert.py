@@ -5,6 +5,7 @@ import os
 import sqlite3
 from pmtiles.writer import write
 from pmtiles.reader import Reader, MmapSource, all_tiles
+from ..compression import DICTIONARY_METADATA, decode_dictionary, decompress, detect_compression
 from .tile import zxy_to_tileid, tileid_to_zxy, TileType, Compression
 
 
@@ -69,6 +70,8 @@ def mbtiles_to_pmtiles(input, output, maxzoom):
         for row in cursor.execute("SELECT name,value FROM metadata"):
             mbtiles_metadata[row[0]] = row[1]
         is_pbf = mbtiles_metadata["format"] == "pbf"
+        codec = mbtiles_metadata.get("compression")
+        dictionary = decode_dictionary(mbtiles_metadata.get(DICTIONARY_METADATA))
 
         # query the db in ascending tile order
         for tileid in tileid_set:
@@ -79,9 +82,10 @@ def mbtiles_to_pmtiles(input, output, maxzoom):
                 (z, x, flipped),
             )
             data = res.fetchone()[0]
-            # force gzip compression only for vector
-            if is_pbf and data[0:2] != b"\x1f\x8b":
-                data = gzip.compress(data)
+            # force gzip compression only for vector, the header declaring gzip tiles: zlib, zstd and brotli
+            # tiles are decompressed first
+            if is_pbf and detect_compression(data) != "gzip":
+                data = gzip.compress(decompress(data, codec, dictionary))
             writer.write_tile(tileid, data)
 
         pmtiles_header, pmtiles_metadata = mbtiles_to_header_json(mbtiles_metadata)
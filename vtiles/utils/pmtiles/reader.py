@@ -6,9 +6,9 @@ from .tile import (
     zxy_to_tileid,
     tileid_to_zxy,
     find_tile,
-    Compression,
+    codec_from_compression,
 )
-import gzip
+from ..compression import DICTIONARY_METADATA, decode_dictionary, decompress, uses_dictionary
 
 
 def MmapSource(f):
@@ -37,8 +37,7 @@ class Reader:
     def metadata(self):
         header = self.header()
         metadata = self.get_bytes(header["metadata_offset"], header["metadata_length"])
-        if header["internal_compression"] == Compression.GZIP:
-            metadata = gzip.decompress(metadata)
+        metadata = decompress(metadata, codec_from_compression(header["internal_compression"]))
         return json.loads(metadata)
 
     def get(self, z, x, y):
@@ -47,7 +46,9 @@ class Reader:
         dir_offset = header["root_offset"]
         dir_length = header["root_length"]
         for depth in range(0, 4):  # max depth
-            directory = deserialize_directory(self.get_bytes(dir_offset, dir_length))
+            directory = deserialize_directory(
+                self.get_bytes(dir_offset, dir_length), header["internal_compression"]
+            )
             result = find_tile(directory, tile_id)
             if result:
                 if result.run_length == 0:
@@ -58,9 +59,22 @@ class Reader:
                         header["tile_data_offset"] + result.offset, result.length
                     )
 
+    def get_decompressed(self, z, x, y):
+        """Same as get, the tile being decompressed according to the tile_compression of the header, with the zstd
+        dictionary of the metadata if any."""
+        data = self.get(z, x, y)
+        if data:
+            dictionary = None
+            if uses_dictionary(data):
+                dictionary = decode_dictionary(self.metadata().get(DICTIONARY_METADATA))
+            data = decompress(data, codec_from_compression(self.header()["tile_compression"]), dictionary)
+        return data
+
 
 def traverse(get_bytes, header, dir_offset, dir_length):
-    entries = deserialize_directory(get_bytes(dir_offset, dir_length))
+    entries = deserialize_directory(
+        get_bytes(dir_offset, dir_length), header["internal_compression"]
+    )
     for entry in entries:
         if entry.run_length > 0:
             for i in range(entry.run_length):
@@ -1,6 +1,6 @@
 from enum import Enum
 import io
-import gzip
+from ..compression import compress, decompress, normalize_codec
 
 
 class Entry:
@@ -145,8 +145,25 @@ class TileType(Enum):
     AVIF = 5
 
 
-def deserialize_directory(buf):
-    b_io = io.BytesIO(gzip.decompress(buf))
+def compression_from_codec(codec):
+    """Return the Compression of a vtiles.utils.compression codec name, zlib having no PMTiles equivalent."""
+    codec = normalize_codec(codec)
+    if codec is None:
+        return Compression.NONE
+    if codec == "zlib":
+        raise ValueError("PMTiles doesn't support zlib compressed tiles, use gzip instead.")
+    return Compression[codec.upper()]
+
+
+def codec_from_compression(compression):
+    """Return the vtiles.utils.compression codec name of a Compression, None for NONE and UNKNOWN."""
+    if compression in (Compression.NONE, Compression.UNKNOWN):
+        return None
+    return compression.name.lower()
+
+
+def deserialize_directory(buf, compression=Compression.GZIP):
+    b_io = io.BytesIO(decompress(buf, codec_from_compression(compression)))
     entries = []
     num_entries = read_varint(b_io)
 
@@ -172,7 +189,7 @@ def deserialize_directory(buf):
     return entries
 
 
-def serialize_directory(entries):
+def serialize_directory(entries, compression=Compression.GZIP):
     b_io = io.BytesIO()
     write_varint(b_io, len(entries))
 
@@ -193,7 +210,7 @@ def serialize_directory(entries):
         else:
             write_varint(b_io, e.offset + 1)
 
-    return gzip.compress(b_io.getvalue())
+    return compress(b_io.getvalue(), codec_from_compression(compression))
 
 class SpecVersionUnsupported(Exception):
     pass
@@ -1,27 +1,18 @@
 import argparse, sys, os
 import json
 from .pmtiles.reader import Reader, MmapSource, all_tiles
-from .pmtiles.tile import TileType
-import sqlite3
+from .pmtiles.tile import TileType, codec_from_compression
 from tqdm import tqdm
 import logging
+from vtiles.mbtiles.store import MBTilesWriter
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def pmtiles_to_mbtiles(input, output):
-    conn = sqlite3.connect(output)
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE metadata (name text, value text);")
-    cursor.execute("""create unique index name on metadata (name);""")
-    cursor.execute(
-        "CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob);"
-    )
-    cursor.execute(
-        "CREATE UNIQUE INDEX tile_index on tiles (zoom_level, tile_column, tile_row);"
-    )
-
-    with open(input, "r+b") as f:
+def pmtiles_to_mbtiles(input, output, schema="flat"):
+    # "dedup" stores the tiles shared by several PMTiles entries once, in map and images tables.
+    # The output is deleted if the conversion fails
+    with MBTilesWriter(output, schema) as writer, open(input, "rb") as f:
         source = MmapSource(f)
 
         reader = Reader(source)
@@ -48,6 +39,12 @@ def pmtiles_to_mbtiles(input, output):
         if "format" not in metadata and header["tile_type"] == TileType.MVT:
             metadata["format"] = "pbf"
 
+        # MBTiles readers need the compression to decompress brotli tiles
+        tile_codec = codec_from_compression(header["tile_compression"])
+        if tile_codec and "compression" not in metadata:
+            metadata["compression"] = tile_codec
+
+        mbtiles_metadata = {}
         json_metadata = {}
         for k, v in metadata.items():
             if k in ["vector_layers", "tilestats"]:
@@ -55,29 +52,27 @@ def pmtiles_to_mbtiles(input, output):
                 continue
             elif not isinstance(v, str):
                 v = json.dumps(v, ensure_ascii=False)
-            cursor.execute("INSERT INTO metadata VALUES(?,?)", (k, v))
+            mbtiles_metadata[k] = v
 
         if json_metadata:
-            cursor.execute(
-                "INSERT INTO metadata VALUES(?,?)",
-                ("json", json.dumps(json_metadata, ensure_ascii=False)),
-            )
+            mbtiles_metadata["json"] = json.dumps(json_metadata, ensure_ascii=False)
+        writer.update_metadata(mbtiles_metadata)
 
         tile_count = sum(1 for _ in all_tiles(source))
         for zxy, tile_data in tqdm(all_tiles(source), total=tile_count, desc="Converting tiles"):
             flipped_y = (1 << zxy[0]) - 1 - zxy[2]
-            cursor.execute(
-                "INSERT INTO tiles VALUES(?,?,?,?)",
-                (zxy[0], zxy[1], flipped_y, tile_data),
-            )
+            writer.write_tile(zxy[0], zxy[1], flipped_y, tile_data)
 
-    conn.commit()
-    conn.close()
+        if schema == "dedup":
+            tiles, images = writer.count_images()
+            logger.info(f"{tiles} tiles stored as {images} distinct images.")
 
 def main():
     parser = argparse.ArgumentParser(description='Convert PMTiles to MBTiles.')
     parser.add_argument('input', help='Path to the input PMTiles file.')
     parser.add_argument('-o', '--output', help='Path to the output MBTiles file.')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Store identical tiles once, in map and images tables with a tiles view.')
     
     args = parser.parse_args()
     if not os.path.exists(args.input):
@@ -103,7 +98,7 @@ def main():
             sys.exit(1)          
 
     logging.info(f'Converting {input_file_abspath} to {output_file_abspath}.')
-    pmtiles_to_mbtiles(input_file_abspath, output_file_abspath)
+    pmtiles_to_mbtiles(input_file_abspath, output_file_abspath, 'dedup' if args.dedup else 'flat')
     logging.info(f'Converting PMTiles to MBTiles done!')
 
 if __name__ == "__main__":
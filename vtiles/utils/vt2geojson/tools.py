@@ -21,13 +21,14 @@ def vt_bytes_to_geojson(b_content: bytes, x: int, y: int, z: int, layer=None) ->
     :param x: tile x coordinate.
     :param y: tile y coordinate.
     :param z: tile z coordinate.
-    :param layer: include only the specified layer.
+    :param layer: include only the specified layer, or the specified list of layers.
     :return: a features collection (GeoJSON).
     """
-    data = decode(b_content, y_coord_down=True)
+    layers = [layer] if isinstance(layer, str) else layer
+    data = decode(b_content, default_options={"y_coord_down": True}, layers=layers)
 
     features_collections = [Layer(x=x, y=y, z=z, name=layer_name, obj=layer_obj).toGeoJSON()
-                            for layer_name, layer_obj in data.items() if layer is None or layer_name == layer]
+                            for layer_name, layer_obj in data.items()]
 
     geojson = {fc["name"]: {"type": fc["type"], "features": fc["features"]} for fc in features_collections}
 